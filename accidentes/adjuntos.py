@@ -0,0 +1,246 @@
+# accidentes/adjuntos.py
+"""
+Adjuntos de un reporte (fotos, videos, documentos) subidos por fragmentos.
+
+El reporte flash se envía sin archivos; cada adjunto se sube después, en
+fragmentos de a lo sumo TAMANO_MAXIMO_FRAGMENTO, sobre una conexión que
+puede cortarse en cualquier momento:
+1. `crear` registra el adjunto con su nombre, tamaño y (opcional) SHA-256.
+   Si el mismo usuario ya había empezado a subir ese archivo al reporte, se
+   devuelve ese registro: el cliente retoma desde `recibido`.
+2. `escribir_fragmento` agrega un fragmento en `recibido` (el offset debe
+   coincidir) al archivo parcial en ADJUNTOS_PARCIALES_DIR. El cuerpo se
+   copia por bloques mientras se calcula su SHA-256, que se compara con el
+   del encabezado Upload-Checksum si viene; nunca se tiene el archivo ni el
+   fragmento completo en memoria. Recién con el fragmento escrito en disco
+   se avanza `recibido`: un corte a medio fragmento se reintenta desde el
+   mismo offset.
+3. Con el último fragmento se calcula el SHA-256 del archivo completo (por
+   bloques) y se compara con el declarado. Si no coincide, la subida vuelve
+   a cero; si coincide, el archivo pasa al storage de media y las fotos
+   quedan pendientes de procesar (accidentes/evidencias.py).
+
+Las subidas abandonadas se borran con el comando limpiar_adjuntos_incompletos.
+"""
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from . import evidencias
+from .models import AdjuntoAccidente
+
+TAMANO_FRAGMENTO = 1024 * 1024
+TAMANO_MAXIMO_FRAGMENTO = 8 * 1024 * 1024
+TAMANO_MAXIMO = 500 * 1024 * 1024
+BLOQUE = 64 * 1024
+
+# Extensión -> tipo de adjunto. Las fotos son las que Pillow puede procesar.
+EXTENSIONES = {
+    **dict.fromkeys(['jpg', 'jpeg', 'png', 'webp'], 'foto'),
+    **dict.fromkeys(['mp4', 'mov', 'm4v', '3gp', 'webm'], 'video'),
+    **dict.fromkeys(['pdf', 'doc', 'docx', 'xls', 'xlsx', 'odt', 'ods', 'txt'], 'documento'),
+}
+
+
+class ErrorAdjunto(Exception):
+    """Petición de subida inválida; `estado_http` es el código a responder."""
+
+    def __init__(self, mensaje, estado_http=400):
+        super().__init__(mensaje)
+        self.estado_http = estado_http
+
+
+class FragmentoDesfasado(ErrorAdjunto):
+    """El offset no es el esperado: el cliente debe seguir desde `recibido`."""
+
+    def __init__(self, recibido):
+        super().__init__(f"Se esperaba el offset {recibido}.", 409)
+        self.recibido = recibido
+
+
+def ruta_parcial(adjunto_id):
+    return os.path.join(settings.ADJUNTOS_PARCIALES_DIR, f"{adjunto_id}.part")
+
+
+def _sha256_archivo(ruta):
+    sha = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(BLOQUE), b''):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def _borrar_parcial(adjunto_id):
+    try:
+        os.remove(ruta_parcial(adjunto_id))
+    except FileNotFoundError:
+        pass
+
+
+# --- 1. ALTA ---
+
+def tipo_de(nombre):
+    """Tipo de adjunto según la extensión, o None si no se acepta."""
+    return EXTENSIONES.get(os.path.splitext(nombre)[1].lstrip('.').lower())
+
+
+def crear(reporte, nombre, tamano, usuario, content_type='', sha256=''):
+    """Adjunto nuevo, o el que el usuario ya estaba subiendo con el mismo nombre y tamaño."""
+    nombre = os.path.basename((nombre or '').replace('\\', '/')).strip()[:255]
+    tipo = tipo_de(nombre)
+    if not nombre or tipo is None:
+        raise ErrorAdjunto("Tipo de archivo no permitido.")
+    if not isinstance(tamano, int) or isinstance(tamano, bool) or tamano <= 0:
+        raise ErrorAdjunto("Tamaño inválido.")
+    if tamano > TAMANO_MAXIMO:
+        raise ErrorAdjunto(f"El archivo supera el máximo de {TAMANO_MAXIMO // (1024 * 1024)} MB.", 413)
+    sha256 = (sha256 or '').strip().lower()
+    if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+        raise ErrorAdjunto("SHA-256 inválido.")
+
+    en_curso = AdjuntoAccidente.objects.filter(
+        reporte=reporte, nombre_original=nombre, tamano=tamano, subido_por=usuario, estado='subiendo',
+    )
+    if sha256:
+        en_curso = en_curso.filter(sha256__in=[sha256, ''])
+    adjunto = en_curso.order_by('-recibido', '-pk').first()
+    if adjunto is not None:
+        return adjunto, False
+    adjunto = AdjuntoAccidente.objects.create(
+        reporte=reporte, tipo=tipo, nombre_original=nombre, content_type=(content_type or '')[:100],
+        tamano=tamano, sha256=sha256, subido_por=usuario,
+    )
+    return adjunto, True
+
+
+# --- 2. FRAGMENTOS ---
+
+def _copiar(stream, destino, longitud):
+    """Copia `longitud` bytes de stream a destino por bloques. Devuelve (copiados, sha256 hex)."""
+    sha = hashlib.sha256()
+    copiados = 0
+    while copiados < longitud:
+        bloque = stream.read(min(BLOQUE, longitud - copiados))
+        if not bloque:
+            break
+        destino.write(bloque)
+        sha.update(bloque)
+        copiados += len(bloque)
+    return copiados, sha.hexdigest()
+
+
+def escribir_fragmento(adjunto_id, offset, stream, longitud, checksum=''):
+    """
+    Escribe `longitud` bytes de `stream` a partir de `offset`. Devuelve el
+    adjunto actualizado. Un fragmento ya confirmado (reintento tras perder
+    la respuesta) no se vuelve a escribir.
+    """
+    with transaction.atomic():
+        # El bloqueo serializa los reintentos concurrentes del mismo fragmento
+        adjunto = AdjuntoAccidente.objects.select_for_update().get(pk=adjunto_id)
+        ya_recibido = offset < adjunto.recibido and offset + longitud <= adjunto.recibido
+        if adjunto.estado != 'completo' and not ya_recibido:
+            _agregar(adjunto, offset, stream, longitud, checksum)
+
+    # También si el último fragmento ya estaba pero la verificación no terminó
+    if adjunto.estado != 'completo' and adjunto.recibido == adjunto.tamano:
+        adjunto = completar(adjunto.pk)
+    return adjunto
+
+
+def _agregar(adjunto, offset, stream, longitud, checksum):
+    if offset != adjunto.recibido:
+        raise FragmentoDesfasado(adjunto.recibido)
+    if longitud <= 0:
+        raise ErrorAdjunto("Fragmento vacío.")
+    if longitud > TAMANO_MAXIMO_FRAGMENTO:
+        raise ErrorAdjunto(f"El fragmento supera {TAMANO_MAXIMO_FRAGMENTO} bytes.", 413)
+    if offset + longitud > adjunto.tamano:
+        raise ErrorAdjunto("El fragmento excede el tamaño declarado.")
+
+    ruta = ruta_parcial(adjunto.pk)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta, 'r+b' if os.path.exists(ruta) else 'w+b') as parcial:
+        # Restos de un fragmento cortado a medio escribir
+        parcial.truncate(offset)
+        parcial.seek(offset)
+        copiados, sha = _copiar(stream, parcial, longitud)
+        if copiados != longitud or (checksum and sha != checksum):
+            parcial.truncate(offset)
+            if copiados != longitud:
+                raise ErrorAdjunto("Fragmento incompleto.")
+            # 460 (Checksum Mismatch, como en tus.io): el cliente reenvía el fragmento
+            raise ErrorAdjunto("El checksum del fragmento no coincide.", 460)
+        parcial.flush()
+        os.fsync(parcial.fileno())
+
+    adjunto.recibido = offset + longitud
+    adjunto.save(update_fields=['recibido', 'actualizado'])
+
+
+def completar(adjunto_id):
+    """
+    Verifica el archivo ensamblado y lo pasa al storage. Si el SHA-256 no
+    coincide con el declarado, la subida vuelve a empezar (ErrorAdjunto 422).
+    """
+    with transaction.atomic():
+        adjunto = AdjuntoAccidente.objects.select_for_update().get(pk=adjunto_id)
+        if adjunto.estado == 'completo' or adjunto.recibido != adjunto.tamano:
+            return adjunto
+        ruta = ruta_parcial(adjunto.pk)
+        sha = _sha256_archivo(ruta)
+        if adjunto.sha256 and sha != adjunto.sha256:
+            adjunto.recibido = 0
+            adjunto.save(update_fields=['recibido', 'actualizado'])
+            _borrar_parcial(adjunto.pk)
+            valido = False
+        else:
+            nombre = get_valid_filename(adjunto.nombre_original)
+            with open(ruta, 'rb') as parcial:
+                adjunto.archivo.save(nombre, File(parcial), save=False)
+            adjunto.sha256 = sha
+            adjunto.estado = 'completo'
+            if adjunto.tipo == 'foto':
+                adjunto.variantes_estado = 'pendiente'
+            adjunto.save()
+            # El parcial se borra solo si el adjunto quedó registrado
+            transaction.on_commit(lambda: _borrar_parcial(adjunto_id))
+            if adjunto.tipo == 'foto':
+                evidencias.encolar(adjunto.pk, AdjuntoAccidente)
+            valido = True
+    if not valido:
+        raise ErrorAdjunto("El archivo recibido no coincide con su SHA-256; se debe subir de nuevo.", 422)
+    return adjunto
+
+
+# --- 3. LIMPIEZA ---
+
+def borrar_archivos(adjunto):
+    """Archivo, variantes y parcial de un adjunto eliminado (tras el commit)."""
+    archivo, variantes, pk = adjunto.archivo, adjunto.variantes, adjunto.pk
+
+    def borrar():
+        if archivo:
+            archivo.storage.delete(archivo.name)
+        evidencias.borrar_variantes(archivo.storage, variantes)
+        _borrar_parcial(pk)
+
+    transaction.on_commit(borrar)
+
+
+def limpiar_incompletos(horas=48):
+    """Elimina las subidas sin avance en las últimas `horas`. Devuelve cuántas."""
+    limite = timezone.now() - timedelta(hours=horas)
+    abandonados = AdjuntoAccidente.objects.filter(estado='subiendo', actualizado__lt=limite)
+    cantidad = 0
+    for adjunto in abandonados.iterator():
+        # Uno por uno, para que el signal borre cada parcial
+        adjunto.delete()
+        cantidad += 1
+    return cantidad
@@ -1,5 +1,15 @@
 from django.contrib import admin
-from .models import ReporteAccidente, InvestigacionAccidente
+from .models import AdjuntoAccidente, ReporteAccidente, InvestigacionAccidente, DotacionMensual
+
+class AdjuntoAccidenteInline(admin.TabularInline):
+    # Se suben por la API de fragmentos (accidentes/adjuntos.py); aquí solo se consultan o eliminan
+    model = AdjuntoAccidente
+    extra = 0
+    fields = ('nombre_original', 'tipo', 'tamano', 'recibido', 'estado', 'archivo', 'sha256', 'subido_por')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 @admin.register(ReporteAccidente)
 class ReporteAccidenteAdmin(admin.ModelAdmin):
@@ -15,6 +25,7 @@ class ReporteAccidenteAdmin(admin.ModelAdmin):
     list_filter = ('estado', 'severidad_inicial', 'tipo_accidente', 'empresa')
     search_fields = ('descripcion_evento', 'empresa__razon_social', 'nombre_completo_accidentado')
     readonly_fields = ('fecha_reporte', 'reportado_por')
+    inlines = [AdjuntoAccidenteInline]
     
     fieldsets = (
         ('Información General', {
@@ -24,7 +35,7 @@ class ReporteAccidenteAdmin(admin.ModelAdmin):
             'fields': ('nombre_completo_accidentado', 'rut_accidentado', 'cargo_accidentado')
         }),
         ('Detalle del Evento', {
-            'fields': ('descripcion_evento', 'tipo_accidente', 'severidad_inicial', 'tipo_lesion', 'parte_cuerpo_afectada')
+            'fields': ('descripcion_evento', 'tipo_accidente', 'severidad_inicial', 'tipo_lesion', 'parte_cuerpo_afectada', 'dias_perdidos')
         }),
         ('Evidencia', {
             'fields': ('evidencia_fotografica', 'medidas_inmediatas')
@@ -42,4 +53,11 @@ class InvestigacionAccidenteAdmin(admin.ModelAdmin):
         'fecha_cierre'
     )
     list_filter = ('completada', 'fecha_plazo')
-    search_fields = ('reporte__empresa__razon_social', 'responsable_implementacion')
\ No newline at end of file
+    search_fields = ('reporte__empresa__razon_social', 'responsable_implementacion')
+
+@admin.register(DotacionMensual)
+class DotacionMensualAdmin(admin.ModelAdmin):
+    # Base de las tasas de accidentabilidad (accidentes/estadisticas.py)
+    list_display = ('empresa', 'mes', 'trabajadores', 'horas_hombre')
+    list_filter = ('empresa',)
+    date_hierarchy = 'mes'
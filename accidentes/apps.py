@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class AccidentesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accidentes'
+
+    def ready(self):
+        from django.core import checks
+
+        from . import modelo_cuerpo, signals
+        signals.conectar()
+        checks.register(modelo_cuerpo.verificar_scripts, checks.Tags.staticfiles)
@@ -0,0 +1,203 @@
+# accidentes/estadisticas.py
+"""
+Estadísticas de accidentabilidad por empresa y mes.
+
+Los reportes se leen con una sola consulta (values_list) y se agrupan con
+pandas por empresa, mes, tipo de accidente, severidad y turno, con los casos
+de cada grupo por hora del evento. Los grupos se guardan en
+EstadisticaMensual (a lo sumo 150 filas por empresa y mes), una tabla de la
+que salen las series, los acumulados del año y las distribuciones sin volver
+a recorrer los reportes. Los signals recalculan solo el mes afectado por
+cada alta, edición o baja; `recalcular` reconstruye todo (comando
+recalcular_estadisticas_accidentes).
+
+Tasas e índices (accidentes del trabajo con tiempo perdido, sin trayecto,
+como en el DS 67), con la dotación de DotacionMensual:
+- tasa de accidentabilidad = accidentes / trabajadores x 100
+- tasa de siniestralidad = días perdidos / trabajadores x 100
+- índice de frecuencia = accidentes x 1.000.000 / horas-hombre
+- índice de gravedad = días perdidos x 1.000.000 / horas-hombre
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.utils import timezone
+
+from .models import DotacionMensual, EstadisticaMensual, ReporteAccidente
+
+# Tipos que entran en las tasas; el resto solo suma a los casos
+TIPOS_TASAS = ['accidente_trabajo']
+DIMENSIONES = ['empresa_id', 'mes', 'tipo_accidente', 'severidad_inicial', 'turno']
+DISTRIBUCIONES = ['tipo_accidente', 'severidad_inicial', 'turno']
+HORAS = range(24)
+COLUMNAS_REPORTE = ['empresa_id', 'fecha_accidente', 'tipo_accidente', 'severidad_inicial',
+                    'turno_accidentado', 'dias_perdidos']
+
+
+def mes_de(fecha):
+    """Primer día del mes (hora local) de un datetime."""
+    return timezone.localtime(fecha).date().replace(day=1)
+
+
+def _rango_mes(mes):
+    inicio = timezone.make_aware(datetime(mes.year, mes.month, 1))
+    siguiente = datetime(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+    return inicio, timezone.make_aware(siguiente)
+
+
+# --- 1. AGREGACIÓN ---
+
+def agregar(reportes):
+    """EstadisticaMensual (sin guardar) de un queryset de ReporteAccidente."""
+    datos = pd.DataFrame(list(reportes.order_by().values_list(*COLUMNAS_REPORTE)), columns=COLUMNAS_REPORTE)
+    if datos.empty:
+        return []
+
+    # Mes y hora en la zona horaria del sitio, no en UTC
+    fechas = pd.to_datetime(datos['fecha_accidente'], utc=True)\
+        .dt.tz_convert(timezone.get_default_timezone_name()).dt.tz_localize(None)
+    datos['mes'] = fechas.dt.to_period('M').dt.start_time.dt.date
+    datos['hora'] = fechas.dt.hour
+    datos['turno'] = datos['turno_accidentado'].fillna('')
+    datos['con_tiempo_perdido'] = (datos['dias_perdidos'] > 0).astype(int)
+
+    grupos = datos.groupby(DIMENSIONES).agg(
+        casos=('dias_perdidos', 'size'),
+        con_tiempo_perdido=('con_tiempo_perdido', 'sum'),
+        dias_perdidos=('dias_perdidos', 'sum'),
+    )
+    # Una columna por hora, alineada con los grupos
+    horas = pd.crosstab([datos[campo] for campo in DIMENSIONES], datos['hora'])\
+        .reindex(index=grupos.index, columns=HORAS, fill_value=0)
+    return [
+        EstadisticaMensual(
+            **dict(zip(DIMENSIONES, claves)),
+            casos=int(fila.casos), con_tiempo_perdido=int(fila.con_tiempo_perdido),
+            dias_perdidos=int(fila.dias_perdidos), casos_por_hora=por_hora,
+        )
+        for claves, fila, por_hora in zip(grupos.index, grupos.itertuples(index=False), horas.values.tolist())
+    ]
+
+
+def _reemplazar(estadisticas, reportes):
+    """Borra las filas de `estadisticas` y las vuelve a crear desde `reportes`."""
+    nuevas = agregar(reportes)
+    with transaction.atomic():
+        estadisticas.delete()
+        EstadisticaMensual.objects.bulk_create(nuevas, batch_size=500)
+    return len(nuevas)
+
+
+def recalcular(empresas=None):
+    """Reconstruye las estadísticas de las empresas (queryset) o de todas. Devuelve las filas creadas."""
+    reportes = ReporteAccidente.objects.all()
+    estadisticas = EstadisticaMensual.objects.all()
+    if empresas is not None:
+        reportes = reportes.filter(empresa__in=empresas)
+        estadisticas = estadisticas.filter(empresa__in=empresas)
+    return _reemplazar(estadisticas, reportes)
+
+
+def recalcular_mes(empresa_id, mes):
+    inicio, fin = _rango_mes(mes)
+    return _reemplazar(
+        EstadisticaMensual.objects.filter(empresa_id=empresa_id, mes=mes),
+        ReporteAccidente.objects.filter(empresa_id=empresa_id, fecha_accidente__gte=inicio, fecha_accidente__lt=fin),
+    )
+
+
+def programar(meses):
+    """Recalcula cada (empresa_id, mes) al confirmarse la transacción del cambio."""
+    meses = {par for par in meses if par[0] is not None}
+
+    def recalcular_pendientes():
+        for empresa_id, mes in meses:
+            recalcular_mes(empresa_id, mes)
+
+    transaction.on_commit(recalcular_pendientes)
+
+
+# --- 2. TASAS E ÍNDICES ---
+
+def _por_cien(valor, base):
+    return round(valor * 100 / base, 2) if base else None
+
+
+def _por_millon(valor, base):
+    return round(valor * 1_000_000 / base, 2) if base else None
+
+
+def _indices(accidentes, dias, trabajadores, horas_hombre):
+    return {
+        'tasa_accidentabilidad': _por_cien(accidentes, trabajadores),
+        'tasa_siniestralidad': _por_cien(dias, trabajadores),
+        'indice_frecuencia': _por_millon(accidentes, horas_hombre),
+        'indice_gravedad': _por_millon(dias, horas_hombre),
+    }
+
+
+def resumen_anual(empresa_id, anio):
+    """
+    Serie mensual, acumulado del año y distribuciones de una empresa, desde
+    EstadisticaMensual y DotacionMensual (dos consultas). Las tasas de los
+    meses sin dotación quedan en None. Los totales del acumulado suman todo
+    el año; sus tasas, en cambio, solo cuentan los accidentes y días de los
+    meses con dotación, con la dotación promedio y las horas-hombre de esos
+    meses.
+    """
+    campos = [*DISTRIBUCIONES, 'mes', 'casos', 'con_tiempo_perdido', 'dias_perdidos', 'casos_por_hora']
+    datos = pd.DataFrame(
+        list(EstadisticaMensual.objects.filter(empresa_id=empresa_id, mes__year=anio).values_list(*campos)),
+        columns=campos,
+    )
+    dotaciones = {
+        d.mes.month: d for d in DotacionMensual.objects.filter(empresa_id=empresa_id, mes__year=anio)
+    }
+
+    en_tasas = datos[datos['tipo_accidente'].isin(TIPOS_TASAS)]
+    casos = datos.groupby(datos['mes'].map(lambda m: m.month))['casos'].sum().to_dict()
+    tasas = en_tasas.groupby(en_tasas['mes'].map(lambda m: m.month))[['con_tiempo_perdido', 'dias_perdidos']]\
+        .sum().to_dict()
+
+    meses = []
+    for numero in range(1, 13):
+        dotacion = dotaciones.get(numero)
+        accidentes = int(tasas.get('con_tiempo_perdido', {}).get(numero, 0))
+        dias = int(tasas.get('dias_perdidos', {}).get(numero, 0))
+        meses.append({
+            'mes': f"{anio}-{numero:02d}",
+            'casos': int(casos.get(numero, 0)),
+            'accidentes_con_tiempo_perdido': accidentes,
+            'dias_perdidos': dias,
+            'trabajadores': dotacion.trabajadores if dotacion else None,
+            'horas_hombre': dotacion.horas_hombre if dotacion else None,
+            **_indices(accidentes, dias, dotacion and dotacion.trabajadores, dotacion and dotacion.horas_hombre),
+        })
+
+    con_dotacion = [mes for mes in meses if mes['trabajadores'] is not None]
+    promedio = sum(mes['trabajadores'] for mes in con_dotacion) / len(con_dotacion) if con_dotacion else None
+    horas_hombre = sum(mes['horas_hombre'] for mes in con_dotacion)
+    acumulado = {
+        'casos': sum(mes['casos'] for mes in meses),
+        'accidentes_con_tiempo_perdido': sum(mes['accidentes_con_tiempo_perdido'] for mes in meses),
+        'dias_perdidos': sum(mes['dias_perdidos'] for mes in meses),
+        'trabajadores_promedio': round(promedio, 2) if promedio is not None else None,
+        'horas_hombre': horas_hombre,
+        'meses_con_dotacion': len(con_dotacion),
+        # Un accidente de un mes sin dotación no tiene con qué dividirse
+        **_indices(
+            sum(mes['accidentes_con_tiempo_perdido'] for mes in con_dotacion),
+            sum(mes['dias_perdidos'] for mes in con_dotacion),
+            promedio, horas_hombre,
+        ),
+    }
+
+    distribucion = {
+        dimension: {str(clave): int(cantidad) for clave, cantidad in datos.groupby(dimension)['casos'].sum().items()}
+        for dimension in DISTRIBUCIONES
+    }
+    por_hora = np.array(datos['casos_por_hora'].tolist(), dtype=np.int64).reshape(-1, len(HORAS)).sum(axis=0)
+    distribucion['hora'] = {str(hora): int(cantidad) for hora, cantidad in zip(HORAS, por_hora)}
+    return {'anio': anio, 'meses': meses, 'acumulado': acumulado, 'distribucion': distribucion}
@@ -0,0 +1,194 @@
+# accidentes/evidencias.py
+"""
+Procesamiento de las fotos de evidencia fuera de la petición.
+
+Al subir una foto el reporte queda con evidencia_estado='pendiente' y la
+petición responde de inmediato. Un hilo de fondo del mismo proceso (o el
+comando procesar_evidencias, si EVIDENCIAS_EN_SEGUNDO_PLANO está apagado o
+el proceso se reinició antes de terminar) toma la foto y:
+- la endereza según la orientación EXIF;
+- reemplaza el original por una copia sin metadatos (EXIF, GPS), a la misma
+  resolución, que queda disponible a pedido;
+- genera una miniatura y una versión para pantalla, cada una en WebP y JPEG.
+
+El resultado se guarda con un UPDATE condicionado al nombre del archivo: si
+mientras tanto se subió otra foto, lo generado se descarta.
+
+Las fotos adjuntas (AdjuntoAccidente, accidentes/adjuntos.py) pasan por lo
+mismo, salvo que su original se conserva tal cual se subió: es el archivo
+cuyo SHA-256 se verificó al completar la subida.
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .models import AdjuntoAccidente, ReporteAccidente
+
+logger = logging.getLogger(__name__)
+
+# Lado mayor (px) de cada variante; nunca se amplía una foto más chica
+VARIANTES = {'miniatura': 320, 'media': 1280}
+CALIDAD = {'WEBP': 80, 'JPEG': 82}
+CALIDAD_ORIGINAL = 92
+FORMATOS_ORIGINAL = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+# Clave en evidencia_variantes -> formato de Pillow
+FORMATOS_VARIANTE = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+EXTENSION = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+# Modelo -> (campo de la imagen, campo de estado, campo de variantes,
+# carpeta de las variantes, si el original se reemplaza por una copia limpia)
+CAMPOS = {
+    ReporteAccidente: ('evidencia_fotografica', 'evidencia_estado', 'evidencia_variantes',
+                       'accidentes_evidencia/variantes/{pk}', True),
+    AdjuntoAccidente: ('archivo', 'variantes_estado', 'variantes', 'accidentes_adjuntos/variantes/{pk}', False),
+}
+
+# Un solo hilo: las fotos grandes no compiten entre sí por CPU y memoria.
+# El hilo recién se crea con la primera tarea.
+_ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='evidencias')
+
+
+# --- 1. IMÁGENES ---
+
+def _rgb(imagen):
+    """Aplana la transparencia sobre blanco (JPEG no la admite)."""
+    if imagen.mode in ('RGBA', 'LA') or (imagen.mode == 'P' and 'transparency' in imagen.info):
+        imagen = imagen.convert('RGBA')
+        fondo = Image.new('RGB', imagen.size, 'white')
+        fondo.paste(imagen, mask=imagen.getchannel('A'))
+        return fondo
+    return imagen.convert('RGB')
+
+
+def _guardar(storage, nombre, imagen, formato, **opciones):
+    # Sin exif= ni pnginfo=: Pillow no copia los metadatos al guardar
+    contenido = io.BytesIO()
+    imagen.save(contenido, formato, **opciones)
+    return storage.save(nombre, ContentFile(contenido.getvalue()))
+
+
+def _guardar_variante(storage, base, imagen, formato):
+    opciones = {'quality': CALIDAD[formato]}
+    if formato == 'JPEG':
+        opciones.update(optimize=True, progressive=True)
+    return _guardar(storage, f"{base}.{EXTENSION[formato]}", imagen, formato, **opciones)
+
+
+def generar(archivo, carpeta_variantes, limpiar_original=True):
+    """
+    Original limpio y variantes de un FieldFile de imagen. Devuelve
+    (nombre del original limpio, {variante: {'webp', 'jpeg', 'ancho', 'alto'}}).
+    Con limpiar_original=False no se escribe otro original y se devuelve el
+    nombre del actual. Si algo falla, borra lo que alcanzó a guardar y
+    relanza la excepción.
+    """
+    storage = archivo.storage
+    with archivo.open('rb') as contenido:
+        imagen = Image.open(contenido)
+        formato = imagen.format
+        imagen.load()
+    imagen = ImageOps.exif_transpose(imagen)
+
+    creados = []
+    try:
+        base = os.path.splitext(archivo.name)[0]
+        if limpiar_original:
+            if formato not in FORMATOS_ORIGINAL:
+                formato = 'JPEG'
+            original = imagen if formato != 'JPEG' else _rgb(imagen)
+            opciones = {'quality': CALIDAD_ORIGINAL} if formato != 'PNG' else {'optimize': True}
+            creados.append(_guardar(storage, f"{base}.{FORMATOS_ORIGINAL[formato]}", original, formato, **opciones))
+
+        rgb = _rgb(imagen)
+        nombre_base = os.path.basename(base)
+        variantes = {}
+        for variante, lado in VARIANTES.items():
+            reducida = rgb.copy()
+            reducida.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+            variantes[variante] = {'ancho': reducida.width, 'alto': reducida.height}
+            for clave, formato_variante in FORMATOS_VARIANTE.items():
+                nombre = _guardar_variante(storage, f"{carpeta_variantes}/{nombre_base}-{variante}", reducida, formato_variante)
+                creados.append(nombre)
+                variantes[variante][clave] = nombre
+    except Exception:
+        for nombre in creados:
+            storage.delete(nombre)
+        raise
+    return (creados[0] if limpiar_original else archivo.name), variantes
+
+
+def borrar_variantes(storage, variantes):
+    for variante in (variantes or {}).values():
+        for clave in FORMATOS_VARIANTE:
+            if variante.get(clave):
+                storage.delete(variante[clave])
+
+
+# --- 2. PROCESAMIENTO DE UN REPORTE O ADJUNTO ---
+
+def procesar(reporte_id, modelo=ReporteAccidente):
+    """Procesa la foto pendiente del reporte (o del adjunto). Devuelve True si quedó lista."""
+    campo, campo_estado, campo_variantes, carpeta, limpiar_original = CAMPOS[modelo]
+    objeto = modelo.objects.filter(pk=reporte_id).only(campo).first()
+    archivo = getattr(objeto, campo, None)
+    if not archivo:
+        return False
+    original = archivo.name
+    mismo_archivo = modelo.objects.filter(pk=reporte_id, **{campo: original})
+
+    try:
+        limpio, variantes = generar(archivo, carpeta.format(pk=reporte_id), limpiar_original)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.exception("No se pudo procesar la evidencia de %s %s", modelo._meta.model_name, reporte_id)
+        mismo_archivo.update(**{campo_estado: 'error'})
+        return False
+
+    if mismo_archivo.update(**{campo: limpio, campo_variantes: variantes, campo_estado: 'lista'}):
+        if limpio != original:
+            archivo.storage.delete(original)
+        return True
+    # Se subió otra foto mientras tanto: lo generado ya no corresponde
+    if limpio != original:
+        archivo.storage.delete(limpio)
+    borrar_variantes(archivo.storage, variantes)
+    return False
+
+
+def procesar_pendientes(reportes=None, limite=None):
+    """
+    Procesa los reportes con evidencia pendiente (o los del queryset, que
+    puede ser de adjuntos). Devuelve (listas, con error).
+    """
+    if reportes is None:
+        reportes = ReporteAccidente.objects.filter(evidencia_estado='pendiente')
+    ids = list(reportes.order_by('pk').values_list('pk', flat=True)[:limite])
+    listas = sum(procesar(pk, reportes.model) for pk in ids)
+    return listas, len(ids) - listas
+
+
+# --- 3. COLA EN SEGUNDO PLANO ---
+
+def _tarea(reporte_id, modelo):
+    try:
+        procesar(reporte_id, modelo)
+    except Exception:
+        logger.exception("Falló el procesamiento de la evidencia de %s %s", modelo._meta.model_name, reporte_id)
+    finally:
+        # Cada hilo tiene su conexión; no dejarla abierta entre tareas
+        connection.close()
+
+
+def encolar(reporte_id, modelo=ReporteAccidente):
+    """
+    Agenda el procesamiento al confirmarse la transacción. Con
+    EVIDENCIAS_EN_SEGUNDO_PLANO apagado queda pendiente para el comando.
+    """
+    if not getattr(settings, 'EVIDENCIAS_EN_SEGUNDO_PLANO', True):
+        return
+    transaction.on_commit(lambda: _ejecutor.submit(_tarea, reporte_id, modelo))
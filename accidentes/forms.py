@@ -16,10 +16,12 @@ class ReporteFlashForm(forms.ModelForm):
             'nombre_completo_accidentado', 'rut_accidentado', 'cargo_accidentado', 
             'antiguedad_cargo', 'horas_trabajadas_antes',
             'descripcion_evento', 'tipo_accidente', 'severidad_inicial',
-            'parte_cuerpo_afectada', 'tipo_lesion', 'tratamiento_inicial',
+            'parte_cuerpo_afectada', 'tipo_lesion', 'tratamiento_inicial', 'dias_perdidos',
             'danio_propiedad', 'detalle_danio_propiedad',
-            'medidas_inmediatas', 'evidencia_fotografica'
+            'medidas_inmediatas',
         ]
+        # La evidencia va como adjuntos (AdjuntoAccidente), subidos por
+        # fragmentos después de enviar el reporte
         
         # Widgets con tus clases CSS 'form-control-modern'
         widgets = {
@@ -43,13 +45,13 @@ class ReporteFlashForm(forms.ModelForm):
             
             'tipo_lesion': forms.Select(attrs={'class': 'form-control-modern form-select'}),
             'tratamiento_inicial': forms.Select(attrs={'class': 'form-control-modern form-select'}),
+            'dias_perdidos': forms.NumberInput(attrs={'class': 'form-control-modern', 'min': 0}),
             'parte_cuerpo_afectada': forms.HiddenInput(), # Se llena vía JS (Three.js)
 
             'danio_propiedad': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'detalle_danio_propiedad': forms.Textarea(attrs={'class': 'form-control-modern', 'rows': 2}),
             
             'medidas_inmediatas': forms.Textarea(attrs={'class': 'form-control-modern', 'rows': 3, 'placeholder': 'Acciones tomadas al instante...'}),
-            'evidencia_fotografica': forms.FileInput(attrs={'class': 'form-control-modern'}),
         }
 
 class InvestigacionAccidenteForm(forms.ModelForm):
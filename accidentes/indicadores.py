@@ -0,0 +1,54 @@
+# accidentes/indicadores.py
+"""
+KPIs del centro de gestión de accidentes, guardados en caché por usuario.
+
+Los cinco contadores salen de una sola consulta con agregados condicionales
+(COUNT ... FILTER) sobre los reportes que el usuario puede ver
+(ReporteManager.por_empresa). La clave de caché lleva la versión de esos
+reportes (último `actualizado` y cantidad), que se lee de la BD con una
+consulta sobre el índice (empresa, actualizado): un cambio hecho en
+cualquier proceso deja la entrada anterior fuera de uso, aunque la caché
+sea local.
+"""
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+
+from .models import ReporteAccidente
+
+SEVERIDADES_GRAVES = ['grave', 'fatal']
+
+KPIS = {
+    'total_casos': Count('id'),
+    'pendientes_flash': Count('id', filter=Q(estado='reportado')),
+    'en_investigacion': Count('id', filter=Q(estado='en_investigacion')),
+    'cerrados': Count('id', filter=Q(estado='cerrado')),
+    'graves': Count('id', filter=Q(severidad_inicial__in=SEVERIDADES_GRAVES)),
+}
+
+
+def version(reportes):
+    """(último `actualizado`, cantidad): un alta o una edición cambian la fecha y una baja, la cantidad."""
+    datos = reportes.order_by().aggregate(ultimo=Max('actualizado'), cantidad=Count('id'))
+    ultimo = datos['ultimo'].timestamp() * 1e6 if datos['ultimo'] else 0
+    return f"{ultimo:.0f}-{datos['cantidad']}"
+
+
+def clave(usuario, version_reportes):
+    # Los superusuarios ven los reportes de todas las empresas: comparten clave
+    quien = 'todos' if usuario.is_superuser else usuario.pk
+    return f"accidentes:kpis:{quien}:{version_reportes}"
+
+
+def calcular(reportes):
+    """Los KPIs de un queryset de ReporteAccidente en una consulta."""
+    return reportes.order_by().aggregate(**KPIS)
+
+
+def kpis(usuario):
+    reportes = ReporteAccidente.objects.por_empresa(usuario)
+    clave_usuario = clave(usuario, version(reportes))
+    datos = cache.get(clave_usuario)
+    if datos is None:
+        datos = calcular(reportes)
+        cache.set(clave_usuario, datos)
+    return datos
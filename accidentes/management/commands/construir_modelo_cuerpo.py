@@ -0,0 +1,31 @@
+# accidentes/management/commands/construir_modelo_cuerpo.py
+
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accidentes import modelo_cuerpo
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera la variante cuantizada (KHR_mesh_quantization) del modelo 3D del '
+        'reporte flash. Volver a correrlo cada vez que cambie FinalBaseMesh.glb.'
+    )
+
+    def handle(self, *args, **options):
+        carpeta = settings.STATICFILES_DIRS[0]
+        origen = os.path.join(carpeta, modelo_cuerpo.MODELO)
+        destino = os.path.join(carpeta, modelo_cuerpo.MODELO_CUANTIZADO)
+        with open(origen, 'rb') as archivo:
+            contenido = archivo.read()
+        try:
+            cuantizado = modelo_cuerpo.cuantizar_glb(contenido)
+        except ValueError as e:
+            raise CommandError(str(e))
+        with open(destino, 'wb') as archivo:
+            archivo.write(cuantizado)
+        self.stdout.write(self.style.SUCCESS(
+            f"{modelo_cuerpo.MODELO_CUANTIZADO}: {len(contenido) // 1024} KB -> {len(cuantizado) // 1024} KB"
+        ))
@@ -0,0 +1,19 @@
+# accidentes/management/commands/limpiar_adjuntos_incompletos.py
+
+from django.core.management.base import BaseCommand
+
+from accidentes import adjuntos
+
+
+class Command(BaseCommand):
+    help = (
+        'Elimina los adjuntos de accidentes cuya subida quedó abandonada '
+        '(sin fragmentos nuevos en las últimas --horas), con sus archivos parciales.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=int, default=48, help='Horas sin avance para considerarla abandonada.')
+
+    def handle(self, *args, **options):
+        eliminados = adjuntos.limpiar_incompletos(options['horas'])
+        self.stdout.write(self.style.SUCCESS(f"Subidas abandonadas eliminadas: {eliminados}"))
@@ -0,0 +1,45 @@
+# accidentes/management/commands/procesar_evidencias.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accidentes import evidencias
+from accidentes.models import AdjuntoAccidente, ReporteAccidente
+
+
+class Command(BaseCommand):
+    help = (
+        'Procesa las fotos de evidencia pendientes, de los reportes y de los adjuntos '
+        '(original sin metadatos, miniatura y versión para pantalla). Con --continuo '
+        'queda corriendo como worker.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reintentar', action='store_true', help='Incluir las que fallaron antes.')
+        parser.add_argument('--todas', action='store_true', help='Regenerar todas las evidencias, aunque ya estén listas.')
+        parser.add_argument('--limite', type=int, help='Máximo de reportes (y de adjuntos) por pasada.')
+        parser.add_argument('--continuo', action='store_true', help='Repetir indefinidamente.')
+        parser.add_argument('--intervalo', type=int, default=10, help='Segundos entre pasadas con --continuo.')
+
+    def _pendientes(self, options):
+        reportes = ReporteAccidente.objects.exclude(evidencia_fotografica='').exclude(evidencia_fotografica__isnull=True)
+        adjuntos = AdjuntoAccidente.objects.filter(tipo='foto', estado='completo')
+        if options['todas']:
+            return [reportes, adjuntos]
+        estados = ['pendiente', 'error'] if options['reintentar'] else ['pendiente']
+        return [reportes.filter(evidencia_estado__in=estados), adjuntos.filter(variantes_estado__in=estados)]
+
+    def handle(self, *args, **options):
+        if options['todas'] and options['continuo']:
+            raise CommandError('--todas no se puede usar con --continuo.')
+        while True:
+            listas = con_error = 0
+            for pendientes in self._pendientes(options):
+                resultado = evidencias.procesar_pendientes(pendientes, options['limite'])
+                listas, con_error = listas + resultado[0], con_error + resultado[1]
+            if listas or con_error or not options['continuo']:
+                self.stdout.write(self.style.SUCCESS(f"Evidencias procesadas: {listas}, con error: {con_error}"))
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
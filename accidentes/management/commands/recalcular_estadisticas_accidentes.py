@@ -0,0 +1,24 @@
+# accidentes/management/commands/recalcular_estadisticas_accidentes.py
+
+from django.core.management.base import BaseCommand
+
+from accidentes import estadisticas
+from gestion_riesgos.models import Empresa
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye desde los reportes de accidente las estadísticas mensuales '
+        '(casos, accidentes con tiempo perdido y días perdidos por mes).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='Limitar a una empresa (id).')
+
+    def handle(self, *args, **options):
+        empresas = None
+        if options['empresa']:
+            empresas = Empresa.objects.filter(pk=options['empresa'])
+
+        filas = estadisticas.recalcular(empresas)
+        self.stdout.write(self.style.SUCCESS(f"Estadísticas recalculadas: {filas} filas mensuales."))
@@ -0,0 +1,70 @@
+# accidentes/management/commands/vendorizar_three.py
+
+import hashlib
+import io
+import os
+import tarfile
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accidentes import modelo_cuerpo
+
+PAQUETE_NPM = 'https://registry.npmjs.org/three/-/three-{version}.tgz'
+SUMAS = 'SHA256SUMS'
+
+
+class Command(BaseCommand):
+    help = (
+        'Copia three.js, GLTFLoader y OrbitControls (versión fija) a static/vendor '
+        'desde el paquete npm, para que el reporte flash no dependa de CDNs. '
+        'Los archivos resultantes se versionan con el repositorio.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paquete', help='Ruta a un three-<versión>.tgz ya descargado (sin red).')
+
+    def _paquete(self, ruta):
+        if ruta:
+            with open(ruta, 'rb') as archivo:
+                return archivo.read()
+        url = PAQUETE_NPM.format(version=modelo_cuerpo.THREE_VERSION)
+        self.stdout.write(f"Descargando {url}")
+        with urllib.request.urlopen(url, timeout=60) as respuesta:
+            return respuesta.read()
+
+    def handle(self, *args, **options):
+        carpeta = settings.STATICFILES_DIRS[0]
+        destinos = {paquete: os.path.join(carpeta, ruta) for ruta, paquete in modelo_cuerpo.SCRIPTS_THREE.items()}
+        directorio = os.path.dirname(next(iter(destinos.values())))
+
+        # Si ya hay sumas registradas, los archivos nuevos deben coincidir con ellas
+        esperadas = {}
+        ruta_sumas = os.path.join(directorio, SUMAS)
+        if os.path.exists(ruta_sumas):
+            with open(ruta_sumas) as archivo:
+                esperadas = dict(reversed(linea.split()) for linea in archivo if linea.strip())
+
+        contenidos = {}
+        with tarfile.open(fileobj=io.BytesIO(self._paquete(options['paquete'])), mode='r:gz') as paquete:
+            for miembro in destinos:
+                try:
+                    contenidos[miembro] = paquete.extractfile(miembro).read()
+                except (KeyError, AttributeError):
+                    raise CommandError(f"{miembro} no está en el paquete de three {modelo_cuerpo.THREE_VERSION}.")
+
+        sumas = {}
+        for miembro, contenido in contenidos.items():
+            nombre = os.path.basename(destinos[miembro])
+            sumas[nombre] = hashlib.sha256(contenido).hexdigest()
+            if esperadas.get(nombre, sumas[nombre]) != sumas[nombre]:
+                raise CommandError(f"{nombre} no coincide con {SUMAS}.")
+
+        os.makedirs(directorio, exist_ok=True)
+        for miembro, contenido in contenidos.items():
+            with open(destinos[miembro], 'wb') as archivo:
+                archivo.write(contenido)
+        with open(ruta_sumas, 'w') as archivo:
+            archivo.writelines(f"{suma}  {nombre}\n" for nombre, suma in sorted(sumas.items()))
+        self.stdout.write(self.style.SUCCESS(f"three {modelo_cuerpo.THREE_VERSION} copiado en {directorio}"))
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accidentes', '0006_reporteaccidente_detalle_parte_afectada_and_more'),
+        ('gestion_riesgos', '0013_indice_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reporteaccidente',
+            name='dias_perdidos',
+            field=models.PositiveIntegerField(default=0, help_text='Días de reposo laboral otorgados (se completa al conocer el alta).', verbose_name='Días perdidos'),
+        ),
+        migrations.CreateModel(
+            name='DotacionMensual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primer día del mes')),
+                ('trabajadores', models.PositiveIntegerField(verbose_name='Dotación promedio')),
+                ('horas_hombre', models.PositiveIntegerField(verbose_name='Horas-hombre trabajadas')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dotaciones_mensuales', to='gestion_riesgos.empresa')),
+            ],
+            options={
+                'verbose_name': 'Dotación mensual',
+                'verbose_name_plural': 'Dotaciones mensuales',
+                'ordering': ['empresa', 'mes'],
+                'constraints': [models.UniqueConstraint(fields=('empresa', 'mes'), name='dotacion_empresa_mes_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EstadisticaMensual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('tipo_accidente', models.CharField(choices=[('accidente_trabajo', 'Accidente del Trabajo (CTP/STP)'), ('accidente_trayecto', 'Accidente de Trayecto'), ('enfermedad_profesional', 'Enfermedad Profesional'), ('incidente', 'Incidente / Cuasi-Accidente (Sin Lesión)'), ('otro', 'Otro')], max_length=50)),
+                ('severidad_inicial', models.CharField(choices=[('insignificante', '1. Insignificante (Cuasi Accidente)'), ('leve', '2. Leve (Primeros Auxilios / STP)'), ('seria', '3. Seria (Incapacidad Temporal / CTP)'), ('grave', '4. Grave (Invalidez Parcial / Daño Mayor)'), ('fatal', '5. Fatal o Catastrófica')], max_length=20)),
+                ('turno', models.CharField(blank=True, max_length=20)),
+                ('casos', models.PositiveIntegerField(default=0)),
+                ('con_tiempo_perdido', models.PositiveIntegerField(default=0)),
+                ('dias_perdidos', models.PositiveIntegerField(default=0)),
+                ('casos_por_hora', models.JSONField(default=list)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas_accidentes', to='gestion_riesgos.empresa')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('empresa', 'mes', 'tipo_accidente', 'severidad_inicial', 'turno'), name='estadistica_accidentes_unica')],
+            },
+        ),
+    ]
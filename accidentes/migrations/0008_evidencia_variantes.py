@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:23
+
+from django.db import migrations, models
+
+
+def marcar_pendientes(apps, schema_editor):
+    # Las fotos ya subidas quedan en cola para `manage.py procesar_evidencias`
+    ReporteAccidente = apps.get_model('accidentes', 'ReporteAccidente')
+    ReporteAccidente.objects.exclude(evidencia_fotografica__isnull=True).exclude(evidencia_fotografica='')\
+        .update(evidencia_estado='pendiente')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accidentes', '0007_estadisticas_accidentabilidad'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reporteaccidente',
+            name='evidencia_estado',
+            field=models.CharField(blank=True, choices=[('pendiente', 'Pendiente de procesar'), ('lista', 'Procesada'), ('error', 'No se pudo procesar')], db_index=True, default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='reporteaccidente',
+            name='evidencia_variantes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(marcar_pendientes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:26
+
+import accidentes.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accidentes', '0008_evidencia_variantes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdjuntoAccidente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('foto', 'Foto'), ('video', 'Video'), ('documento', 'Documento')], max_length=10)),
+                ('nombre_original', models.CharField(max_length=255)),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('tamano', models.PositiveBigIntegerField(help_text='Bytes del archivo completo')),
+                ('recibido', models.PositiveBigIntegerField(default=0, help_text='Bytes confirmados')),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('archivo', models.FileField(blank=True, max_length=255, upload_to=accidentes.models.ruta_adjunto)),
+                ('estado', models.CharField(choices=[('subiendo', 'Subiendo'), ('completo', 'Completo')], db_index=True, default='subiendo', max_length=10)),
+                ('variantes_estado', models.CharField(blank=True, choices=[('pendiente', 'Pendiente de procesar'), ('lista', 'Procesada'), ('error', 'No se pudo procesar')], db_index=True, default='', max_length=10)),
+                ('variantes', models.JSONField(blank=True, default=dict, editable=False)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('reporte', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='adjuntos', to='accidentes.reporteaccidente')),
+                ('subido_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Adjunto de accidente',
+                'verbose_name_plural': 'Adjuntos de accidentes',
+                'ordering': ['creado', 'pk'],
+            },
+        ),
+    ]
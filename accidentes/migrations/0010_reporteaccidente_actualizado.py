@@ -0,0 +1,24 @@
+# Fecha del último cambio de cada reporte: versión de los KPIs en caché (accidentes/indicadores.py).
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accidentes', '0009_adjuntos_accidente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reporteaccidente',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='reporteaccidente',
+            index=models.Index(fields=['empresa', 'actualizado'], name='accidentes_empresa_actualiz'),
+        ),
+    ]
@@ -0,0 +1,232 @@
+# accidentes/modelo_cuerpo.py
+"""
+Modelo 3D del cuerpo del reporte flash (selector de la zona lesionada).
+
+- `cuantizar_glb` arma una variante liviana del GLB con KHR_mesh_quantization:
+  posiciones en enteros de 16 bits y normales en 8 bits, con la escala y el
+  desplazamiento en el nodo. GLTFLoader (r128) la lee sin decodificador
+  aparte. Vértices y triángulos se reordenan para que los datos sean más
+  repetitivos y comprima mejor con brotli/gzip, como lo sirve WhiteNoise.
+  Comando: construir_modelo_cuerpo.
+- three.js r128, GLTFLoader y OrbitControls se sirven desde static/vendor,
+  sin depender de CDNs. Los copia del paquete npm el comando
+  vendorizar_three y se versionan con el repositorio (con SHA256SUMS).
+"""
+import json
+import struct
+from functools import lru_cache
+
+import numpy as np
+from django.contrib.staticfiles import finders
+from django.core import checks
+from django.templatetags.static import static
+
+MODELO = 'gestion_riesgos/models/FinalBaseMesh.glb'
+MODELO_CUANTIZADO = 'gestion_riesgos/models/FinalBaseMesh.min.glb'
+
+THREE_VERSION = '0.128.0'
+# Ruta en static -> ruta dentro del paquete npm de three
+SCRIPTS_THREE = {
+    'vendor/three/r128/three.min.js': 'package/build/three.min.js',
+    'vendor/three/r128/GLTFLoader.js': 'package/examples/js/loaders/GLTFLoader.js',
+    'vendor/three/r128/OrbitControls.js': 'package/examples/js/controls/OrbitControls.js',
+}
+
+# Constantes de glTF
+FLOAT, BYTE, SHORT, UNSIGNED_SHORT, UNSIGNED_INT = 5126, 5120, 5122, 5123, 5125
+ARRAY_BUFFER, ELEMENT_ARRAY_BUFFER = 34962, 34963
+GLB_MAGIC, CHUNK_JSON, CHUNK_BIN = 0x46546C67, 0x4E4F534A, 0x004E4942
+TIPOS_NUMPY = {FLOAT: '<f4', BYTE: 'i1', SHORT: '<i2', UNSIGNED_SHORT: '<u2', UNSIGNED_INT: '<u4', 5121: 'u1'}
+COMPONENTES = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4}
+
+
+# --- 1. RECURSOS PARA LA PLANTILLA ---
+
+@lru_cache(maxsize=None)
+def _en_static(ruta):
+    return finders.find(ruta) is not None
+
+
+def recursos():
+    """URLs del modelo (la variante cuantizada si ya se construyó) y de los scripts de three.js."""
+    modelo = MODELO_CUANTIZADO if _en_static(MODELO_CUANTIZADO) else MODELO
+    return {'modelo_url': static(modelo), 'three_scripts': [static(ruta) for ruta in SCRIPTS_THREE]}
+
+
+def verificar_scripts(app_configs=None, **kwargs):
+    """Chequeo de sistema: sin los scripts de three.js en static el selector 3D no carga."""
+    faltantes = [ruta for ruta in SCRIPTS_THREE if finders.find(ruta) is None]
+    if not faltantes:
+        return []
+    return [checks.Warning(
+        f"Faltan en static: {', '.join(faltantes)}.",
+        hint="Correr `python manage.py vendorizar_three` y versionar los archivos generados.",
+        id='accidentes.W001',
+    )]
+
+
+# --- 2. LECTURA Y ESCRITURA DE GLB ---
+
+def leer_glb(contenido):
+    """(json, binario) de un archivo GLB."""
+    magic, version, _ = struct.unpack_from('<III', contenido, 0)
+    if magic != GLB_MAGIC or version != 2:
+        raise ValueError("No es un GLB 2.0.")
+    largo, tipo = struct.unpack_from('<II', contenido, 12)
+    if tipo != CHUNK_JSON:
+        raise ValueError("El GLB no empieza con el bloque JSON.")
+    gltf = json.loads(contenido[20:20 + largo])
+    binario = b''
+    inicio = 20 + largo
+    if inicio < len(contenido):
+        largo_bin, tipo = struct.unpack_from('<II', contenido, inicio)
+        if tipo == CHUNK_BIN:
+            binario = contenido[inicio + 8:inicio + 8 + largo_bin]
+    return gltf, binario
+
+
+def escribir_glb(gltf, binario):
+    datos = json.dumps(gltf, separators=(',', ':')).encode()
+    datos += b' ' * (-len(datos) % 4)
+    binario += b'\0' * (-len(binario) % 4)
+    largo = 12 + 8 + len(datos) + 8 + len(binario)
+    return b''.join([
+        struct.pack('<III', GLB_MAGIC, 2, largo),
+        struct.pack('<II', len(datos), CHUNK_JSON), datos,
+        struct.pack('<II', len(binario), CHUNK_BIN), binario,
+    ])
+
+
+def _leer_accessor(gltf, binario, indice):
+    accessor = gltf['accessors'][indice]
+    vista = gltf['bufferViews'][accessor['bufferView']]
+    tipo = np.dtype(TIPOS_NUMPY[accessor['componentType']])
+    componentes = COMPONENTES[accessor['type']]
+    inicio = vista.get('byteOffset', 0) + accessor.get('byteOffset', 0)
+    paso = vista.get('byteStride') or tipo.itemsize * componentes
+    filas = np.ndarray(
+        (accessor['count'], componentes), dtype=tipo, buffer=binario, offset=inicio, strides=(paso, tipo.itemsize),
+    )
+    return filas.astype(np.float64 if accessor['componentType'] == FLOAT else np.int64)
+
+
+# --- 3. CUANTIZACIÓN ---
+
+def _orden_de_uso(indices, cantidad):
+    """Vértices ordenados por su primera aparición en los índices; los no usados quedan al final."""
+    primera = np.full(cantidad, len(indices), dtype=np.int64)
+    np.minimum.at(primera, indices, np.arange(len(indices)))
+    return np.argsort(primera, kind='stable')
+
+
+def _ordenar_triangulos(indices):
+    """
+    Cada triángulo rotado para empezar por su vértice menor (conserva el
+    sentido de giro) y los triángulos en orden: índices más repetitivos,
+    que se comprimen mejor.
+    """
+    triangulos = indices.reshape(-1, 3)
+    giro = np.argmin(triangulos, axis=1)
+    filas = np.arange(len(triangulos))[:, None]
+    triangulos = triangulos[filas, (giro[:, None] + np.arange(3)) % 3]
+    return triangulos[np.lexsort(triangulos.T[::-1])].ravel()
+
+
+def cuantizar_glb(contenido):
+    """
+    GLB con cada primitiva cuantizada (KHR_mesh_quantization). Solo se
+    conservan POSITION, NORMAL y los índices: el selector pinta el cuerpo con
+    un material propio, sin texturas. Devuelve los bytes del nuevo GLB.
+    """
+    gltf, binario = leer_glb(contenido)
+    if gltf.get('skins') or gltf.get('animations') or len(gltf.get('buffers', [])) > 1:
+        raise ValueError("El modelo tiene esqueleto, animaciones o varios buffers: no se cuantiza.")
+    nodos_por_malla = {}
+    for nodo in gltf.get('nodes', []):
+        if 'mesh' in nodo:
+            nodos_por_malla.setdefault(nodo['mesh'], []).append(nodo)
+
+    accessors, vistas, partes = [], [], []
+    largo = 0
+
+    def agregar(arreglo, objetivo, accessor):
+        nonlocal largo
+        datos = np.ascontiguousarray(arreglo)
+        paso = datos.strides[0]
+        relleno = -paso % 4 if objetivo == ARRAY_BUFFER else 0
+        if relleno:
+            # Atributos: cada vértice alineado a 4 bytes, como exige glTF
+            datos = np.hstack([datos.view(np.uint8).reshape(len(datos), -1), np.zeros((len(datos), relleno), np.uint8)])
+        crudo = datos.tobytes()
+        vista = {'buffer': 0, 'byteOffset': largo, 'byteLength': len(crudo), 'target': objetivo}
+        if objetivo == ARRAY_BUFFER:
+            vista['byteStride'] = paso + relleno
+        vistas.append(vista)
+        partes.append(crudo + b'\0' * (-len(crudo) % 4))
+        largo += len(partes[-1])
+        accessors.append({'bufferView': len(vistas) - 1, 'count': len(arreglo), **accessor})
+        return len(accessors) - 1
+
+    for numero, malla in enumerate(gltf['meshes']):
+        if len(malla['primitives']) != 1 or len(nodos_por_malla.get(numero, [])) != 1:
+            raise ValueError(f"La malla {numero} debe tener una primitiva y un solo nodo.")
+        nodo = nodos_por_malla[numero][0]
+        if any(clave in nodo for clave in ('matrix', 'rotation', 'scale', 'translation', 'children')):
+            # La escala de la cuantización se aplicaría también a los hijos
+            raise ValueError(f"El nodo de la malla {numero} ya tiene transformación o hijos.")
+        primitiva = malla['primitives'][0]
+        if primitiva.get('targets') or primitiva.get('mode', 4) != 4:
+            raise ValueError(f"La malla {numero} no es una malla de triángulos simple.")
+
+        posiciones = _leer_accessor(gltf, binario, primitiva['attributes']['POSITION'])
+        if 'indices' in primitiva:
+            indices = _leer_accessor(gltf, binario, primitiva['indices']).ravel()
+        else:
+            indices = np.arange(len(posiciones))
+        orden = _orden_de_uso(indices, len(posiciones))
+        nuevo_indice = np.empty_like(orden)
+        nuevo_indice[orden] = np.arange(len(orden))
+        posiciones = posiciones[orden]
+        indices = _ordenar_triangulos(nuevo_indice[indices])
+
+        # Escala uniforme: con una escala distinta por eje habría que corregir las normales
+        centro = (posiciones.min(axis=0) + posiciones.max(axis=0)) / 2
+        radio = float(np.abs(posiciones - centro).max()) or 1.0
+        # Enteros sin normalizar: el raycaster de r128 lee los valores crudos
+        cuantizadas = np.round((posiciones - centro) / radio * 32767).astype('<i2')
+        nodo['translation'] = [float(v) for v in centro]
+        nodo['scale'] = [radio / 32767] * 3
+
+        atributos = {'POSITION': agregar(cuantizadas, ARRAY_BUFFER, {
+            'componentType': SHORT, 'type': 'VEC3',
+            'min': cuantizadas.min(axis=0).tolist(), 'max': cuantizadas.max(axis=0).tolist(),
+        })}
+        if 'NORMAL' in primitiva['attributes']:
+            normales = _leer_accessor(gltf, binario, primitiva['attributes']['NORMAL'])[orden]
+            normales /= np.maximum(np.linalg.norm(normales, axis=1, keepdims=True), 1e-12)
+            atributos['NORMAL'] = agregar(np.round(normales * 127).astype('i1'), ARRAY_BUFFER, {
+                'componentType': BYTE, 'type': 'VEC3', 'normalized': True,
+            })
+        tipo_indice = UNSIGNED_SHORT if len(posiciones) <= 0xFFFF else UNSIGNED_INT
+        nueva = {'attributes': atributos, 'indices': agregar(
+            indices.astype(TIPOS_NUMPY[tipo_indice]), ELEMENT_ARRAY_BUFFER,
+            {'componentType': tipo_indice, 'type': 'SCALAR'},
+        )}
+        if 'material' in primitiva:
+            nueva['material'] = primitiva['material']
+        malla['primitives'] = [nueva]
+
+    gltf['accessors'], gltf['bufferViews'] = accessors, vistas
+    gltf['buffers'] = [{'byteLength': largo}]
+    for clave in ('images', 'textures', 'samplers'):
+        gltf.pop(clave, None)
+    for material in gltf.get('materials', []):
+        for textura in ('normalTexture', 'occlusionTexture', 'emissiveTexture'):
+            material.pop(textura, None)
+        for textura in ('baseColorTexture', 'metallicRoughnessTexture'):
+            material.get('pbrMetallicRoughness', {}).pop(textura, None)
+    extensiones = set(gltf.get('extensionsUsed', [])) | {'KHR_mesh_quantization'}
+    gltf['extensionsUsed'] = sorted(extensiones)
+    gltf['extensionsRequired'] = sorted(set(gltf.get('extensionsRequired', [])) | {'KHR_mesh_quantization'})
+    gltf.setdefault('asset', {})['generator'] = 'Risk-Bee construir_modelo_cuerpo'
+    return escribir_glb(gltf, b''.join(partes))
@@ -7,6 +7,14 @@ from gestion_riesgos.models import Empresa
 # 1. MANAGERS
 # ==========================================
 
+def urls_variante(archivo, variantes, nombre):
+    """{'webp', 'jpeg', 'ancho', 'alto'} con URLs de una variante (accidentes/evidencias.py), o None."""
+    variante = variantes.get(nombre)
+    if not variante:
+        return None
+    return {**variante, 'webp': archivo.storage.url(variante['webp']), 'jpeg': archivo.storage.url(variante['jpeg'])}
+
+
 class ReporteManager(models.Manager):
     def flash_pendientes(self):
         return self.filter(estado='reportado')
@@ -70,6 +78,12 @@ class ReporteAccidente(models.Model):
         ('otro', 'Otro'),
     ]
 
+    ESTADO_EVIDENCIA_CHOICES = [
+        ('pendiente', 'Pendiente de procesar'),
+        ('lista', 'Procesada'),
+        ('error', 'No se pudo procesar'),
+    ]
+
     TRATAMIENTO_INICIAL_CHOICES = [
         ('primeros_auxilios', 'Primeros Auxilios (Faena)'),
         ('policlinico', 'Atención en Policlínico'),
@@ -81,6 +95,8 @@ class ReporteAccidente(models.Model):
     # --- 1. Contexto General ---
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='reportes_accidentes')
     fecha_reporte = models.DateTimeField(auto_now_add=True)
+    # Con la cantidad de reportes, da la versión de los KPIs en caché (accidentes/indicadores.py)
+    actualizado = models.DateTimeField(auto_now=True)
     reportado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='reportado', db_index=True)
 
@@ -131,6 +147,12 @@ class ReporteAccidente(models.Model):
     tipo_lesion = models.CharField(max_length=50, choices=TIPO_LESION_CHOICES, blank=True, null=True)
     tratamiento_inicial = models.CharField(max_length=50, choices=TRATAMIENTO_INICIAL_CHOICES, blank=True, null=True)
     
+    dias_perdidos = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Días perdidos",
+        help_text="Días de reposo laboral otorgados (se completa al conocer el alta)."
+    )
+
     danio_propiedad = models.BooleanField(default=False, verbose_name="¿Daño a propiedad/equipos?")
     detalle_danio_propiedad = models.TextField(blank=True, null=True)
     
@@ -143,9 +165,15 @@ class ReporteAccidente(models.Model):
     )
     
     evidencia_fotografica = models.ImageField(upload_to='accidentes_evidencia/', blank=True, null=True)
+    # Versiones livianas de la foto (accidentes/evidencias.py), generadas fuera de la petición
+    evidencia_estado = models.CharField(max_length=10, choices=ESTADO_EVIDENCIA_CHOICES, blank=True, default='', db_index=True)
+    evidencia_variantes = models.JSONField(default=dict, blank=True, editable=False)
 
     objects = ReporteManager()
 
+    class Meta:
+        indexes = [models.Index(fields=['empresa', 'actualizado'], name='accidentes_empresa_actualiz')]
+
     def __str__(self):
         return f"{self.get_tipo_accidente_display()} - {self.fecha_accidente.strftime('%d/%m/%Y')}"
     
@@ -153,6 +181,76 @@ class ReporteAccidente(models.Model):
     def es_grave(self):
         return self.severidad_inicial in ['grave', 'fatal']
 
+    @property
+    def evidencia_miniatura(self):
+        """{'webp', 'jpeg', 'ancho', 'alto'} de la miniatura, o None si aún no está."""
+        return urls_variante(self.evidencia_fotografica, self.evidencia_variantes, 'miniatura')
+
+    @property
+    def evidencia_media(self):
+        """Como evidencia_miniatura, en el tamaño para ver en pantalla."""
+        return urls_variante(self.evidencia_fotografica, self.evidencia_variantes, 'media')
+
+
+# ==========================================
+# 2.1 ADJUNTOS DEL REPORTE (FOTOS, VIDEOS, DOCUMENTOS)
+# ==========================================
+
+def ruta_adjunto(instance, filename):
+    return f"accidentes_adjuntos/{instance.reporte_id}/{filename}"
+
+
+class AdjuntoAccidente(models.Model):
+    """
+    Archivo de evidencia de un reporte, subido por fragmentos
+    (accidentes/adjuntos.py). Mientras está 'subiendo', `recibido` es la
+    cantidad de bytes confirmados: el cliente retoma desde ahí.
+    """
+    TIPO_CHOICES = [
+        ('foto', 'Foto'),
+        ('video', 'Video'),
+        ('documento', 'Documento'),
+    ]
+    ESTADO_CHOICES = [
+        ('subiendo', 'Subiendo'),
+        ('completo', 'Completo'),
+    ]
+
+    reporte = models.ForeignKey(ReporteAccidente, on_delete=models.CASCADE, related_name='adjuntos')
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    nombre_original = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    tamano = models.PositiveBigIntegerField(help_text="Bytes del archivo completo")
+    recibido = models.PositiveBigIntegerField(default=0, help_text="Bytes confirmados")
+    # SHA-256 (hex) del archivo: el que informa el cliente o, si no lo envía, el calculado al completar
+    sha256 = models.CharField(max_length=64, blank=True)
+    archivo = models.FileField(upload_to=ruta_adjunto, max_length=255, blank=True)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='subiendo', db_index=True)
+
+    # Fotos: miniatura y versión para pantalla, como evidencia_fotografica
+    variantes_estado = models.CharField(max_length=10, choices=ReporteAccidente.ESTADO_EVIDENCIA_CHOICES, blank=True, default='', db_index=True)
+    variantes = models.JSONField(default=dict, blank=True, editable=False)
+
+    subido_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['creado', 'pk']
+        verbose_name = "Adjunto de accidente"
+        verbose_name_plural = "Adjuntos de accidentes"
+
+    def __str__(self):
+        return f"{self.nombre_original} ({self.get_estado_display()})"
+
+    @property
+    def miniatura(self):
+        return urls_variante(self.archivo, self.variantes, 'miniatura')
+
+    @property
+    def media(self):
+        return urls_variante(self.archivo, self.variantes, 'media')
+
 
 # ==========================================
 # 3. MODELO DE INVESTIGACIÓN
@@ -195,4 +293,58 @@ class InvestigacionAccidente(models.Model):
         elif self.reporte.estado == 'reportado':
             self.reporte.estado = 'en_investigacion'
         self.reporte.save()
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+# ==========================================
+# 4. ESTADÍSTICAS DE ACCIDENTABILIDAD
+# ==========================================
+
+class DotacionMensual(models.Model):
+    """Trabajadores y horas-hombre de una empresa en un mes (base de las tasas)."""
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='dotaciones_mensuales')
+    mes = models.DateField(help_text="Primer día del mes")
+    trabajadores = models.PositiveIntegerField(verbose_name="Dotación promedio")
+    horas_hombre = models.PositiveIntegerField(verbose_name="Horas-hombre trabajadas")
+
+    class Meta:
+        verbose_name = "Dotación mensual"
+        verbose_name_plural = "Dotaciones mensuales"
+        ordering = ['empresa', 'mes']
+        constraints = [
+            models.UniqueConstraint(fields=['empresa', 'mes'], name='dotacion_empresa_mes_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.empresa} - {self.mes:%m/%Y}: {self.trabajadores} trabajadores"
+
+
+class EstadisticaMensual(models.Model):
+    """
+    Reportes de accidente agregados por empresa, mes, tipo, severidad y turno,
+    con su distribución por hora del evento. La mantiene
+    accidentes/estadisticas.py; no se edita a mano.
+    """
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='estadisticas_accidentes')
+    mes = models.DateField()
+    tipo_accidente = models.CharField(max_length=50, choices=ReporteAccidente.TIPO_ACCIDENTE_CHOICES)
+    severidad_inicial = models.CharField(max_length=20, choices=ReporteAccidente.CLASIFICACION_SEVERIDAD_CHOICES)
+    # '' cuando el reporte no indica turno
+    turno = models.CharField(max_length=20, blank=True)
+
+    casos = models.PositiveIntegerField(default=0)
+    con_tiempo_perdido = models.PositiveIntegerField(default=0)
+    dias_perdidos = models.PositiveIntegerField(default=0)
+    # Casos por hora del evento: 24 enteros, índice = hora (0-23)
+    casos_por_hora = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['empresa', 'mes', 'tipo_accidente', 'severidad_inicial', 'turno'],
+                name='estadistica_accidentes_unica',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.empresa} - {self.mes:%m/%Y} ({self.casos} casos)"
@@ -0,0 +1,64 @@
+# accidentes/signals.py
+"""Receptores de señales de la app; se conectan en AccidentesConfig.ready()."""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from . import adjuntos, estadisticas, evidencias
+from .models import AdjuntoAccidente, ReporteAccidente
+
+
+# --- REPORTE: ESTADÍSTICAS MENSUALES Y EVIDENCIA ---
+# Antes de guardar se lee cómo estaba el reporte (una consulta). Si la edición
+# lo movió de mes o de empresa, se recalculan ambos meses; si cambió la foto,
+# queda pendiente de procesar y se descartan las variantes de la anterior.
+
+def reporte_por_guardar(sender, instance, **kwargs):
+    anterior = None
+    if instance.pk:
+        anterior = ReporteAccidente.objects.filter(pk=instance.pk)\
+            .values('empresa_id', 'fecha_accidente', 'evidencia_fotografica', 'evidencia_variantes').first()
+    instance._anterior = anterior
+
+    foto_anterior = anterior['evidencia_fotografica'] if anterior else ''
+    if (instance.evidencia_fotografica.name or '') != (foto_anterior or ''):
+        instance.evidencia_estado = 'pendiente' if instance.evidencia_fotografica else ''
+        instance.evidencia_variantes = {}
+        instance._evidencia_cambiada = True
+
+
+def reporte_guardado(sender, instance, **kwargs):
+    anterior = getattr(instance, '_anterior', None)
+    meses = [(instance.empresa_id, estadisticas.mes_de(instance.fecha_accidente))]
+    if anterior:
+        meses.append((anterior['empresa_id'], estadisticas.mes_de(anterior['fecha_accidente'])))
+    estadisticas.programar(meses)
+
+    if getattr(instance, '_evidencia_cambiada', False):
+        instance._evidencia_cambiada = False
+        if anterior and anterior['evidencia_variantes']:
+            storage = instance.evidencia_fotografica.storage
+            transaction.on_commit(lambda: evidencias.borrar_variantes(storage, anterior['evidencia_variantes']))
+        if instance.evidencia_fotografica:
+            evidencias.encolar(instance.pk)
+
+
+def reporte_eliminado(sender, instance, **kwargs):
+    estadisticas.programar([(instance.empresa_id, estadisticas.mes_de(instance.fecha_accidente))])
+    if instance.evidencia_variantes:
+        storage = instance.evidencia_fotografica.storage
+        transaction.on_commit(lambda: evidencias.borrar_variantes(storage, instance.evidencia_variantes))
+
+
+# --- ADJUNTOS ---
+
+def adjunto_eliminado(sender, instance, **kwargs):
+    # También al eliminar el reporte (cascada): no quedan archivos huérfanos
+    adjuntos.borrar_archivos(instance)
+
+
+def conectar():
+    pre_save.connect(reporte_por_guardar, sender=ReporteAccidente, dispatch_uid='estadisticas_reporte_pre_save')
+    post_save.connect(reporte_guardado, sender=ReporteAccidente, dispatch_uid='estadisticas_reporte_save')
+    post_delete.connect(reporte_eliminado, sender=ReporteAccidente, dispatch_uid='estadisticas_reporte_delete')
+
+    post_delete.connect(adjunto_eliminado, sender=AdjuntoAccidente, dispatch_uid='adjuntos_adjunto_delete')
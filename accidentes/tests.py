@@ -1,3 +1,499 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.templatetags.static import static
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from gestion_riesgos.models import Empresa
+from . import adjuntos, estadisticas, evidencias, indicadores, modelo_cuerpo
+from .models import AdjuntoAccidente, DotacionMensual, EstadisticaMensual, ReporteAccidente
+
+
+class ReporteTestCase(TestCase):
+    """Prevencionista con una empresa, con sesión iniciada."""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('prevencionista', password='clave')
+        self.empresa = Empresa.objects.create(prevencionista=self.usuario, razon_social='ACME', rut='76.123.456-7')
+        self.client.force_login(self.usuario)
+
+    def crear_reporte(self, fecha=None, empresa=None, **valores):
+        datos = {
+            'area_departamento': 'Bodega', 'lugar_exacto': 'Pasillo 4', 'descripcion_evento': 'Resbaló',
+            'tipo_accidente': 'accidente_trabajo', 'severidad_inicial': 'leve', 'medidas_inmediatas': 'Primeros auxilios',
+            **valores,
+        }
+        fecha = fecha or timezone.make_aware(datetime(2025, 3, 10, 9, 30))
+        return ReporteAccidente.objects.create(
+            empresa=empresa or self.empresa, reportado_por=self.usuario, fecha_accidente=fecha, **datos,
+        )
+
+    def otra_empresa(self):
+        otro = User.objects.create_user('otro', password='clave')
+        return Empresa.objects.create(prevencionista=otro, razon_social='Otra', rut='77.000.000-0')
+
+
+# --- KPIs del centro de accidentes ---
+
+class IndicadoresTests(ReporteTestCase):
+
+    def test_contadores_siguen_cada_cambio(self):
+        reporte = self.crear_reporte()
+        self.crear_reporte(severidad_inicial='fatal', estado='en_investigacion')
+        self.crear_reporte(empresa=self.otra_empresa())
+        self.assertEqual(indicadores.kpis(self.usuario), {
+            'total_casos': 2, 'pendientes_flash': 1, 'en_investigacion': 1, 'cerrados': 0, 'graves': 1,
+        })
+        # En caché: solo la consulta de versión
+        with self.assertNumQueries(1):
+            indicadores.kpis(self.usuario)
+
+        reporte.estado = 'cerrado'
+        reporte.save()
+        datos = indicadores.kpis(self.usuario)
+        self.assertEqual((datos['pendientes_flash'], datos['cerrados']), (0, 1))
+
+        reporte.delete()
+        self.assertEqual(indicadores.kpis(self.usuario)['total_casos'], 1)
+
+    def test_superusuario_ve_todas_las_empresas(self):
+        self.crear_reporte()
+        self.crear_reporte(empresa=self.otra_empresa())
+        admin = User.objects.create_superuser('admin', password='clave')
+        self.assertEqual(indicadores.kpis(admin)['total_casos'], 2)
+        self.assertTrue(indicadores.clave(admin, 'v').startswith('accidentes:kpis:todos:'))
+
+    def test_listado(self):
+        self.crear_reporte(severidad_inicial='grave')
+        respuesta = self.client.get(reverse('reporte_accidente_list'))
+        self.assertEqual((respuesta.context['total_casos'], respuesta.context['graves']), (1, 1))
+
+
+# --- Estadísticas mensuales de accidentabilidad ---
+
+def fecha(mes, dia=10, hora=9):
+    return timezone.make_aware(datetime(2025, mes, dia, hora, 30))
+
+
+class EstadisticasTests(ReporteTestCase):
+
+    def guardadas(self):
+        return sorted(EstadisticaMensual.objects.filter(empresa=self.empresa).values_list('mes', 'casos', 'dias_perdidos'))
+
+    def crear(self, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.crear_reporte(*args, **kwargs)
+
+    def test_resumen_anual(self):
+        DotacionMensual.objects.create(empresa=self.empresa, mes=date(2025, 3, 1), trabajadores=100, horas_hombre=18000)
+        DotacionMensual.objects.create(empresa=self.empresa, mes=date(2025, 4, 1), trabajadores=50, horas_hombre=9000)
+        self.crear(fecha(3), dias_perdidos=4, turno_accidentado='A')
+        self.crear(fecha(3, hora=22), tipo_accidente='accidente_trayecto', dias_perdidos=10)
+        self.crear(fecha(3), severidad_inicial='insignificante')
+        # Mayo no tiene dotación: suma a los totales pero no a las tasas del año
+        self.crear(fecha(5), dias_perdidos=6)
+
+        datos = estadisticas.resumen_anual(self.empresa.pk, 2025)
+        marzo = datos['meses'][2]
+        self.assertEqual((marzo['casos'], marzo['accidentes_con_tiempo_perdido'], marzo['dias_perdidos']), (3, 1, 4))
+        self.assertEqual((marzo['tasa_accidentabilidad'], marzo['indice_gravedad']), (1.0, 222.22))
+        self.assertIsNone(datos['meses'][4]['tasa_accidentabilidad'])
+
+        acumulado = datos['acumulado']
+        self.assertEqual((acumulado['casos'], acumulado['accidentes_con_tiempo_perdido'], acumulado['dias_perdidos']),
+                         (4, 2, 10))
+        self.assertEqual((acumulado['trabajadores_promedio'], acumulado['horas_hombre'], acumulado['meses_con_dotacion']),
+                         (75, 27000, 2))
+        self.assertEqual((acumulado['tasa_accidentabilidad'], acumulado['tasa_siniestralidad']), (1.33, 5.33))
+        self.assertEqual(acumulado['indice_frecuencia'], 37.04)
+
+        self.assertEqual(datos['distribucion']['tipo_accidente'], {'accidente_trabajo': 3, 'accidente_trayecto': 1})
+        self.assertEqual(datos['distribucion']['turno'], {'': 3, 'A': 1})
+        self.assertEqual((datos['distribucion']['hora']['9'], datos['distribucion']['hora']['22']), (3, 1))
+
+    def test_mes_en_hora_local(self):
+        with self.settings(TIME_ZONE='America/Santiago'):
+            # 01:00 UTC del 1 de abril es todavía 31 de marzo en Chile
+            self.crear(datetime(2025, 4, 1, 1, 0, tzinfo=dt_timezone.utc))
+            self.assertEqual(self.guardadas(), [(date(2025, 3, 1), 1, 0)])
+            self.assertEqual(estadisticas.resumen_anual(self.empresa.pk, 2025)['distribucion']['hora']['22'], 1)
+
+    def test_mover_y_eliminar_recalcula_ambos_meses(self):
+        reporte = self.crear(fecha(3), dias_perdidos=2)
+        self.crear(fecha(3), dias_perdidos=3)
+        self.assertEqual(self.guardadas(), [(date(2025, 3, 1), 2, 5)])
+
+        reporte.fecha_accidente = fecha(4)
+        with self.captureOnCommitCallbacks(execute=True):
+            reporte.save()
+        self.assertEqual(self.guardadas(), [(date(2025, 3, 1), 1, 3), (date(2025, 4, 1), 1, 2)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reporte.delete()
+        self.assertEqual(self.guardadas(), [(date(2025, 3, 1), 1, 3)])
+
+        # El recálculo completo llega a lo mismo
+        EstadisticaMensual.objects.all().delete()
+        salida = io.StringIO()
+        call_command('recalcular_estadisticas_accidentes', stdout=salida)
+        self.assertIn('1 filas mensuales', salida.getvalue())
+        self.assertEqual(self.guardadas(), [(date(2025, 3, 1), 1, 3)])
+
+    def test_api(self):
+        self.crear(fecha(3))
+        url = reverse('estadisticas_accidentes_data')
+        datos = self.client.get(url, {'empresa': self.empresa.pk, 'anio': 2025}).json()
+        self.assertEqual((datos['empresa'], datos['acumulado']['casos']), ('ACME', 1))
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'empresa': self.empresa.pk, 'anio': 'este'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'empresa': self.otra_empresa().pk}).status_code, 404)
+
+
+# --- Procesamiento de fotos de evidencia ---
+
+def foto_jpeg(ancho=2000, alto=1000, orientacion=None):
+    imagen = Image.new('RGB', (ancho, alto), 'orange')
+    exif = Image.Exif()
+    exif[0x010F] = 'Camara de prueba'  # Make
+    if orientacion:
+        exif[0x0112] = orientacion
+    contenido = io.BytesIO()
+    imagen.save(contenido, 'JPEG', exif=exif.tobytes())
+    return contenido.getvalue()
+
+
+class MediaTemporalMixin:
+    """MEDIA_ROOT y subidas parciales en carpetas temporales, borradas al terminar."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        parciales = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, parciales, ignore_errors=True)
+        ajustes = self.settings(MEDIA_ROOT=media, ADJUNTOS_PARCIALES_DIR=parciales, EVIDENCIAS_EN_SEGUNDO_PLANO=False)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.parciales = parciales
+
+
+class EvidenciasTests(MediaTemporalMixin, ReporteTestCase):
+
+    def reporte_con_foto(self, contenido=None, nombre='foto.jpg'):
+        return self.crear_reporte(evidencia_fotografica=SimpleUploadedFile(nombre, contenido or foto_jpeg(orientacion=6)))
+
+    def test_original_limpio_y_variantes(self):
+        reporte = self.reporte_con_foto()
+        self.assertEqual(reporte.evidencia_estado, 'pendiente')
+        original = reporte.evidencia_fotografica.name
+
+        self.assertTrue(evidencias.procesar(reporte.pk))
+        reporte.refresh_from_db()
+        self.assertEqual(reporte.evidencia_estado, 'lista')
+        storage = reporte.evidencia_fotografica.storage
+        self.assertFalse(storage.exists(original))
+        with reporte.evidencia_fotografica.open('rb') as archivo, Image.open(archivo) as limpia:
+            # Enderezada según el EXIF y sin metadatos
+            self.assertEqual(limpia.size, (1000, 2000))
+            self.assertEqual(dict(limpia.getexif()), {})
+
+        variantes = reporte.evidencia_variantes
+        self.assertEqual((variantes['miniatura']['ancho'], variantes['miniatura']['alto']), (160, 320))
+        self.assertEqual((variantes['media']['ancho'], variantes['media']['alto']), (640, 1280))
+        for variante in variantes.values():
+            self.assertTrue(storage.exists(variante['webp']) and storage.exists(variante['jpeg']))
+        self.assertTrue(reporte.evidencia_miniatura['webp'].endswith('-miniatura.webp'))
+
+    def test_foto_danada_queda_con_error(self):
+        reporte = self.reporte_con_foto(b'no es una imagen')
+        with self.assertLogs('accidentes.evidencias', 'ERROR'):
+            self.assertFalse(evidencias.procesar(reporte.pk))
+        reporte.refresh_from_db()
+        self.assertEqual((reporte.evidencia_estado, reporte.evidencia_variantes), ('error', {}))
+
+    def test_foto_reemplazada_mientras_se_procesaba(self):
+        reporte = self.reporte_con_foto()
+        generar = evidencias.generar
+        generados = []
+
+        def generar_y_reemplazar(*args):
+            resultado = generar(*args)
+            generados.append(resultado)
+            ReporteAccidente.objects.filter(pk=reporte.pk).update(evidencia_fotografica='accidentes_evidencia/otra.jpg')
+            return resultado
+
+        with mock.patch.object(evidencias, 'generar', generar_y_reemplazar):
+            self.assertFalse(evidencias.procesar(reporte.pk))
+        storage = reporte.evidencia_fotografica.storage
+        limpio, variantes = generados[0]
+        self.assertFalse(storage.exists(limpio))
+        self.assertFalse(storage.exists(variantes['media']['webp']))
+        reporte.refresh_from_db()
+        self.assertEqual(reporte.evidencia_estado, 'pendiente')
+
+    def test_cambiar_la_foto_descarta_las_variantes(self):
+        reporte = self.reporte_con_foto()
+        evidencias.procesar(reporte.pk)
+        reporte.refresh_from_db()
+        anterior = reporte.evidencia_variantes['miniatura']['jpeg']
+
+        reporte.evidencia_fotografica = SimpleUploadedFile('nueva.png', foto_jpeg(10, 10))
+        with self.captureOnCommitCallbacks(execute=True):
+            reporte.save()
+        self.assertEqual((reporte.evidencia_estado, reporte.evidencia_variantes), ('pendiente', {}))
+        self.assertFalse(reporte.evidencia_fotografica.storage.exists(anterior))
+
+    def test_comando_y_cola(self):
+        self.reporte_con_foto()
+        self.reporte_con_foto(b'no es una imagen')
+        salida = io.StringIO()
+        with self.assertLogs('accidentes.evidencias', 'ERROR'):
+            call_command('procesar_evidencias', stdout=salida)
+        self.assertIn('Evidencias procesadas: 1, con error: 1', salida.getvalue())
+
+        with self.settings(EVIDENCIAS_EN_SEGUNDO_PLANO=True), \
+                mock.patch.object(evidencias._ejecutor, 'submit') as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                reporte = self.reporte_con_foto()
+        submit.assert_called_once_with(evidencias._tarea, reporte.pk, ReporteAccidente)
+
+
+# --- Adjuntos subidos por fragmentos ---
+
+class AdjuntosFragmentosTests(MediaTemporalMixin, ReporteTestCase):
+    CONTENIDO = b'0123456789' * 30
+
+    def setUp(self):
+        super().setUp()
+        self.reporte = self.crear_reporte()
+
+    def iniciar(self, nombre='informe.pdf', contenido=CONTENIDO, sha256=None, reporte=None):
+        datos = {'nombre': nombre, 'tamano': len(contenido), 'content_type': 'application/pdf'}
+        datos['sha256'] = hashlib.sha256(contenido).hexdigest() if sha256 is None else sha256
+        url = reverse('adjuntos_reporte', args=[(reporte or self.reporte).pk])
+        return self.client.post(url, json.dumps(datos), content_type='application/json')
+
+    def enviar(self, adjunto, offset, fragmento, checksum=None):
+        cabeceras = {'Upload-Offset': str(offset)}
+        if checksum is not False:
+            cabeceras['Upload-Checksum'] = f"sha256 {checksum or hashlib.sha256(fragmento).hexdigest()}"
+        return self.client.put(
+            adjunto['fragmento_url'], fragmento, content_type='application/offset+octet-stream', headers=cabeceras,
+        )
+
+    def test_subida_completa_y_retomada(self):
+        respuesta = self.iniciar()
+        self.assertEqual(respuesta.status_code, 201)
+        adjunto = respuesta.json()
+        self.assertEqual((adjunto['tipo'], adjunto['recibido'], adjunto['estado']), ('documento', 0, 'subiendo'))
+
+        self.assertEqual(self.enviar(adjunto, 0, self.CONTENIDO[:100]).json()['recibido'], 100)
+        # Tras un corte, el mismo archivo retoma el registro desde lo confirmado
+        retomada = self.iniciar()
+        self.assertEqual(retomada.status_code, 200)
+        self.assertEqual((retomada.json()['id'], retomada.json()['recibido']), (adjunto['id'], 100))
+        # Reintento de un fragmento ya confirmado: no se vuelve a escribir
+        self.assertEqual(self.enviar(adjunto, 0, self.CONTENIDO[:100]).json()['recibido'], 100)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            final = self.enviar(adjunto, 100, self.CONTENIDO[100:], checksum=False).json()
+        self.assertEqual((final['estado'], final['recibido']), ('completo', len(self.CONTENIDO)))
+        guardado = AdjuntoAccidente.objects.get(pk=adjunto['id'])
+        with guardado.archivo.open('rb') as archivo:
+            self.assertEqual(archivo.read(), self.CONTENIDO)
+        self.assertFalse(os.path.exists(adjuntos.ruta_parcial(adjunto['id'])))
+        self.assertEqual(self.client.get(adjunto['detalle_url']).json()['url'], guardado.archivo.url)
+
+    def test_offset_desfasado_responde_409(self):
+        adjunto = self.iniciar().json()
+        self.enviar(adjunto, 0, self.CONTENIDO[:100])
+        respuesta = self.enviar(adjunto, 150, self.CONTENIDO[150:200])
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json()['recibido'], 100)
+
+    def test_checksum_del_fragmento_distinto_responde_460(self):
+        adjunto = self.iniciar().json()
+        respuesta = self.enviar(adjunto, 0, self.CONTENIDO[:100], checksum='0' * 64)
+        self.assertEqual(respuesta.status_code, 460)
+        self.assertEqual(AdjuntoAccidente.objects.get(pk=adjunto['id']).recibido, 0)
+        self.assertEqual(os.path.getsize(adjuntos.ruta_parcial(adjunto['id'])), 0)
+
+    def test_sha256_del_archivo_distinto_vuelve_a_cero(self):
+        adjunto = self.iniciar(sha256=hashlib.sha256(b'otro archivo').hexdigest()).json()
+        respuesta = self.enviar(adjunto, 0, self.CONTENIDO)
+        self.assertEqual(respuesta.status_code, 422)
+        guardado = AdjuntoAccidente.objects.get(pk=adjunto['id'])
+        self.assertEqual((guardado.recibido, guardado.estado), (0, 'subiendo'))
+        self.assertFalse(os.path.exists(adjuntos.ruta_parcial(adjunto['id'])))
+
+    def test_foto_completa_queda_pendiente_de_procesar(self):
+        contenido = foto_jpeg(400, 200)
+        adjunto = self.iniciar('obra.jpg', contenido).json()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.enviar(adjunto, 0, contenido)
+        foto = AdjuntoAccidente.objects.get(pk=adjunto['id'])
+        self.assertEqual((foto.tipo, foto.variantes_estado), ('foto', 'pendiente'))
+
+        self.assertTrue(evidencias.procesar(foto.pk, AdjuntoAccidente))
+        foto.refresh_from_db()
+        self.assertEqual(foto.variantes_estado, 'lista')
+        # El original del adjunto se conserva tal cual se subió
+        with foto.archivo.open('rb') as archivo:
+            self.assertEqual(archivo.read(), contenido)
+
+    def test_validaciones_y_permisos(self):
+        self.assertEqual(self.iniciar('script.exe').status_code, 400)
+        self.assertEqual(self.iniciar(sha256='xyz').status_code, 400)
+        propio = self.iniciar().json()
+        datos = {'nombre': 'video.mp4', 'tamano': adjuntos.TAMANO_MAXIMO + 1}
+        respuesta = self.client.post(
+            reverse('adjuntos_reporte', args=[self.reporte.pk]), json.dumps(datos), content_type='application/json',
+        )
+        self.assertEqual(respuesta.status_code, 413)
+
+        ajeno = self.crear_reporte(empresa=self.otra_empresa())
+        self.assertEqual(self.iniciar(reporte=ajeno).status_code, 404)
+        self.client.force_login(User.objects.get(username='otro'))
+        self.assertEqual(self.enviar(propio, 0, self.CONTENIDO[:10]).status_code, 404)
+        self.assertEqual(self.client.get(propio['detalle_url']).status_code, 404)
+
+    def test_limpiar_subidas_abandonadas(self):
+        abandonado = self.iniciar().json()
+        self.enviar(abandonado, 0, self.CONTENIDO[:100])
+        reciente = self.iniciar('otro.pdf').json()
+        AdjuntoAccidente.objects.filter(pk=abandonado['id']).update(actualizado=timezone.now() - timedelta(hours=49))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(adjuntos.limpiar_incompletos(), 1)
+        self.assertFalse(AdjuntoAccidente.objects.filter(pk=abandonado['id']).exists())
+        self.assertFalse(os.path.exists(adjuntos.ruta_parcial(abandonado['id'])))
+        self.assertTrue(AdjuntoAccidente.objects.filter(pk=reciente['id']).exists())
+
+        salida = io.StringIO()
+        call_command('limpiar_adjuntos_incompletos', stdout=salida)
+        self.assertIn('Subidas abandonadas eliminadas: 0', salida.getvalue())
+
+
+# --- Modelo 3D cuantizado y three.js local ---
+
+def glb_de_prueba(nodo=None):
+    """Dos triángulos (un cuadrado) con normales, índices, una textura y un vértice sin usar."""
+    posiciones = np.array([[0, 0, 0], [2, 0, 0], [2, 1, 0], [0, 1, 0], [9, 9, 9]], dtype='<f4')
+    normales = np.tile(np.array([0, 0, 2], dtype='<f4'), (5, 1))
+    indices = np.array([3, 0, 1, 1, 2, 3], dtype='<u2')
+    binario = posiciones.tobytes() + normales.tobytes() + indices.tobytes()
+    gltf = {
+        'asset': {'version': '2.0'},
+        'nodes': [nodo or {'mesh': 0}],
+        'meshes': [{'primitives': [{'attributes': {'POSITION': 0, 'NORMAL': 1}, 'indices': 2, 'material': 0}]}],
+        'materials': [{'pbrMetallicRoughness': {'baseColorTexture': {'index': 0}}}],
+        'textures': [{'source': 0}],
+        'images': [{'uri': 'piel.png'}],
+        'buffers': [{'byteLength': len(binario)}],
+        'bufferViews': [
+            {'buffer': 0, 'byteOffset': 0, 'byteLength': 60},
+            {'buffer': 0, 'byteOffset': 60, 'byteLength': 60},
+            {'buffer': 0, 'byteOffset': 120, 'byteLength': 12},
+        ],
+        'accessors': [
+            {'bufferView': 0, 'componentType': modelo_cuerpo.FLOAT, 'count': 5, 'type': 'VEC3'},
+            {'bufferView': 1, 'componentType': modelo_cuerpo.FLOAT, 'count': 5, 'type': 'VEC3'},
+            {'bufferView': 2, 'componentType': modelo_cuerpo.UNSIGNED_SHORT, 'count': 6, 'type': 'SCALAR'},
+        ],
+    }
+    return modelo_cuerpo.escribir_glb(gltf, binario)
+
+
+def triangulos(posiciones, indices):
+    """Triángulos como coordenadas, rotados para empezar por el menor (conserva el sentido de giro)."""
+    resultado = set()
+    for triangulo in np.asarray(indices).reshape(-1, 3):
+        puntos = [tuple(np.round(posiciones[i], 3)) for i in triangulo]
+        inicio = puntos.index(min(puntos))
+        resultado.add(tuple(puntos[inicio:] + puntos[:inicio]))
+    return resultado
+
+
+class ModeloCuerpoTests(TestCase):
+
+    def test_cuantizar_conserva_la_geometria(self):
+        original, binario_original = modelo_cuerpo.leer_glb(glb_de_prueba())
+        esperados = triangulos(
+            modelo_cuerpo._leer_accessor(original, binario_original, 0),
+            modelo_cuerpo._leer_accessor(original, binario_original, 2),
+        )
+
+        gltf, binario = modelo_cuerpo.leer_glb(modelo_cuerpo.cuantizar_glb(glb_de_prueba()))
+        self.assertEqual(gltf['extensionsUsed'], ['KHR_mesh_quantization'])
+        self.assertEqual(gltf['extensionsRequired'], ['KHR_mesh_quantization'])
+        self.assertNotIn('textures', gltf)
+        self.assertNotIn('baseColorTexture', gltf['materials'][0]['pbrMetallicRoughness'])
+
+        primitiva = gltf['meshes'][0]['primitives'][0]
+        posicion = gltf['accessors'][primitiva['attributes']['POSITION']]
+        normal = gltf['accessors'][primitiva['attributes']['NORMAL']]
+        self.assertEqual(posicion['componentType'], modelo_cuerpo.SHORT)
+        self.assertNotIn('normalized', posicion)
+        self.assertEqual((normal['componentType'], normal['normalized']), (modelo_cuerpo.BYTE, True))
+        self.assertEqual(gltf['accessors'][primitiva['indices']]['componentType'], modelo_cuerpo.UNSIGNED_SHORT)
+        for vista in gltf['bufferViews']:
+            self.assertEqual(vista['byteOffset'] % 4, 0)
+            self.assertEqual(vista.get('byteStride', 4) % 4, 0)
+
+        # Posición real = entero * escala + desplazamiento del nodo
+        nodo = gltf['nodes'][0]
+        cuantizadas = modelo_cuerpo._leer_accessor(gltf, binario, primitiva['attributes']['POSITION'])
+        posiciones = cuantizadas * np.array(nodo['scale']) + np.array(nodo['translation'])
+        indices = modelo_cuerpo._leer_accessor(gltf, binario, primitiva['indices']).ravel()
+        self.assertEqual(triangulos(posiciones, indices), esperados)
+        # Los vértices usados quedan primero, en orden de aparición
+        self.assertEqual(sorted(set(indices.tolist())), [0, 1, 2, 3])
+        normales = modelo_cuerpo._leer_accessor(gltf, binario, primitiva['attributes']['NORMAL'])
+        self.assertTrue((normales == [0, 0, 127]).all())
+
+    def test_nodo_con_transformacion_o_hijos_no_se_cuantiza(self):
+        for nodo in ({'mesh': 0, 'scale': [2, 2, 2]}, {'mesh': 0, 'children': [0]}):
+            with self.subTest(nodo=nodo), self.assertRaises(ValueError):
+                modelo_cuerpo.cuantizar_glb(glb_de_prueba(nodo))
+        with self.assertRaises(ValueError):
+            modelo_cuerpo.leer_glb(b'no es un glb' * 2)
+
+    def test_recursos_se_sirven_desde_static(self):
+        recursos = modelo_cuerpo.recursos()
+        self.assertEqual(recursos['three_scripts'], [static(ruta) for ruta in modelo_cuerpo.SCRIPTS_THREE])
+        for script in recursos['three_scripts']:
+            self.assertTrue(script.startswith(settings.STATIC_URL))
+            self.assertIn('/vendor/three/r128/', script)
+
+        # Sin la variante cuantizada se usa el modelo original
+        modelo_cuerpo._en_static.cache_clear()
+        self.addCleanup(modelo_cuerpo._en_static.cache_clear)
+        with mock.patch.object(modelo_cuerpo.finders, 'find', return_value=None):
+            self.assertEqual(modelo_cuerpo.recursos()['modelo_url'], static(modelo_cuerpo.MODELO))
+        modelo_cuerpo._en_static.cache_clear()
+        with mock.patch.object(modelo_cuerpo.finders, 'find', return_value='/static/encontrado'):
+            self.assertEqual(modelo_cuerpo.recursos()['modelo_url'], static(modelo_cuerpo.MODELO_CUANTIZADO))
 
-# Create your tests here.
+    def test_chequeo_avisa_si_faltan_los_scripts(self):
+        with mock.patch.object(modelo_cuerpo.finders, 'find', return_value=None):
+            avisos = modelo_cuerpo.verificar_scripts()
+        self.assertEqual([aviso.id for aviso in avisos], ['accidentes.W001'])
+        self.assertIn('vendor/three/r128/GLTFLoader.js', avisos[0].msg)
+        with mock.patch.object(modelo_cuerpo.finders, 'find', return_value='/static/encontrado'):
+            self.assertEqual(modelo_cuerpo.verificar_scripts(), [])
@@ -1,5 +1,8 @@
 from django.urls import path
-from .views import ReporteAccidenteListView, ReporteFlashCreateView, ReporteInvestigacionView, ReporteUpdateView
+from .views import (
+    ReporteAccidenteListView, ReporteFlashCreateView, ReporteInvestigacionView, ReporteUpdateView, estadisticas_data,
+    adjuntos_reporte, adjunto_fragmento, adjunto_detalle,
+)
 
 urlpatterns = [
     # Dashboard / Lista
@@ -13,4 +16,12 @@ urlpatterns = [
     
     # Edición (si se requiere)
     path('editar/<int:pk>/', ReporteUpdateView.as_view(), name='reporte_accidente_update'),
-]
\ No newline at end of file
+
+    # Estadísticas de accidentabilidad (JSON)
+    path('api/estadisticas/', estadisticas_data, name='estadisticas_accidentes_data'),
+
+    # Adjuntos del reporte: subida por fragmentos, reanudable (JSON)
+    path('api/reportes/<int:pk>/adjuntos/', adjuntos_reporte, name='adjuntos_reporte'),
+    path('api/adjuntos/<int:pk>/', adjunto_detalle, name='adjunto_detalle'),
+    path('api/adjuntos/<int:pk>/fragmento/', adjunto_fragmento, name='adjunto_fragmento'),
+]
@@ -1,14 +1,20 @@
 # accidentes/views.py
 
+import json
+
 from django.shortcuts import render, get_object_or_404, redirect
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.views.generic import ListView, CreateView, UpdateView
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Count, Q # <--- IMPORTANTE: Agregar esto
 
-from .models import ReporteAccidente, InvestigacionAccidente
+from gestion_riesgos.models import Empresa
+from . import adjuntos, estadisticas, indicadores, modelo_cuerpo
+from .models import AdjuntoAccidente, ReporteAccidente, InvestigacionAccidente
 from .forms import ReporteFlashForm, InvestigacionAccidenteForm
 
 # ==========================================
@@ -21,32 +27,48 @@ class ReporteAccidenteListView(LoginRequiredMixin, ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        # Filtra por empresa si no es superusuario
-        qs = ReporteAccidente.objects.all().order_by('-fecha_accidente')
-        if not self.request.user.is_superuser:
-            # qs = qs.filter(empresa__prevencionista=self.request.user) # Descomentar cuando tengas usuarios vinculados
-            pass
-        return qs
+        # Solo los reportes de las empresas del usuario (todas si es superusuario)
+        return ReporteAccidente.objects.por_empresa(self.request.user).order_by('-fecha_accidente')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        qs = self.get_queryset()
-        
         # --- CÁLCULO DE DATOS (KPIs) ---
-        context['total_casos'] = qs.count()
-        context['pendientes_flash'] = qs.filter(estado='reportado').count()
-        context['en_investigacion'] = qs.filter(estado='en_investigacion').count()
-        context['cerrados'] = qs.filter(estado='cerrado').count()
-        
-        # Datos para gráficas simples (opcional)
-        context['graves'] = qs.filter(severidad_inicial__in=['grave', 'fatal']).count()
-        
+        # total_casos, pendientes_flash, en_investigacion, cerrados y graves
+        # en una sola consulta, guardada en caché por usuario
+        context.update(indicadores.kpis(self.request.user))
         return context
 
 # ==========================================
 # 2. CREACIÓN: REPORTE FLASH
 # ==========================================
-class ReporteFlashCreateView(LoginRequiredMixin, CreateView):
+class ReporteFlashJsonMixin:
+    """
+    Con 'Accept: application/json' el formulario responde JSON en vez de
+    redirigir: el navegador guarda el reporte y después sube los adjuntos
+    (sección 6) sin que el envío espere por ellos.
+    """
+
+    def _pide_json(self):
+        return 'application/json' in self.request.headers.get('Accept', '')
+
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        if not self._pide_json():
+            return response
+        return JsonResponse({
+            'status': 'ok',
+            'id': self.object.pk,
+            'adjuntos_url': reverse('adjuntos_reporte', args=[self.object.pk]),
+            'redirect': str(self.get_success_url()),
+        })
+
+    def form_invalid(self, form):
+        if not self._pide_json():
+            return super().form_invalid(form)
+        return JsonResponse({'status': 'error', 'errors': form.errors.get_json_data()}, status=400)
+
+
+class ReporteFlashCreateView(LoginRequiredMixin, ReporteFlashJsonMixin, CreateView):
     model = ReporteAccidente
     form_class = ReporteFlashForm
     template_name = 'accidentes/reporte_flash.html'
@@ -62,6 +84,7 @@ class ReporteFlashCreateView(LoginRequiredMixin, CreateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['titulo'] = "Nuevo Reporte Flash"
+        context['modelo_cuerpo'] = modelo_cuerpo.recursos()
         return context
 
 # ==========================================
@@ -88,6 +111,7 @@ class ReporteInvestigacionView(LoginRequiredMixin, UpdateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['reporte'] = self.object.reporte 
+        context['adjuntos'] = self.object.reporte.adjuntos.filter(estado='completo')
         return context
 
     def form_valid(self, form):
@@ -107,7 +131,7 @@ class ReporteInvestigacionView(LoginRequiredMixin, UpdateView):
 # ==========================================
 # 4. EDICIÓN FLASH (Correcciones)
 # ==========================================
-class ReporteUpdateView(LoginRequiredMixin, UpdateView):
+class ReporteUpdateView(LoginRequiredMixin, ReporteFlashJsonMixin, UpdateView):
     model = ReporteAccidente
     form_class = ReporteFlashForm
     template_name = 'accidentes/reporte_flash.html'
@@ -116,4 +140,123 @@ class ReporteUpdateView(LoginRequiredMixin, UpdateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['titulo'] = "Editar Reporte Original"
-        return context
\ No newline at end of file
+        context['modelo_cuerpo'] = modelo_cuerpo.recursos()
+        return context
+
+# ==========================================
+# 5. ESTADÍSTICAS DE ACCIDENTABILIDAD (API)
+# ==========================================
+@login_required
+def estadisticas_data(request):
+    """
+    Serie mensual, acumulado del año y distribuciones de una empresa.
+    ?empresa= (obligatorio); ?anio= (por defecto, el actual).
+    """
+    empresa_id = request.GET.get('empresa', '')
+    anio = request.GET.get('anio', str(timezone.localdate().year))
+    if not empresa_id.isdigit():
+        return JsonResponse({'status': 'error', 'message': 'Empresa inválida.'}, status=400)
+    if not anio.isdigit():
+        return JsonResponse({'status': 'error', 'message': 'Año inválido.'}, status=400)
+
+    empresas = Empresa.objects.all() if request.user.is_superuser else Empresa.objects.filter(prevencionista=request.user)
+    empresa = get_object_or_404(empresas, pk=empresa_id)
+    return JsonResponse({'empresa': empresa.razon_social, **estadisticas.resumen_anual(empresa.pk, int(anio))})
+
+
+# ==========================================
+# 6. ADJUNTOS: SUBIDA POR FRAGMENTOS (API)
+# ==========================================
+def _adjunto_json(adjunto):
+    datos = {
+        'id': adjunto.pk,
+        'nombre': adjunto.nombre_original,
+        'tipo': adjunto.tipo,
+        'tamano': adjunto.tamano,
+        'recibido': adjunto.recibido,
+        'estado': adjunto.estado,
+        'sha256': adjunto.sha256,
+        'url': adjunto.archivo.url if adjunto.archivo else None,
+        'miniatura': None,
+        'fragmento_url': reverse('adjunto_fragmento', args=[adjunto.pk]),
+        'detalle_url': reverse('adjunto_detalle', args=[adjunto.pk]),
+    }
+    if adjunto.tipo == 'foto':
+        datos['variantes_estado'] = adjunto.variantes_estado
+        datos['miniatura'] = adjunto.miniatura
+    return datos
+
+
+def _adjuntos_del_usuario(user):
+    return AdjuntoAccidente.objects.filter(reporte__in=ReporteAccidente.objects.por_empresa(user))
+
+
+def _error_adjunto(error):
+    datos = {'status': 'error', 'message': str(error)}
+    if isinstance(error, adjuntos.FragmentoDesfasado):
+        datos['recibido'] = error.recibido
+    return JsonResponse(datos, status=error.estado_http)
+
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+def adjuntos_reporte(request, pk):
+    """
+    GET: adjuntos del reporte. POST {nombre, tamano, content_type, sha256}:
+    inicia una subida (201) o devuelve la que el usuario ya tenía empezada
+    con ese archivo (200), para seguir desde `recibido`.
+    """
+    reporte = get_object_or_404(ReporteAccidente.objects.por_empresa(request.user), pk=pk)
+    if request.method == 'GET':
+        return JsonResponse({'adjuntos': [_adjunto_json(a) for a in reporte.adjuntos.all()]})
+
+    try:
+        data = json.loads(request.body)
+        adjunto, creado = adjuntos.crear(
+            reporte, data.get('nombre'), data.get('tamano'), request.user,
+            content_type=data.get('content_type') or '', sha256=data.get('sha256') or '',
+        )
+    except (ValueError, AttributeError):
+        return JsonResponse({'status': 'error', 'message': 'JSON inválido.'}, status=400)
+    except adjuntos.ErrorAdjunto as e:
+        return _error_adjunto(e)
+    return JsonResponse(
+        {**_adjunto_json(adjunto), 'tamano_fragmento': adjuntos.TAMANO_FRAGMENTO},
+        status=201 if creado else 200,
+    )
+
+
+@login_required
+@require_http_methods(['PUT'])
+def adjunto_fragmento(request, pk):
+    """
+    Cuerpo: bytes del fragmento. Encabezados: Upload-Offset (posición) y,
+    opcional, Upload-Checksum: 'sha256 <hex>'. Si el offset no es el
+    esperado responde 409 con `recibido`, desde donde debe seguir el cliente.
+    """
+    adjunto = get_object_or_404(_adjuntos_del_usuario(request.user), pk=pk)
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        longitud = int(request.headers.get('Content-Length') or 0)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Upload-Offset inválido.'}, status=400)
+    algoritmo, _, checksum = request.headers.get('Upload-Checksum', '').partition(' ')
+    if checksum and algoritmo.lower() != 'sha256':
+        return JsonResponse({'status': 'error', 'message': 'Solo se admite Upload-Checksum sha256.'}, status=400)
+
+    try:
+        # request se lee como archivo: el fragmento llega al disco por bloques
+        adjunto = adjuntos.escribir_fragmento(adjunto.pk, offset, request, longitud, checksum.strip().lower())
+    except adjuntos.ErrorAdjunto as e:
+        return _error_adjunto(e)
+    return JsonResponse(_adjunto_json(adjunto))
+
+
+@login_required
+@require_http_methods(['GET', 'DELETE'])
+def adjunto_detalle(request, pk):
+    adjunto = get_object_or_404(_adjuntos_del_usuario(request.user), pk=pk)
+    if request.method == 'DELETE':
+        adjunto.delete()
+        return JsonResponse({'status': 'ok'})
+    return JsonResponse(_adjunto_json(adjunto))
@@ -0,0 +1,27 @@
+# La versión de los próximos eventos del dashboard se deriva de la BD
+# (fecha del último cambio y cantidad), igual en todos los procesos.
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agenda', '0002_add_descripcion_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visita',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recordatorio',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -17,6 +17,8 @@ class Visita(models.Model):
     descripcion = models.TextField(blank=True)
     fecha_hora = models.DateTimeField()
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='propuesta')
+    # Para la versión de los próximos eventos del dashboard (gestion_riesgos/tablero.py)
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"Visita a {self.empresa.razon_social} - {self.asunto}"
@@ -26,6 +28,7 @@ class Recordatorio(models.Model):
     titulo = models.CharField(max_length=255)
     fecha_hora = models.DateTimeField()
     descripcion = models.TextField(blank=True)
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.titulo
\ No newline at end of file
@@ -2,12 +2,66 @@
 from django.contrib import admin
 from .models import (
     Empresa, Contacto, Matriz, Proceso, Tarea, Riesgo, 
-    Documento, SolicitudFirma, Normativa, Peligro
+    Documento, SolicitudFirma, Normativa, Peligro, EscalaValoracion, NivelEscala,
+    MigracionMatrizLegacy
 )
+from . import escalas, migracion_legacy
+
+
+@admin.register(Empresa)
+class EmpresaAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'escala_valoracion' in form.changed_data:
+            escalas.aplicar_a_empresa(obj)
+
+
+class NivelEscalaInline(admin.TabularInline):
+    model = NivelEscala
+    extra = 0
+
+
+@admin.register(EscalaValoracion)
+class EscalaValoracionAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'predeterminada', 'actualizada')
+    inlines = [NivelEscalaInline]
+
+    def save_related(self, request, form, formsets, change):
+        # Los niveles se guardan aquí: recién entonces se puede recompilar la escala
+        super().save_related(request, form, formsets, change)
+        if not (form.has_changed() or any(formset.has_changed() for formset in formsets)):
+            return
+        escalas.aplicar_escala(form.instance)
+        if 'predeterminada' in form.changed_data:
+            escalas.aplicar_predeterminada()
+
+    def delete_model(self, request, obj):
+        escalas.eliminar_escala(obj)
+
+    def delete_queryset(self, request, queryset):
+        for escala in queryset:
+            escalas.eliminar_escala(escala)
 
-admin.site.register(Empresa)
 admin.site.register(Contacto)
-admin.site.register(Matriz)
+
+
+@admin.register(Matriz)
+class MatrizAdmin(admin.ModelAdmin):
+    list_display = ('nombre_proyecto', 'empresa', 'version', 'estado')
+    actions = ['migrar_a_iper']
+
+    @admin.action(description="Migrar a Matriz IPER")
+    def migrar_a_iper(self, request, queryset):
+        migraciones = migracion_legacy.migrar_matrices(queryset)
+        filas = sum(migracion.filas_migradas for migracion in migraciones)
+        self.message_user(request, f"{len(migraciones)} matriz(ces) migrada(s) a Matriz IPER ({filas} filas).")
+
+
+@admin.register(MigracionMatrizLegacy)
+class MigracionMatrizLegacyAdmin(admin.ModelAdmin):
+    list_display = ('matriz', 'matriz_iper', 'filas_migradas', 'completada', 'actualizada')
+    list_filter = ('completada',)
+
 admin.site.register(Proceso)
 admin.site.register(Tarea) # ANTES DECÍA SUBPROCESO
 admin.site.register(Riesgo)
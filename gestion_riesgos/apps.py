@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class GestionRiesgosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gestion_riesgos'
+
+    def ready(self):
+        from . import signals
+        signals.conectar()
@@ -0,0 +1,73 @@
+# gestion_riesgos/arbol.py
+"""
+Árbol completo de una matriz por procesos: Proceso -> Tarea -> Riesgo ->
+MedidaControl.
+
+Se arma con una consulta por nivel (procesos, tareas, riesgos con su peligro
+y medidas de control), así la cantidad de consultas es la misma para una
+matriz de diez riesgos que para una de diez mil. Los hijos quedan en la
+caché de prefetch de cada objeto, de modo que `proceso.tareas.all`,
+`tarea.riesgos.all` y `riesgo.medidas_control.all` no vuelven a la BD, y
+cada riesgo ya trae sus VEP almacenados (Riesgo.calcular_vep al guardar).
+"""
+from django.db.models import Prefetch
+
+from .models import Riesgo, Tarea
+
+
+class ArbolMatriz:
+    """Procesos de la matriz con sus hijos ya cargados, en el orden de la vista."""
+
+    def __init__(self, matriz, procesos):
+        self.matriz = matriz
+        self.procesos = procesos
+
+    @property
+    def tareas(self):
+        return [tarea for proceso in self.procesos for tarea in proceso.tareas.all()]
+
+    @property
+    def riesgos(self):
+        """Todos los riesgos, ordenados por proceso, tarea y código de peligro."""
+        return [riesgo for tarea in self.tareas for riesgo in tarea.riesgos.all()]
+
+    def como_dict(self):
+        campos_vep = Riesgo.campos_calculados()
+        return {
+            'id': self.matriz.pk,
+            'nombre_proyecto': self.matriz.nombre_proyecto,
+            'procesos': [{
+                'id': proceso.pk,
+                'nombre': proceso.nombre,
+                'subproceso': proceso.subproceso,
+                'tareas': [{
+                    'id': tarea.pk,
+                    'puesto_trabajo': tarea.puesto_trabajo,
+                    'descripcion': tarea.descripcion,
+                    'es_rutinaria': tarea.es_rutinaria,
+                    'riesgos': [{
+                        'id': riesgo.pk,
+                        'peligro': {
+                            'codigo': riesgo.peligro.codigo,
+                            'familia_riesgo': riesgo.peligro.familia_riesgo,
+                            'riesgo_especifico': riesgo.peligro.riesgo_especifico,
+                        },
+                        'consecuencias': riesgo.consecuencias,
+                        'gema': riesgo.identificacion_gema,
+                        'nueva_medida_control': riesgo.nueva_medida_control,
+                        **{campo: getattr(riesgo, campo) for campo in campos_vep},
+                        'medidas_control': [medida.descripcion for medida in riesgo.medidas_control.all()],
+                    } for riesgo in tarea.riesgos.all()],
+                } for tarea in proceso.tareas.all()],
+            } for proceso in self.procesos],
+        }
+
+
+def construir_arbol(matriz):
+    """ArbolMatriz de la matriz en cuatro consultas (una por nivel)."""
+    procesos = matriz.procesos.order_by('nombre', 'pk').prefetch_related(
+        Prefetch('tareas', queryset=Tarea.objects.order_by('descripcion', 'pk')),
+        Prefetch('tareas__riesgos', queryset=Riesgo.objects.select_related('peligro').order_by('peligro__codigo', 'pk')),
+        'tareas__riesgos__medidas_control',
+    )
+    return ArbolMatriz(matriz, list(procesos))
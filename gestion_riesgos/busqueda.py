@@ -0,0 +1,278 @@
+# gestion_riesgos/busqueda.py
+"""
+Búsqueda de texto en las filas IPER, el catálogo de peligros y la normativa.
+
+Cada objeto buscable tiene un documento en IndiceBusqueda. Su `texto` ya
+viene normalizado en Python: minúsculas, sin tildes, sin palabras vacías y
+con cada palabra reducida a su raíz ("soldaduras" -> "sold"). Como la
+consulta pasa por la misma normalización, SQLite y PostgreSQL encuentran y
+ordenan los mismos términos:
+- SQLite: tabla virtual FTS5 sobre IndiceBusqueda, mantenida con triggers;
+  orden por bm25.
+- PostgreSQL: índice GIN sobre to_tsvector('simple', texto); orden por ts_rank.
+(Ambos se crean en la migración 0013.)
+
+El índice se actualiza de forma incremental:
+- Filas IPER: cada escritura sube la revisión de la matriz; al confirmarse,
+  sincronizar_matriz() reindexa solo las filas con revisión posterior a la
+  ya indexada y quita las eliminadas.
+- Peligros y normativa: receptores post_save/post_delete (signals.py).
+El comando `reindexar_busqueda` reconstruye todo.
+"""
+import re
+import unicodedata
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import DetalleIPER, FilaIPEREliminada, IndiceBusqueda, MatrizIPER, Normativa, Peligro
+
+TAMANO_LOTE = 500
+LIMITE_DEFECTO = 20
+LIMITE_MAXIMO = 50
+LARGO_EXTRACTO = 200
+TABLA_FTS = 'gestion_riesgos_indicebusqueda_fts'
+
+# Columnas de texto de la fila IPER que entran al índice
+CAMPOS_FILA = [
+    'proceso', 'puesto_trabajo', 'tarea', 'peligro_factor', 'riesgo', 'consecuencia',
+    'medida_control_actual', 'requisito_legal',
+]
+
+PALABRAS_VACIAS = {
+    'a', 'al', 'como', 'con', 'de', 'del', 'e', 'el', 'en', 'entre', 'es', 'la', 'las', 'lo',
+    'los', 'mas', 'ni', 'o', 'para', 'por', 'que', 'se', 'sin', 'sobre', 'su', 'sus', 'u',
+    'un', 'una', 'unas', 'unos', 'y',
+}
+# Sufijos derivativos, del más largo al más corto ("iluminacion" -> "ilumin",
+# "soldadura" -> "sold")
+SUFIJOS = (
+    'aciones', 'iciones', 'amientos', 'imientos', 'amiento', 'imiento', 'aduras', 'adores', 'adoras',
+    'acion', 'icion', 'adura', 'adora', 'ador', 'mente',
+)
+INFINITIVOS = ('ar', 'er', 'ir')
+VOCALES = 'aeiou'
+
+
+# --- 1. NORMALIZACIÓN ---
+
+def normalizar(texto):
+    """
+    Minúsculas, sin tildes ni diéresis y con las siglas con punto unidas
+    ('D.S. Eléctrico' -> 'ds electrico').
+    """
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+    return re.sub(r'\b([a-z])\.', r'\1', texto)
+
+
+def raiz(palabra):
+    """
+    Raíz liviana en español: quita sufijos derivativos comunes, el plural, la
+    vocal final de género y la terminación del infinitivo ('caídas' -> 'caid',
+    'soldar' -> 'sold'). Solo necesita ser consistente: índice y consulta pasan
+    por la misma función.
+    """
+    if len(palabra) <= 4 or palabra.isdigit():
+        return palabra
+    for sufijo in SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= 4:
+            return palabra[:-len(sufijo)]
+    if palabra.endswith('ces'):
+        palabra = palabra[:-3] + 'z'
+    elif palabra.endswith('es') and palabra[-3] not in VOCALES:
+        palabra = palabra[:-2]
+    elif palabra.endswith('s'):
+        palabra = palabra[:-1]
+    if len(palabra) > 4 and palabra[-1] in 'aoe':
+        palabra = palabra[:-1]
+    elif palabra.endswith(INFINITIVOS) and len(palabra) >= 6:
+        palabra = palabra[:-2]
+    return palabra
+
+
+def terminos(texto):
+    """Términos indexables del texto, en orden (con repeticiones)."""
+    return [
+        raiz(palabra) for palabra in re.findall(r'[a-z0-9]+', normalizar(texto))
+        if palabra not in PALABRAS_VACIAS and (len(palabra) > 1 or palabra.isdigit())
+    ]
+
+
+def _extracto(*partes):
+    texto = ' · '.join(parte.strip() for parte in partes if parte and parte.strip())
+    return texto[:LARGO_EXTRACTO]
+
+
+# --- 2. DOCUMENTOS ---
+
+def _documento_fila(fila, matriz_id, empresa_id):
+    valores = [fila[campo] for campo in CAMPOS_FILA]
+    return IndiceBusqueda(
+        tipo=IndiceBusqueda.FILA, objeto_id=fila['id'], empresa_id=empresa_id, matriz_id=matriz_id,
+        titulo=(fila['riesgo'] or fila['peligro_factor'] or fila['tarea'] or f"Fila {fila['id']}")[:255],
+        extracto=_extracto(fila['tarea'], fila['consecuencia'], fila['requisito_legal']),
+        texto=' '.join(terminos(' '.join(valor for valor in valores if valor))),
+    )
+
+
+def _documento_peligro(peligro):
+    return IndiceBusqueda(
+        tipo=IndiceBusqueda.PELIGRO, objeto_id=peligro.pk,
+        titulo=f"{peligro.codigo} {peligro.riesgo_especifico}"[:255],
+        extracto=_extracto(peligro.familia_riesgo, peligro.definicion),
+        texto=' '.join(terminos(' '.join(
+            [peligro.codigo, peligro.familia_riesgo, peligro.riesgo_especifico, peligro.definicion]))),
+    )
+
+
+def _documento_normativa(normativa):
+    return IndiceBusqueda(
+        tipo=IndiceBusqueda.NORMATIVA, objeto_id=normativa.pk,
+        titulo=normativa.nombre[:255],
+        extracto=_extracto(normativa.categoria, normativa.descripcion),
+        texto=' '.join(terminos(' '.join([normativa.nombre, normativa.categoria, normativa.descripcion]))),
+    )
+
+
+def _guardar(documentos):
+    """Inserta o reemplaza los documentos (un INSERT ... ON CONFLICT por lote)."""
+    IndiceBusqueda.objects.bulk_create(
+        documentos, batch_size=TAMANO_LOTE,
+        update_conflicts=True, unique_fields=['tipo', 'objeto_id'],
+        update_fields=['empresa', 'matriz', 'titulo', 'extracto', 'texto'],
+    )
+
+
+def _quitar(tipo, ids):
+    IndiceBusqueda.objects.filter(tipo=tipo, objeto_id__in=ids).delete()
+
+
+# --- 3. ACTUALIZACIÓN INCREMENTAL ---
+
+def sincronizar_matriz(matriz_id):
+    """
+    Lleva al índice las filas de la matriz cambiadas desde la última revisión
+    indexada y quita las eliminadas. Devuelve la cantidad de filas indexadas.
+    """
+    matriz = MatrizIPER.objects.filter(pk=matriz_id).values('empresa_id', 'revision', 'revision_indexada').first()
+    if matriz is None or matriz['revision'] <= matriz['revision_indexada']:
+        return 0
+    desde = matriz['revision_indexada']
+    filas = DetalleIPER.objects.filter(matriz_id=matriz_id, revision__gt=desde).order_by('id').values('id', *CAMPOS_FILA)
+    eliminadas = list(FilaIPEREliminada.objects.filter(matriz_id=matriz_id, revision__gt=desde)
+                      .values_list('fila_id', flat=True))
+
+    indexadas = 0
+    with transaction.atomic():
+        lote = []
+        for fila in filas.iterator(chunk_size=TAMANO_LOTE):
+            lote.append(_documento_fila(fila, matriz_id, matriz['empresa_id']))
+            if len(lote) == TAMANO_LOTE:
+                _guardar(lote)
+                indexadas += len(lote)
+                lote = []
+        _guardar(lote)
+        indexadas += len(lote)
+        _quitar(IndiceBusqueda.FILA, eliminadas)
+        # Nunca retrocede: otra sincronización pudo haber llegado más lejos
+        MatrizIPER.objects.filter(pk=matriz_id, revision_indexada__lt=matriz['revision'])\
+            .update(revision_indexada=matriz['revision'])
+    return indexadas
+
+
+def programar_sincronizacion(matriz_id):
+    """Sincroniza la matriz cuando se confirme la transacción en curso."""
+    transaction.on_commit(lambda: sincronizar_matriz(matriz_id))
+
+
+def peligro_guardado(sender, instance, **kwargs):
+    _guardar([_documento_peligro(instance)])
+
+
+def normativa_guardada(sender, instance, **kwargs):
+    _guardar([_documento_normativa(instance)])
+
+
+def peligro_eliminado(sender, instance, **kwargs):
+    _quitar(IndiceBusqueda.PELIGRO, [instance.pk])
+
+
+def normativa_eliminada(sender, instance, **kwargs):
+    _quitar(IndiceBusqueda.NORMATIVA, [instance.pk])
+
+
+def reindexar(matrices=None):
+    """
+    Reconstruye el índice: el catálogo completo y las filas de las matrices
+    del queryset (todas si es None). Devuelve la cantidad de documentos.
+    """
+    total = 0
+    if matrices is None:
+        matrices = MatrizIPER.objects.all()
+        with transaction.atomic():
+            IndiceBusqueda.objects.exclude(tipo=IndiceBusqueda.FILA).delete()
+            _guardar([_documento_peligro(peligro) for peligro in Peligro.objects.all()])
+            _guardar([_documento_normativa(normativa) for normativa in Normativa.objects.all()])
+        total += IndiceBusqueda.objects.exclude(tipo=IndiceBusqueda.FILA).count()
+
+    for matriz_id in matrices.order_by('pk').values_list('pk', flat=True):
+        with transaction.atomic():
+            IndiceBusqueda.objects.filter(tipo=IndiceBusqueda.FILA, matriz_id=matriz_id).delete()
+            MatrizIPER.objects.filter(pk=matriz_id).update(revision_indexada=0)
+        total += sincronizar_matriz(matriz_id)
+
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('optimize')")
+    return total
+
+
+# --- 4. CONSULTA ---
+
+def _ids_sqlite(documentos, consulta, limite):
+    expresion = ' '.join(f'{termino}*' for termino in consulta)
+    sql_alcance, params_alcance = documentos.values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        # "+rowid": el alcance se aplica sobre las coincidencias; sin el "+",
+        # SQLite lo pasa a FTS5 y ejecuta el MATCH una vez por cada id del alcance
+        cursor.execute(
+            f"SELECT rowid, -bm25({TABLA_FTS}) FROM {TABLA_FTS} "
+            f"WHERE {TABLA_FTS} MATCH %s AND +rowid IN ({sql_alcance}) "
+            f"ORDER BY bm25({TABLA_FTS}) LIMIT %s",
+            [expresion, *params_alcance, limite],
+        )
+        return cursor.fetchall()
+
+
+def _ids_postgresql(documentos, consulta, limite):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    # La misma expresión del índice GIN de la migración, para que lo use
+    vector = SearchVector('texto', config='simple')
+    expresion = SearchQuery(' & '.join(f'{termino}:*' for termino in consulta), config='simple', search_type='raw')
+    return list(
+        documentos.annotate(vector=vector, rango=SearchRank(vector, expresion))
+        .filter(vector=expresion).order_by('-rango').values_list('id', 'rango')[:limite]
+    )
+
+
+def buscar(usuario, texto, tipos=None, empresa_id=None, limite=LIMITE_DEFECTO):
+    """
+    Documentos que contienen todos los términos de `texto` (como prefijo),
+    del más al menos relevante. Las filas IPER se limitan a las empresas del
+    usuario; peligros y normativa son comunes. Devuelve [(documento, rango)].
+    """
+    consulta = list(dict.fromkeys(terminos(texto)))
+    if not consulta:
+        return []
+    documentos = IndiceBusqueda.objects.filter(Q(empresa__isnull=True) | Q(empresa__prevencionista=usuario))
+    if tipos:
+        documentos = documentos.filter(tipo__in=tipos)
+    if empresa_id:
+        documentos = documentos.filter(empresa_id=empresa_id)
+
+    buscar_ids = _ids_postgresql if connection.vendor == 'postgresql' else _ids_sqlite
+    rangos = dict(buscar_ids(documentos, consulta, limite))
+    encontrados = IndiceBusqueda.objects.filter(pk__in=rangos).select_related('matriz__empresa')
+    return sorted(((documento, rangos[documento.pk]) for documento in encontrados), key=lambda par: -par[1])
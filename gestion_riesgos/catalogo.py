@@ -0,0 +1,182 @@
+# gestion_riesgos/catalogo.py
+"""
+Autocompletado del catálogo de peligros (código, riesgo específico y
+familia) desde un índice en memoria.
+
+Cada proceso arma el índice una sola vez con una consulta y lo reutiliza
+mientras no cambie el catálogo. Las búsquedas se resuelven con operaciones de
+conjuntos, sin ir a la BD:
+- prefijos: cada palabra normalizada (sin tildes, minúsculas) aporta todos
+  sus prefijos, por campo, para priorizar el código y el riesgo específico;
+- trigramas: si una palabra no es prefijo de nada, se buscan los peligros
+  que la contienen en medio de otra ('caida' en 'sobrecaida').
+
+La vigencia se controla con una versión que sale de la BD (fecha del último
+cambio y cantidad de peligros), la misma para todos los procesos aunque la
+caché sea local: cada proceso la compara con la de su índice en cada
+consulta y, si difiere, vuelve a armarlo.
+"""
+import re
+import threading
+
+from django.db.models import Count, Max
+
+from .busqueda import normalizar
+from .models import Peligro
+
+LIMITE_DEFECTO = 10
+LIMITE_MAXIMO = 50
+# Los prefijos más largos se resuelven con este y se verifican contra la palabra
+LARGO_MAXIMO_PREFIJO = 12
+
+_indice = None
+_candado = threading.Lock()
+
+
+def _palabras(texto):
+    return re.findall(r'[a-z0-9]+', normalizar(texto))
+
+
+def _trigramas(palabra):
+    return {palabra[i:i + 3] for i in range(len(palabra) - 2)}
+
+
+# --- 1. ÍNDICE ---
+
+class IndicePeligros:
+    """
+    Peligros ordenados por código, con mapas prefijo -> posiciones por campo
+    y trigrama -> posiciones sobre el texto completo.
+    """
+
+    def __init__(self, peligros, version):
+        self.version = version
+        self.peligros = [
+            {'id': pk, 'codigo': codigo, 'familia_riesgo': familia, 'riesgo_especifico': especifico,
+             'texto': f"{especifico} ({codigo})"}
+            for pk, codigo, familia, especifico in peligros
+        ]
+        self.posicion = {peligro['id']: i for i, peligro in enumerate(self.peligros)}
+        self.palabras = []
+        self.codigo, self.riesgo, self.familia, self.trigramas = {}, {}, {}, {}
+        # Familias y palabras se repiten mucho en el catálogo: se normalizan
+        # y se descomponen una sola vez
+        palabras_de, prefijos_de, trigramas_de = {}, {}, {}
+
+        def palabras(texto):
+            if texto not in palabras_de:
+                palabras_de[texto] = _palabras(texto)
+            return palabras_de[texto]
+
+        def agregar(mapa, lista, posicion):
+            for palabra in lista:
+                if palabra not in prefijos_de:
+                    prefijos_de[palabra] = [palabra[:n] for n in range(1, min(len(palabra), LARGO_MAXIMO_PREFIJO) + 1)]
+                for prefijo in prefijos_de[palabra]:
+                    mapa.setdefault(prefijo, set()).add(posicion)
+
+        for i, peligro in enumerate(self.peligros):
+            codigo = palabras(peligro['codigo'])
+            riesgo = palabras(peligro['riesgo_especifico'])
+            familia = palabras(peligro['familia_riesgo'])
+            agregar(self.codigo, [''.join(codigo), *codigo], i)
+            agregar(self.riesgo, riesgo, i)
+            agregar(self.familia, familia, i)
+            todas = {''.join(codigo), *riesgo, *familia}
+            self.palabras.append(todas)
+            for palabra in todas:
+                if palabra not in trigramas_de:
+                    trigramas_de[palabra] = _trigramas(palabra)
+                for trigrama in trigramas_de[palabra]:
+                    self.trigramas.setdefault(trigrama, set()).add(i)
+
+    def _por_prefijo(self, mapa, termino):
+        posiciones = mapa.get(termino[:LARGO_MAXIMO_PREFIJO], set())
+        if len(termino) <= LARGO_MAXIMO_PREFIJO:
+            return posiciones
+        return {i for i in posiciones if any(p.startswith(termino) for p in self.palabras[i])}
+
+    def _por_subcadena(self, termino):
+        if len(termino) < 3:
+            return set()
+        grupos = sorted((self.trigramas.get(t, set()) for t in _trigramas(termino)), key=len)
+        candidatos = set.intersection(*grupos)
+        return {i for i in candidatos if any(termino in p for p in self.palabras[i])}
+
+    def buscar(self, texto, limite=LIMITE_DEFECTO):
+        """
+        Hasta `limite` peligros que coinciden con todas las palabras de
+        `texto`, por orden: código que empieza con la consulta, palabras del
+        riesgo específico, prefijos en cualquier campo y, al final, palabras
+        contenidas en medio de otras. Dentro de cada grupo, por código.
+        """
+        terminos = _palabras(texto)
+        if not terminos:
+            return self.peligros[:limite]
+
+        por_campo = [
+            [self._por_prefijo(mapa, t) for mapa in (self.codigo, self.riesgo, self.familia)]
+            for t in terminos
+        ]
+        grupos = [
+            self._por_prefijo(self.codigo, ''.join(terminos)),
+            set.intersection(*(riesgo for _, riesgo, _ in por_campo)),
+            set.intersection(*(set().union(*campos) for campos in por_campo)),
+        ]
+        resultado, vistos = [], set()
+        for grupo in grupos + [None]:
+            if grupo is None:
+                # Solo se recurre a los trigramas si los prefijos no alcanzan
+                grupo = set.intersection(*(
+                    set().union(*campos) | self._por_subcadena(t) for t, campos in zip(terminos, por_campo)
+                ))
+            for posicion in sorted(grupo - vistos):
+                resultado.append(self.peligros[posicion])
+                if len(resultado) >= limite:
+                    return resultado
+            vistos |= grupo
+        return resultado
+
+    def obtener(self, pk):
+        posicion = self.posicion.get(pk)
+        return None if posicion is None else self.peligros[posicion]
+
+
+# --- 2. VIGENCIA ---
+
+def version():
+    """
+    (último `actualizado`, cantidad) del catálogo: un alta o una edición
+    cambian la fecha y una baja, la cantidad. Una consulta agregada sobre un
+    campo indexado, sin leer las filas.
+    """
+    datos = Peligro.objects.aggregate(ultimo=Max('actualizado'), cantidad=Count('id'))
+    return datos['ultimo'], datos['cantidad']
+
+
+def indice():
+    """Índice vigente del proceso; lo reconstruye si cambió el catálogo."""
+    global _indice
+    actual = version()
+    if _indice is not None and _indice.version == actual:
+        return _indice
+    with _candado:
+        if _indice is None or _indice.version != actual:
+            # La versión se lee antes que el catálogo: un cambio posterior
+            # deja una versión más nueva y fuerza otra reconstrucción
+            filas = Peligro.objects.order_by('codigo').values_list('id', 'codigo', 'familia_riesgo', 'riesgo_especifico')
+            _indice = IndicePeligros(list(filas), actual)
+        return _indice
+
+
+def autocompletar(texto, limite=LIMITE_DEFECTO):
+    return indice().buscar(texto, limite)
+
+
+def etiqueta(pk):
+    """Texto de un peligro del catálogo para mostrar en el formulario ('' si no existe)."""
+    try:
+        peligro = indice().obtener(int(pk))
+    except (TypeError, ValueError):
+        return ''
+    return peligro['texto'] if peligro else ''
@@ -0,0 +1,145 @@
+# gestion_riesgos/difusion.py
+"""
+Difusión en vivo de los cambios de la Matriz IPER a los navegadores abiertos.
+
+Cada escritura confirmada publica un aviso {matriz, revisión} en un broker;
+las conexiones SSE suscritas a esa matriz lo reciben y envían al cliente las
+filas cambiadas desde la última revisión que le mandaron.
+
+El broker se elige con el setting IPER_BROKER (ruta a la clase). El local
+funciona dentro de un solo proceso, que es como corre el servidor ASGI por
+defecto y como corren los tests. Con varios workers, lo guardado en otro
+proceso no llega por el canal: la grilla sigue consultando /cambios cada
+minuto mientras el canal está abierto.
+"""
+import asyncio
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+BROKER_POR_DEFECTO = 'gestion_riesgos.difusion.BrokerLocal'
+
+# Comentario SSE periódico para que proxies no corten la conexión inactiva
+KEEPALIVE_SEGUNDOS = 20
+# Cada conexión se cierra a los pocos minutos; el navegador reconecta solo
+# enviando Last-Event-ID (la última revisión recibida), sin perder cambios
+DURACION_MAXIMA_SEGUNDOS = 300
+REINTENTO_MS = 3000
+
+
+class BrokerLocal:
+    """
+    Broker en memoria: una cola asyncio por suscriptor. publicar() puede
+    llamarse desde cualquier hilo (las vistas síncronas corren en un thread
+    pool); la entrega se agenda en el event loop de cada suscriptor.
+    """
+
+    def __init__(self):
+        self._suscriptores = {}  # canal -> {cola: loop}
+        self._lock = threading.Lock()
+
+    def suscribir(self, canal):
+        cola = asyncio.Queue()
+        with self._lock:
+            self._suscriptores.setdefault(canal, {})[cola] = asyncio.get_running_loop()
+        return cola
+
+    def desuscribir(self, canal, cola):
+        with self._lock:
+            colas = self._suscriptores.get(canal, {})
+            colas.pop(cola, None)
+            if not colas:
+                self._suscriptores.pop(canal, None)
+
+    def publicar(self, canal, mensaje):
+        with self._lock:
+            destinos = list(self._suscriptores.get(canal, {}).items())
+        for cola, loop in destinos:
+            try:
+                loop.call_soon_threadsafe(cola.put_nowait, mensaje)
+            except RuntimeError:
+                # El loop del suscriptor ya se cerró
+                self.desuscribir(canal, cola)
+
+    def total_suscriptores(self, canal):
+        with self._lock:
+            return len(self._suscriptores.get(canal, {}))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def obtener_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'IPER_BROKER', BROKER_POR_DEFECTO))()
+    return _broker
+
+
+def canal_matriz(matriz_id):
+    return f"iper:{matriz_id}"
+
+
+def publicar_cambio(matriz_id, revision):
+    """Avisa a los clientes de la matriz que existe la revisión `revision`."""
+    obtener_broker().publicar(canal_matriz(matriz_id), {'matriz_id': matriz_id, 'revision': revision})
+
+
+# --- FLUJO SSE ---
+
+def _evento_cambios(matriz_id, desde):
+    """
+    Arma el evento SSE con las filas cambiadas después de `desde`.
+    Devuelve (evento o None, revisión hasta la que quedó al día el cliente).
+    """
+    from .iper import CAMPOS_FILA, cambios_desde
+    from .models import MatrizIPER
+
+    matriz = MatrizIPER.objects.filter(pk=matriz_id).first()
+    if matriz is None:
+        return "event: eliminada\ndata: {}\n\n", desde
+    if matriz.revision <= desde:
+        return None, desde
+    data = cambios_desde(matriz, desde, CAMPOS_FILA)
+    data['desde'] = desde
+    data['revision'] = matriz.revision
+    contenido = json.dumps(data, cls=DjangoJSONEncoder)
+    return f"id: {matriz.revision}\nevent: cambios\ndata: {contenido}\n\n", matriz.revision
+
+
+async def flujo_eventos(matriz_id, desde):
+    """
+    Generador asíncrono de eventos SSE para una matriz. Se suscribe antes de
+    la primera consulta, así ningún cambio queda entre medio.
+    """
+    broker = obtener_broker()
+    canal = canal_matriz(matriz_id)
+    cola = broker.suscribir(canal)
+    loop = asyncio.get_running_loop()
+    fin = loop.time() + DURACION_MAXIMA_SEGUNDOS
+    try:
+        yield f"retry: {REINTENTO_MS}\n\n"
+        pendiente = True  # al conectar se envía lo que el cliente no alcanzó a ver
+        while loop.time() < fin:
+            if not pendiente:
+                try:
+                    await asyncio.wait_for(cola.get(), timeout=KEEPALIVE_SEGUNDOS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+            # Varios avisos acumulados se resuelven con una sola consulta
+            while not cola.empty():
+                cola.get_nowait()
+            pendiente = False
+            evento, desde = await sync_to_async(_evento_cambios)(matriz_id, desde)
+            if evento:
+                yield evento
+    finally:
+        broker.desuscribir(canal, cola)
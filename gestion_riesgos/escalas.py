@@ -0,0 +1,107 @@
+# gestion_riesgos/escalas.py
+"""
+Escalas de valoración configurables de la Matriz IPER.
+
+Cada EscalaValoracion se compila en una TablaValoracion (valoracion.py) y se
+guarda en la caché con su fecha de actualización en la clave: cada guardado
+de una fila solo lee el id y la fecha de la escala de su empresa, y un
+cambio hecho en otro proceso se nota aunque la caché sea local. Una empresa
+sin escala usa la predeterminada de la BD y, si no hay, la escala estándar.
+
+Cambiar una escala (o la de una empresa) recalcula sus filas con un único
+UPDATE ... CASE por escala, sin guardar fila por fila, y reconstruye los
+resúmenes de las matrices afectadas.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import resumen, valoracion
+from .models import DetalleIPER, EscalaValoracion, MatrizIPER
+
+CACHE_SEGUNDOS = 60 * 60
+
+
+def _clave(escala_id, actualizada):
+    return f"escala_valoracion:{escala_id}:{actualizada.timestamp() * 1e6:.0f}"
+
+
+def compilar(escala):
+    niveles = [
+        (nivel.valor_minimo, nivel.clasificacion, nivel.color, nivel.color_texto)
+        for nivel in escala.niveles.all()
+    ]
+    if not niveles:
+        return valoracion.TABLA_IPER
+    return valoracion.TablaValoracion(niveles, version=f"{escala.pk}-{escala.actualizada.timestamp() * 1e6:.0f}")
+
+
+def tabla_de_escala(escala_id=None):
+    """TablaValoracion de la escala (None = la que rige para empresas sin escala)."""
+    consulta = EscalaValoracion.objects.filter(**({'pk': escala_id} if escala_id else {'predeterminada': True}))
+    vigente = consulta.values_list('pk', 'actualizada').first()
+    if vigente is None:
+        return valoracion.TABLA_IPER
+    clave = _clave(*vigente)
+    tabla = cache.get(clave)
+    if tabla is None:
+        escala = EscalaValoracion.objects.prefetch_related('niveles').filter(pk=vigente[0]).first()
+        tabla = compilar(escala) if escala else valoracion.TABLA_IPER
+        cache.set(clave, tabla, CACHE_SEGUNDOS)
+    return tabla
+
+
+def tabla_de_empresa(empresa):
+    return tabla_de_escala(empresa.escala_valoracion_id)
+
+
+def tabla_de_matriz(matriz_id):
+    escala_id = MatrizIPER.objects.filter(pk=matriz_id).values_list('empresa__escala_valoracion', flat=True).first()
+    return tabla_de_escala(escala_id)
+
+
+# --- RECÁLCULO AL CAMBIAR UNA ESCALA ---
+
+def _recalcular(filtro_matrices):
+    matrices = MatrizIPER.objects.filter(filtro_matrices)
+    with transaction.atomic():
+        actualizadas = DetalleIPER.objects.filter(matriz__in=matrices).recalcular_valoracion()
+        resumen.recalcular_matrices(matrices)
+    return actualizadas
+
+
+def aplicar_escala(escala):
+    """
+    Tras modificar una escala (o sus niveles): marca la nueva versión (la
+    tabla compilada antes deja de coincidir con la clave de caché) y
+    recalcula las filas de las empresas que la usan, incluidas las que no
+    tienen escala si es la predeterminada. Devuelve las filas actualizadas.
+    """
+    EscalaValoracion.objects.filter(pk=escala.pk).update(actualizada=timezone.now())
+    filtro = Q(empresa__escala_valoracion=escala)
+    if escala.predeterminada:
+        filtro |= Q(empresa__escala_valoracion__isnull=True)
+    return _recalcular(filtro)
+
+
+def aplicar_predeterminada():
+    """Recalcula las empresas sin escala (cambió cuál es la predeterminada)."""
+    return _recalcular(Q(empresa__escala_valoracion__isnull=True))
+
+
+def aplicar_a_empresa(empresa):
+    """Recalcula las matrices de una empresa que cambió de escala."""
+    return _recalcular(Q(empresa=empresa))
+
+
+def eliminar_escala(escala):
+    """Elimina la escala; sus empresas pasan a la predeterminada y se recalculan."""
+    empresas = list(escala.empresas.values_list('pk', flat=True))
+    era_predeterminada = escala.predeterminada
+    with transaction.atomic():
+        escala.delete()
+        filtro = Q(empresa__in=empresas)
+        if era_predeterminada:
+            filtro |= Q(empresa__escala_valoracion__isnull=True)
+        return _recalcular(filtro)
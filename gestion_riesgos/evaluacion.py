@@ -0,0 +1,136 @@
+# gestion_riesgos/evaluacion.py
+"""
+Motor de evaluación vectorizado (NumPy) para matrices completas.
+
+Carga las columnas de probabilidad/consecuencia (o P/S en la IPER) de todas
+las filas de un queryset en arreglos y calcula en una sola pasada cada VEP,
+el inherente máximo, el residual, el especial y sus clasificaciones. Los
+resultados quedan alineados con `ids`. Como no instancia modelos, evaluar
+una matriz grande cuesta una fracción de recorrer sus filas en Python; lo
+usan los reportes, el mapa de calor y la verificación de valores almacenados.
+"""
+import numpy as np
+
+from . import escalas, valoracion
+from .models import DetalleIPER, Riesgo
+
+
+def _columnas(queryset, campos):
+    """values_list -> dict campo: arreglo float (None pasa a NaN)."""
+    filas = list(queryset.order_by('id').values_list('id', *campos))
+    if not filas:
+        return np.empty(0, dtype=np.int64), {campo: np.empty(0) for campo in campos}
+    datos = np.array(filas, dtype=float)  # None -> NaN
+    return datos[:, 0].astype(np.int64), {campo: datos[:, i + 1] for i, campo in enumerate(campos)}
+
+
+def evaluar_columnas_riesgo(columnas):
+    """
+    Evalúa columnas ya cargadas ({campo: arreglo}) de Riesgo. Devuelve un dict
+    con los mismos nombres que los campos calculados del modelo
+    (valor_vep_*, clasificacion_riesgo_*); los VEP vacíos son NaN.
+    """
+    resultado = {}
+    for nombre, (campo_p, campo_c) in Riesgo.EVALUACIONES_VEP.items():
+        veps = valoracion.vep_arrays(columnas[campo_p], columnas[campo_c])
+        resultado[f'valor_vep_{nombre}'] = veps
+        resultado[f'clasificacion_riesgo_{nombre}'] = valoracion.clasificar_vep_arrays(veps)
+
+    inherentes = np.vstack([resultado[f'valor_vep_{nombre}'] for nombre in Riesgo.CATEGORIAS_INHERENTES])
+    # fmax ignora NaN; una columna completamente vacía queda en NaN
+    maximo = np.fmax.reduce(inherentes, axis=0) if inherentes.shape[1] else np.empty(0)
+    resultado['valor_vep_inherente_maximo'] = maximo
+    resultado['clasificacion_riesgo_inherente_maximo'] = valoracion.clasificar_vep_arrays(maximo)
+    return resultado
+
+
+def evaluar_riesgos(queryset=None):
+    """Evalúa todos los Riesgo del queryset. Devuelve (ids, resultado)."""
+    queryset = Riesgo.objects.all() if queryset is None else queryset
+    campos = [campo for par in Riesgo.EVALUACIONES_VEP.values() for campo in par]
+    ids, columnas = _columnas(queryset, campos)
+    return ids, evaluar_columnas_riesgo(columnas)
+
+
+def ejes_riesgos(queryset):
+    """
+    P y C que ubican cada Riesgo en el mapa de calor. El inherente usa los de
+    la categoría con mayor VEP (la primera si empatan); el residual, los
+    propios. Devuelve (ids, {'inherente': (p, c), 'residual': (p, c)}), con
+    NaN donde no hay evaluación.
+    """
+    pares = [Riesgo.EVALUACIONES_VEP[nombre] for nombre in Riesgo.CATEGORIAS_INHERENTES]
+    residual = Riesgo.EVALUACIONES_VEP['residual']
+    campos = [campo for par in [*pares, residual] for campo in par]
+    ids, columnas = _columnas(queryset, campos)
+
+    veps = np.vstack([valoracion.vep_arrays(columnas[p], columnas[c]) for p, c in pares])
+    dominante = np.argmax(np.nan_to_num(veps, nan=-1), axis=0)
+    filas = np.arange(len(ids))
+    sin_evaluar = np.isnan(veps).all(axis=0)
+    inherente = []
+    for eje in (0, 1):
+        valores = np.vstack([columnas[par[eje]] for par in pares])[dominante, filas]
+        inherente.append(np.where(sin_evaluar, np.nan, valores))
+
+    return ids, {
+        'inherente': tuple(inherente),
+        'residual': (columnas[residual[0]], columnas[residual[1]]),
+    }
+
+
+def evaluar_detalles(queryset):
+    """
+    Evalúa P x S (pura y residual) de las filas IPER del queryset, cada una con
+    la escala de valoración de su empresa. Devuelve (ids, resultado).
+    """
+    campos = ['eval_probabilidad', 'eval_severidad', 'residual_probabilidad', 'residual_severidad',
+              'matriz__empresa__escala_valoracion']
+    ids, columnas = _columnas(queryset, campos)
+    escala_fila = columnas.pop('matriz__empresa__escala_valoracion')
+    # Una pasada vectorizada por escala presente (NaN = empresa sin escala)
+    grupos = [(None, np.isnan(escala_fila))]
+    grupos += [(int(e), escala_fila == e) for e in np.unique(escala_fila[~np.isnan(escala_fila)])]
+
+    resultado = {}
+    for prefijo in ('eval', 'residual'):
+        valores = np.zeros(len(ids), dtype=np.int64)
+        clasificaciones = np.empty(len(ids), dtype=object)
+        for escala_id, filas in grupos:
+            if not filas.any():
+                continue
+            valores[filas], clasificaciones[filas] = escalas.tabla_de_escala(escala_id).valorar_arrays(
+                columnas[f'{prefijo}_probabilidad'][filas], columnas[f'{prefijo}_severidad'][filas])
+        resultado[f'{prefijo}_valor'] = valores
+        resultado[f'{prefijo}_clasificacion'] = clasificaciones
+    return ids, resultado
+
+
+def conteo_por_clasificacion(clasificaciones):
+    """{clasificación: cantidad} de un arreglo de clasificaciones."""
+    nombres, cantidades = np.unique(np.asarray(clasificaciones), return_counts=True)
+    return dict(zip(nombres.tolist(), cantidades.tolist()))
+
+
+def diferencias(queryset, ids, resultado):
+    """
+    Compara lo calculado con lo almacenado y devuelve los ids cuyas columnas
+    calculadas no coinciden (p. ej. filas editadas por SQL directo).
+    """
+    campos = list(resultado)
+    almacenado = {fila[0]: fila[1:] for fila in queryset.values_list('id', *campos)}
+    distintos = []
+    for i, pk in enumerate(ids.tolist()):
+        actual = almacenado.get(pk)
+        if actual is None:
+            continue
+        for campo, valor_guardado in zip(campos, actual):
+            esperado = resultado[campo][i]
+            if isinstance(esperado, (float, np.floating)):
+                esperado = None if np.isnan(esperado) else int(esperado)
+            else:
+                esperado = esperado.item() if hasattr(esperado, 'item') else esperado
+            if esperado != valor_guardado:
+                distintos.append(pk)
+                break
+    return distintos
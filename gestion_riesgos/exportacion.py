@@ -0,0 +1,103 @@
+# gestion_riesgos/exportacion.py
+"""
+Exportación de una Matriz IPER a CSV o Excel (.xlsx) con memoria constante.
+
+Las filas se leen con .iterator(chunk_size=...) y se escriben a medida que
+llegan, así el consumo de memoria no depende del tamaño de la matriz.
+"""
+import csv
+import tempfile
+
+from openpyxl import Workbook
+
+TAMANO_BLOQUE = 2000
+
+# Columnas en el mismo orden que la grilla; los encabezados son los verbose_name,
+# de modo que el archivo exportado se puede volver a importar tal cual.
+CAMPOS_EXPORTACION = [
+    'proceso', 'genero', 'puesto_trabajo', 'tarea', 'tipo_rutina',
+    'codigo_riesgo', 'peligro_factor', 'riesgo', 'consecuencia', 'gema',
+    'medida_control_actual',
+    'eval_probabilidad', 'eval_severidad', 'eval_valor', 'eval_clasificacion',
+    'requisito_legal', 'responsable_ejecucion', 'responsable_seguimiento',
+    'residual_probabilidad', 'residual_severidad', 'residual_valor', 'residual_clasificacion',
+    'condicion_especial', 'reevaluacion',
+]
+
+
+def encabezados_columnas():
+    from .models import DetalleIPER
+    return ['#'] + [str(DetalleIPER._meta.get_field(campo).verbose_name) for campo in CAMPOS_EXPORTACION]
+
+
+def filas_encabezado(matriz, url_logo=None):
+    """Bloque superior del Excel: datos del documento y responsables."""
+    return [
+        ['MATRIZ IPER', 'Identificación de Peligros y Evaluación de Riesgos'],
+        ['Empresa', matriz.empresa.razon_social],
+        ['Departamento o Sucursal', matriz.departamento_sucursal or ''],
+        ['Proyecto', matriz.proyecto or ''],
+        ['Código', matriz.codigo_documento or ''],
+        ['Revisión/Versión', matriz.version or ''],
+        ['Fecha del Documento', matriz.fecha_documento.isoformat() if matriz.fecha_documento else ''],
+        ['Elaborado por', matriz.elaborado_por or '', matriz.cargo_elabora or ''],
+        ['Revisado por', matriz.revisado_por or '', matriz.cargo_revisa or ''],
+        ['Aprobado por', matriz.aprobado_por or '', matriz.cargo_aprueba or ''],
+        ['Logo Cliente', url_logo or ''],
+        [],
+    ]
+
+
+def iterar_filas(matriz):
+    """Genera las filas de la matriz numeradas, sin cargarlas todas en memoria."""
+    filas = matriz.filas.order_by('id').values_list(*CAMPOS_EXPORTACION).iterator(chunk_size=TAMANO_BLOQUE)
+    for numero, fila in enumerate(filas, start=1):
+        yield [numero, *('' if valor is None else valor for valor in fila)]
+
+
+# --- CSV ---
+
+class _Eco:
+    """Pseudo-archivo: csv.writer escribe aquí y recibimos la línea para emitirla."""
+
+    def write(self, valor):
+        return valor
+
+
+def generar_csv(matriz, url_logo=None):
+    """Generador de líneas CSV (separador ';' y BOM, como lo abre Excel en español)."""
+    escritor = csv.writer(_Eco(), delimiter=';')
+    encabezados = encabezados_columnas()
+    yield '\ufeff'
+    # Todas las líneas con el mismo número de columnas, para que el archivo sea rectangular
+    for fila in filas_encabezado(matriz, url_logo):
+        yield escritor.writerow(fila + [''] * (len(encabezados) - len(fila)))
+    yield escritor.writerow(encabezados)
+    for fila in iterar_filas(matriz):
+        yield escritor.writerow(fila)
+
+
+# --- EXCEL ---
+
+def generar_xlsx(matriz, url_logo=None):
+    """
+    Escribe la matriz en un .xlsx con openpyxl en modo write_only (las filas se
+    vuelcan a disco a medida que se agregan) y devuelve el archivo temporal,
+    listo para enviarse en bloques con FileResponse.
+
+    Desde openpyxl 3.1 (fijado en requirements.txt) el modo write_only escribe
+    los textos en línea (t="inlineStr") y no arma la tabla de textos
+    compartidos, que crecería con cada texto distinto de la matriz.
+    """
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet('IPER')
+    for fila in filas_encabezado(matriz, url_logo):
+        hoja.append(fila)
+    hoja.append(encabezados_columnas())
+    for fila in iterar_filas(matriz):
+        hoja.append(fila)
+
+    archivo = tempfile.TemporaryFile(suffix='.xlsx')
+    libro.save(archivo)
+    archivo.seek(0)
+    return archivo
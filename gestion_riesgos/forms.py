@@ -1,18 +1,22 @@
 # gestion_riesgos/forms.py
 
 from django import forms
+from django.urls import reverse_lazy
+
+from . import catalogo
 from .models import Empresa, Matriz, Proceso, Tarea, Riesgo, Documento, Peligro, MatrizIPER
 
 radio_widget = forms.RadioSelect(attrs={'class': 'form-check-input'})
 class EmpresaForm(forms.ModelForm):
     class Meta:
         model = Empresa
-        fields = ['razon_social', 'rut', 'direccion', 'telefono']
+        fields = ['razon_social', 'rut', 'direccion', 'telefono', 'escala_valoracion']
         widgets = {
             'razon_social': forms.TextInput(attrs={'class': 'form-control'}),
             'rut': forms.TextInput(attrs={'class': 'form-control'}),
             'direccion': forms.TextInput(attrs={'class': 'form-control'}),
             'telefono': forms.TextInput(attrs={'class': 'form-control'}),
+            'escala_valoracion': forms.Select(attrs={'class': 'form-select'}),
         }
 
 class MatrizForm(forms.ModelForm):
@@ -49,6 +53,22 @@ class TareaForm(forms.ModelForm):
             'genero_mujeres': forms.NumberInput(attrs={'class': 'form-control', 'min': 0}),
         }
 
+class PeligroAutocompleteWidget(forms.Widget):
+    """
+    Campo de texto con sugerencias del catálogo (api/peligros/autocompletar/)
+    y un input oculto con el id del peligro elegido. A diferencia de un
+    Select, no escribe el catálogo completo en la página.
+    """
+    template_name = 'partials/peligro_autocomplete.html'
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        # El texto del peligro ya elegido sale del índice en memoria, sin consulta
+        context['widget']['etiqueta'] = catalogo.etiqueta(value) if value else ''
+        context['widget']['url'] = reverse_lazy('peligro_autocompletar')
+        return context
+
+
 class RiesgoForm(forms.ModelForm):
     
     # --- NUEVO CAMPO AÑADIDO ---
@@ -65,7 +85,7 @@ class RiesgoForm(forms.ModelForm):
         # --- CAMPO IPER AÑADIDO ---
         fields = ['peligro', 'consecuencias', 'identificacion_gema']
         widgets = {
-            'peligro': forms.Select(attrs={'class': 'form-control'}),
+            'peligro': PeligroAutocompleteWidget(attrs={'class': 'form-control', 'placeholder': 'Escriba el código o el nombre del peligro...'}),
             'consecuencias': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
             # --- CAMPO IPER AÑADIDO ---
             'identificacion_gema': forms.Select(attrs={'class': 'form-control'}),
@@ -197,6 +217,27 @@ class MatrizIPERForm(forms.ModelForm):
             'cargo_aprueba': forms.TextInput(attrs={'class': 'form-control-modern'}),
         }
 
+class ImportarIPERForm(forms.Form):
+    """Carga de una planilla IPER existente (Excel o CSV) como nueva matriz."""
+    archivo = forms.FileField(
+        label="Planilla IPER",
+        help_text="Archivo .xlsx o .csv con la hoja IPER. Las columnas se reconocen por su encabezado.",
+        widget=forms.FileInput(attrs={'class': 'form-control', 'accept': '.xlsx,.xlsm,.csv'}),
+    )
+    codigo_documento = forms.CharField(
+        label="Código", max_length=50, required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ej: IPER-001'}),
+    )
+    proyecto = forms.CharField(
+        max_length=255, required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control'}),
+    )
+    omitir_errores = forms.BooleanField(
+        label="Importar solo las filas válidas", required=False,
+        help_text="Si se marca, las filas con errores se omiten en lugar de cancelar la importación.",
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
+
 class PeligroForm(forms.ModelForm):
     class Meta:
         model = Peligro
@@ -0,0 +1,150 @@
+# gestion_riesgos/historial.py
+"""
+Historial de cambios de la Matriz IPER y reconstrucción de versiones pasadas.
+
+Cada escritura de la grilla agrega entradas compactas a CambioIPER (solo la
+celda tocada, con valor anterior y nuevo) dentro de la misma transacción.
+Cada CAMBIOS_POR_SNAPSHOT cambios se guarda una foto comprimida de la matriz
+(SnapshotIPER); para ver la matriz en una fecha se parte de la foto anterior
+más cercana y se aplican solo los cambios posteriores.
+"""
+import json
+import zlib
+
+from django.db.models import Max
+from django.utils import timezone
+
+from . import escalas
+from .models import CambioIPER, DetalleIPER, SnapshotIPER
+
+# Cantidad de cambios entre una foto y la siguiente
+CAMBIOS_POR_SNAPSHOT = 500
+
+# Columnas que se guardan en el historial (todas las de la grilla)
+CAMPOS_HISTORIAL = [
+    campo.name for campo in DetalleIPER._meta.concrete_fields
+    if campo.name not in ('id', 'matriz', 'revision')
+]
+
+
+def _usuario(usuario):
+    return usuario if usuario is not None and usuario.is_authenticated else None
+
+
+def valores_fila(detalle):
+    """Fila como dict campo -> valor, con solo las columnas no vacías."""
+    valores = {campo: getattr(detalle, campo) for campo in CAMPOS_HISTORIAL}
+    return {campo: valor for campo, valor in valores.items() if valor not in (None, '')}
+
+
+# --- 1. FOTOS (SNAPSHOTS) ---
+
+def tomar_snapshot(matriz_id, revision):
+    """Guarda el estado actual de las filas de la matriz, comprimido."""
+    filas = DetalleIPER.objects.filter(matriz_id=matriz_id).order_by('id').values_list('id', *CAMPOS_HISTORIAL)
+    filas = list(filas.iterator(chunk_size=2000))
+    contenido = json.dumps({'campos': CAMPOS_HISTORIAL, 'filas': filas}, separators=(',', ':'))
+    return SnapshotIPER.objects.create(
+        matriz_id=matriz_id,
+        revision=revision,
+        total_filas=len(filas),
+        datos=zlib.compress(contenido.encode('utf-8')),
+    )
+
+
+def leer_snapshot(snapshot):
+    """Devuelve {fila_id: {campo: valor}} a partir de la foto."""
+    contenido = json.loads(zlib.decompress(bytes(snapshot.datos)).decode('utf-8'))
+    campos = contenido['campos']
+    return {fila[0]: dict(zip(campos, fila[1:])) for fila in contenido['filas']}
+
+
+def asegurar_base(matriz_id, revision_actual):
+    """
+    Antes del primer cambio registrado de una matriz se guarda una foto de su
+    estado actual: es el punto de partida para reconstruir versiones.
+    Debe llamarse dentro de la transacción y antes de modificar las filas.
+    """
+    if not SnapshotIPER.objects.filter(matriz_id=matriz_id).exists():
+        tomar_snapshot(matriz_id, revision_actual)
+
+
+# --- 2. REGISTRO DE CAMBIOS ---
+
+def creacion(detalle):
+    return {'fila_id': detalle.pk, 'tipo': CambioIPER.CREACION, 'valor_nuevo': valores_fila(detalle)}
+
+
+def edicion(detalle, campo, anterior):
+    return {
+        'fila_id': detalle.pk, 'tipo': CambioIPER.EDICION, 'campo': campo,
+        'valor_anterior': anterior, 'valor_nuevo': getattr(detalle, campo),
+    }
+
+
+def eliminacion(detalle):
+    return {'fila_id': detalle.pk, 'tipo': CambioIPER.ELIMINACION, 'valor_anterior': valores_fila(detalle)}
+
+
+def registrar(matriz_id, revision, cambios, usuario=None):
+    """
+    Agrega los cambios al historial. `cambios` es una lista de dicts con
+    fila_id, tipo y opcionalmente campo, valor_anterior y valor_nuevo.
+    Si se acumularon suficientes cambios desde la última foto, se toma otra,
+    por eso debe llamarse después de escribir las filas.
+    """
+    if not cambios:
+        return
+    usuario = _usuario(usuario)
+    fecha = timezone.now()
+    CambioIPER.objects.bulk_create([
+        CambioIPER(matriz_id=matriz_id, revision=revision, usuario=usuario, fecha=fecha, **cambio)
+        for cambio in cambios
+    ])
+
+    ultima = SnapshotIPER.objects.filter(matriz_id=matriz_id).aggregate(r=Max('revision'))['r'] or 0
+    pendientes = CambioIPER.objects.filter(matriz_id=matriz_id, revision__gt=ultima).count()
+    if pendientes >= CAMBIOS_POR_SNAPSHOT:
+        tomar_snapshot(matriz_id, revision)
+
+
+# --- 3. RECONSTRUCCIÓN ---
+
+def aplicar_cambio(estado, cambio):
+    if cambio.tipo == CambioIPER.CREACION:
+        estado[cambio.fila_id] = dict(cambio.valor_nuevo or {})
+    elif cambio.tipo == CambioIPER.ELIMINACION:
+        estado.pop(cambio.fila_id, None)
+    else:
+        estado.setdefault(cambio.fila_id, {})[cambio.campo] = cambio.valor_nuevo
+
+
+def reconstruir(matriz, fecha):
+    """
+    Devuelve las filas de la matriz tal como estaban en `fecha`, ordenadas por
+    id, o None si la fecha es anterior al inicio del historial de la matriz.
+    """
+    if fecha < matriz.fecha_creacion:
+        return []
+    snapshot = matriz.snapshots.filter(fecha__lte=fecha).order_by('-revision').first()
+    if snapshot is None:
+        return None
+
+    estado = leer_snapshot(snapshot)
+    cambios = matriz.cambios.filter(revision__gt=snapshot.revision, fecha__lte=fecha).order_by('id')
+    for cambio in cambios.iterator(chunk_size=2000):
+        aplicar_cambio(estado, cambio)
+
+    tabla = escalas.tabla_de_matriz(matriz.pk)
+    filas = []
+    for fila_id in sorted(estado):
+        fila = {campo: None for campo in CAMPOS_HISTORIAL}
+        fila.update(estado[fila_id])
+        fila['id'] = fila_id
+        # Valor y clasificación no se registran: se derivan de P y S
+        fila['eval_valor'], fila['eval_clasificacion'] = tabla.valorar(
+            fila['eval_probabilidad'], fila['eval_severidad'])
+        fila['residual_valor'], fila['residual_clasificacion'] = tabla.valorar(
+            fila['residual_probabilidad'], fila['residual_severidad'])
+        filas.append(fila)
+    return filas
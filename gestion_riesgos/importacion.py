@@ -0,0 +1,297 @@
+# gestion_riesgos/importacion.py
+"""
+Importación masiva de matrices IPER desde planillas Excel (.xlsx) o CSV.
+
+La planilla se lee completa con pandas, se normaliza y valida por columnas
+(sin recorrer celda por celda) y las filas se insertan con bulk_create por
+lotes, dentro de una sola transacción.
+"""
+import csv
+import io
+import re
+import unicodedata
+import zipfile
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from openpyxl.utils.exceptions import InvalidFileException
+
+from . import escalas, historial, resumen, valoracion
+from .iper import nueva_revision
+from .models import DetalleIPER, MatrizIPER
+
+TAMANO_LOTE = 500
+
+# Filas iniciales donde se busca la fila de encabezados (bajo el bloque de títulos del Excel)
+FILAS_BUSQUEDA_ENCABEZADO = 30
+MIN_COLUMNAS_RECONOCIDAS = 3
+
+# Valores permitidos en la grilla
+VALORES_PROBABILIDAD = [1, 2, 4]
+VALORES_SEVERIDAD = [1, 2, 4, 8]
+CAMPOS_NUMERICOS = {
+    'eval_probabilidad': VALORES_PROBABILIDAD,
+    'eval_severidad': VALORES_SEVERIDAD,
+    'residual_probabilidad': VALORES_PROBABILIDAD,
+    'residual_severidad': VALORES_SEVERIDAD,
+}
+
+# Valor y clasificación se recalculan siempre; lo que traiga la planilla se ignora
+CAMPOS_CALCULADOS = {
+    campo for derivados in DetalleIPER.CAMPOS_VALORACION.values() for campo in derivados
+}
+
+# Encabezados habituales en las planillas de clientes (ya normalizados)
+ALIAS_ENCABEZADOS = {
+    'peligro': 'peligro_factor',
+    'factor de riesgo': 'peligro_factor',
+    'peligro factor de riesgo': 'peligro_factor',
+    'consecuencia': 'consecuencia',
+    'medida de control': 'medida_control_actual',
+    'medidas de control': 'medida_control_actual',
+    'medidas de control existentes': 'medida_control_actual',
+    'rutina': 'tipo_rutina',
+    'rutinaria': 'tipo_rutina',
+    'puesto': 'puesto_trabajo',
+    'cod': 'codigo_riesgo',
+    'codigo': 'codigo_riesgo',
+    'probabilidad': 'eval_probabilidad',
+    'severidad': 'eval_severidad',
+    'p r': 'residual_probabilidad',
+    's r': 'residual_severidad',
+    'probabilidad residual': 'residual_probabilidad',
+    'severidad residual': 'residual_severidad',
+    'responsable ejecucion': 'responsable_ejecucion',
+    'responsable seguimiento': 'responsable_seguimiento',
+    'condicion especial inclusion': 'condicion_especial',
+    'observaciones': 'reevaluacion',
+}
+
+# Si un encabezado de evaluación aparece dos veces (P, S...), la segunda es la residual
+SEGUNDA_APARICION = {
+    'eval_probabilidad': 'residual_probabilidad',
+    'eval_severidad': 'residual_severidad',
+    'eval_valor': 'residual_valor',
+    'eval_clasificacion': 'residual_clasificacion',
+}
+
+# Valores canónicos de las listas desplegables de la grilla
+OPCIONES = {
+    'genero': {'hombre': 'Hombre', 'mujer': 'Mujer', 'ambos': 'Ambos', 'otro': 'Otro'},
+    'tipo_rutina': {'rutinaria': 'Rutinaria', 'no rutinaria': 'No Rutinaria', 'emergencia': 'Emergencia'},
+    'gema': {
+        'g': 'Gente', 'gente': 'Gente', 'e': 'Equipo', 'equipo': 'Equipo',
+        'm': 'Material', 'material': 'Material', 'a': 'Ambiente', 'ambiente': 'Ambiente',
+    },
+}
+
+
+class ErrorImportacion(Exception):
+    """Error que impide importar la planilla; `errores` detalla los problemas por fila."""
+
+    def __init__(self, mensaje, errores=None):
+        super().__init__(mensaje)
+        self.errores = errores or []
+
+
+def normalizar_encabezado(texto):
+    """'Medida Control Actual' -> 'medida control actual' (sin tildes ni signos)."""
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    return re.sub(r'[^a-z0-9]+', ' ', texto).strip()
+
+
+def _mapa_encabezados():
+    mapa = {}
+    for campo in DetalleIPER._meta.concrete_fields:
+        if campo.name in ('id', 'matriz', 'revision'):
+            continue
+        mapa[normalizar_encabezado(campo.name)] = campo.name
+        mapa[normalizar_encabezado(campo.verbose_name)] = campo.name
+    mapa.update(ALIAS_ENCABEZADOS)
+    return mapa
+
+
+MAPA_ENCABEZADOS = _mapa_encabezados()
+
+
+# --- 1. LECTURA ---
+
+# Lo que pandas/openpyxl levantan con un archivo dañado, vacío o que no es lo que dice su extensión
+ERRORES_LECTURA = (
+    csv.Error, zipfile.BadZipFile, InvalidFileException, KeyError, ValueError, UnicodeDecodeError,
+    pd.errors.ParserError, pd.errors.EmptyDataError,
+)
+
+
+def leer_planilla(archivo):
+    """Lee la planilla sin encabezados (todo como texto/objeto) en un DataFrame."""
+    nombre = getattr(archivo, 'name', '').lower()
+    if not nombre.endswith(('.xlsx', '.xlsm', '.csv', '.txt')):
+        raise ErrorImportacion("Formato no soportado. Suba un archivo .xlsx o .csv.")
+    try:
+        return _leer(archivo, nombre)
+    except pd.errors.EmptyDataError:
+        raise ErrorImportacion("El archivo está vacío.")
+    except ERRORES_LECTURA:
+        raise ErrorImportacion(
+            "No se pudo leer el archivo. Verifique que sea una planilla .xlsx o .csv válida y no esté dañada."
+        )
+
+
+def _leer(archivo, nombre):
+    if nombre.endswith(('.xlsx', '.xlsm')):
+        libro = pd.ExcelFile(archivo, engine='openpyxl')
+        # Las planillas del ISP traen varias hojas; la matriz está en 'IPER'
+        hoja = next((h for h in libro.sheet_names if normalizar_encabezado(h) == 'iper'), libro.sheet_names[0])
+        return libro.parse(hoja, header=None, dtype=object)
+    if nombre.endswith(('.csv', '.txt')):
+        contenido = archivo.read()
+        if not contenido.strip():
+            raise pd.errors.EmptyDataError
+        for codificacion in ('utf-8-sig', 'latin-1'):
+            try:
+                texto = contenido.decode(codificacion)
+                break
+            except UnicodeDecodeError:
+                continue
+        # sep=None deja que pandas detecte ',' o ';' (Excel en español exporta con ';')
+        return pd.read_csv(io.StringIO(texto), header=None, dtype=str, sep=None, engine='python',
+                           keep_default_na=False, skip_blank_lines=False)
+
+
+def _ubicar_encabezados(df):
+    """Devuelve (índice de la fila de encabezados, {columna: campo})."""
+    mejor_fila, mejor_mapeo = None, {}
+    for i in range(min(FILAS_BUSQUEDA_ENCABEZADO, len(df))):
+        mapeo = {}
+        usados = set()
+        for columna, celda in df.iloc[i].items():
+            if pd.isna(celda):
+                continue
+            campo = MAPA_ENCABEZADOS.get(normalizar_encabezado(celda))
+            if campo in usados:
+                campo = SEGUNDA_APARICION.get(campo)
+            if campo and campo not in usados:
+                mapeo[columna] = campo
+                usados.add(campo)
+        if len(mapeo) > len(mejor_mapeo):
+            mejor_fila, mejor_mapeo = i, mapeo
+    if len(mejor_mapeo) < MIN_COLUMNAS_RECONOCIDAS:
+        raise ErrorImportacion(
+            "No se encontró la fila de encabezados de la matriz IPER "
+            "(se esperan columnas como Proceso, Tarea, Peligro, Riesgo, P, S)."
+        )
+    return mejor_fila, mejor_mapeo
+
+
+# --- 2. NORMALIZACIÓN Y VALIDACIÓN (por columnas) ---
+
+def _errores_de_mascara(mascara, numeros_fila, columna, mensaje):
+    return [
+        {'fila': int(n), 'columna': columna, 'mensaje': mensaje}
+        for n in numeros_fila[mascara.to_numpy()]
+    ]
+
+
+def _normalizar(datos, numeros_fila):
+    """Normaliza los tipos de cada columna y devuelve (datos, errores)."""
+    errores = []
+    for campo in datos.columns:
+        serie = datos[campo]
+        if campo in CAMPOS_NUMERICOS:
+            vacios = serie.isna() | (serie.astype('string').str.strip() == '')
+            numeros = pd.to_numeric(serie.where(~vacios), errors='coerce')
+            # 0 es el valor que guarda la grilla para una celda sin evaluar
+            invalidos = ~vacios & ~numeros.isin([0, *CAMPOS_NUMERICOS[campo]])
+            permitidos = ', '.join(str(v) for v in CAMPOS_NUMERICOS[campo])
+            errores += _errores_de_mascara(invalidos, numeros_fila, campo, f"Valor no permitido (use {permitidos}).")
+            # Vacíos quedan en 0, igual que una fila nueva de la grilla
+            datos[campo] = numeros.where(~invalidos).fillna(0).astype(int)
+            continue
+
+        texto = serie.astype('string').str.strip()
+        texto = texto.mask(texto == '')
+        if campo in OPCIONES:
+            canonicos = texto.map(lambda v: OPCIONES[campo].get(normalizar_encabezado(v)) if pd.notna(v) else None)
+            texto = canonicos.fillna(texto)
+        max_length = DetalleIPER._meta.get_field(campo).max_length
+        if max_length:
+            largos = texto.str.len() > max_length
+            errores += _errores_de_mascara(largos.fillna(False), numeros_fila, campo,
+                                           f"Texto demasiado largo (máximo {max_length} caracteres).")
+        datos[campo] = texto
+    return datos, errores
+
+
+# --- 3. IMPORTACIÓN ---
+
+def preparar_filas(df, tabla=valoracion.TABLA_IPER):
+    """
+    Convierte la planilla cruda en columnas de DetalleIPER validadas, con
+    valor y clasificación calculados en bloque con la escala `tabla`.
+    Devuelve (datos, errores, ignoradas).
+    """
+    fila_encabezado, mapeo = _ubicar_encabezados(df)
+    ignoradas = [
+        str(celda) for columna, celda in df.iloc[fila_encabezado].items()
+        if columna not in mapeo and pd.notna(celda) and str(celda).strip()
+    ]
+
+    datos = df.iloc[fila_encabezado + 1:][list(mapeo)].rename(columns=mapeo)
+    datos = datos.drop(columns=[c for c in datos.columns if c in CAMPOS_CALCULADOS])
+    # Número de fila tal como lo ve el usuario en Excel (1-indexado)
+    numeros_fila = np.arange(len(datos)) + fila_encabezado + 2
+
+    # Se descartan filas completamente vacías
+    con_datos = ~(datos.isna() | (datos.astype('string').apply(lambda s: s.str.strip()) == '')).all(axis=1)
+    datos = datos[con_datos.to_numpy()].reset_index(drop=True)
+    numeros_fila = numeros_fila[con_datos.to_numpy()]
+
+    datos, errores = _normalizar(datos, numeros_fila)
+    datos['_fila'] = numeros_fila
+
+    for prefijo in ('eval', 'residual'):
+        p = datos.get(f'{prefijo}_probabilidad', pd.Series(0, index=datos.index))
+        s = datos.get(f'{prefijo}_severidad', pd.Series(0, index=datos.index))
+        datos[f'{prefijo}_valor'], datos[f'{prefijo}_clasificacion'] = tabla.valorar_arrays(p, s)
+
+    return datos, errores, ignoradas
+
+
+@transaction.atomic
+def importar_iper(archivo, empresa, omitir_errores=False, **encabezado):
+    """
+    Crea una MatrizIPER para la empresa con las filas de la planilla.
+    Si hay errores y no se pidió omitirlos, no se importa nada (ErrorImportacion).
+    Devuelve un dict con la matriz, el total importado, los errores y las columnas ignoradas.
+    """
+    df = leer_planilla(archivo)
+    datos, errores, ignoradas = preparar_filas(df, escalas.tabla_de_empresa(empresa))
+
+    if errores:
+        if not omitir_errores:
+            raise ErrorImportacion(f"La planilla tiene {len(errores)} error(es).", errores)
+        filas_con_error = {e['fila'] for e in errores}
+        datos = datos[~datos['_fila'].isin(filas_con_error)]
+    if datos.empty:
+        raise ErrorImportacion("La planilla no contiene filas válidas para importar.", errores)
+
+    matriz = MatrizIPER.objects.create(empresa=empresa, **encabezado)
+    revision = nueva_revision(matriz.pk)
+
+    registros = datos.drop(columns='_fila').astype(object)
+    registros = registros.where(registros.notna(), None).to_dict('records')
+    filas = [DetalleIPER(matriz=matriz, revision=revision, **registro) for registro in registros]
+    DetalleIPER.objects.bulk_create(filas, batch_size=TAMANO_LOTE)
+    # Foto base para el historial: las filas importadas no se registran una a una
+    historial.tomar_snapshot(matriz.pk, revision)
+    resumen.crear(matriz.pk, resumen.delta_filas(zip(datos['eval_clasificacion'], datos['residual_clasificacion'])))
+
+    return {
+        'matriz': matriz,
+        'filas_importadas': len(filas),
+        'errores': errores,
+        'ignoradas': ignoradas,
+    }
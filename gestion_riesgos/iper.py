@@ -0,0 +1,331 @@
+# gestion_riesgos/iper.py
+"""
+Operaciones de escritura sobre las filas de la Matriz IPER (DetalleIPER).
+
+Las vistas AJAX de la grilla delegan aquí la validación y el guardado,
+para que todos los caminos de escritura compartan las mismas reglas.
+"""
+import re
+from collections import Counter
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import busqueda, difusion, escalas, historial, resumen
+from .models import DetalleIPER, FilaIPEREliminada, MatrizIPER
+
+# Campos que la grilla nunca puede modificar directamente
+# (valor y clasificación se derivan de P x S en el servidor)
+CAMPOS_PROTEGIDOS = {'id', 'matriz', 'revision'} | {
+    campo for derivados in DetalleIPER.CAMPOS_VALORACION.values() for campo in derivados
+}
+
+# Tope de ediciones por lote, para acotar el tamaño de la transacción
+MAX_EDICIONES_POR_LOTE = 1000
+
+# Columnas que se pueden pedir en la API de filas (todas las del "Excel")
+CAMPOS_FILA = [
+    campo.name for campo in DetalleIPER._meta.concrete_fields if campo.name != 'matriz'
+]
+
+# Tamaño de página de la API de filas
+LIMITE_FILAS_DEFECTO = 100
+LIMITE_FILAS_MAXIMO = 500
+
+# Tope de filas que se pueden agregar de una vez desde la grilla
+MAX_FILAS_NUEVAS = 50
+
+# Si desde la revisión pedida cambiaron más filas que esto, el cliente debe recargar
+LIMITE_CAMBIOS = 1000
+
+
+def obtener_campo_editable(nombre):
+    """Devuelve el campo del modelo si la grilla puede editarlo; si no, lanza ValidationError."""
+    if not nombre or nombre in CAMPOS_PROTEGIDOS:
+        raise ValidationError(f"El campo '{nombre}' no es editable.")
+    try:
+        campo = DetalleIPER._meta.get_field(nombre)
+    except FieldDoesNotExist:
+        raise ValidationError(f"El campo '{nombre}' no existe.")
+    if not campo.concrete or not campo.editable or campo.is_relation:
+        raise ValidationError(f"El campo '{nombre}' no es editable.")
+    return campo
+
+
+def limpiar_valor(detalle, nombre, valor):
+    """Valida y convierte el valor recibido desde la grilla al tipo del campo."""
+    campo = obtener_campo_editable(nombre)
+    # La grilla envía '' al vaciar una celda; en campos numéricos eso es NULL
+    if valor == '' and not campo.empty_strings_allowed:
+        valor = None
+    return campo.clean(valor, detalle)
+
+
+def nueva_revision(matriz_id):
+    """
+    Incrementa la revisión de la matriz y devuelve el nuevo valor.
+    Debe llamarse dentro de una transacción: el UPDATE bloquea la fila de la
+    matriz hasta el commit, así las revisiones se confirman en orden.
+    """
+    MatrizIPER.objects.filter(pk=matriz_id).update(revision=F('revision') + 1)
+    revision = MatrizIPER.objects.filter(pk=matriz_id).values_list('revision', flat=True).get()
+    # Los clientes conectados se enteran solo si la transacción se confirma
+    transaction.on_commit(lambda: difusion.publicar_cambio(matriz_id, revision))
+    busqueda.programar_sincronizacion(matriz_id)
+    return revision
+
+
+def crear_fila(matriz, usuario=None, **valores):
+    """Crea una fila en la matriz; `valores` se validan como ediciones de la grilla."""
+    with transaction.atomic():
+        detalle = DetalleIPER(matriz=matriz)
+        for campo, valor in valores.items():
+            setattr(detalle, campo, limpiar_valor(detalle, campo, valor))
+        detalle.revision = nueva_revision(matriz.pk)
+        historial.asegurar_base(matriz.pk, detalle.revision - 1)
+        detalle.save()
+        historial.registrar(matriz.pk, detalle.revision, [historial.creacion(detalle)], usuario)
+        resumen.aplicar(matriz.pk, resumen.delta_filas([resumen.clasificaciones(detalle)]))
+    return detalle
+
+
+def crear_filas(matriz, cantidad=1, usuario=None, **valores):
+    """
+    Crea `cantidad` filas iguales en la matriz con un solo bulk_create y una
+    sola revisión. Devuelve las filas creadas (con id), listas para renderizar.
+    """
+    if not 1 <= cantidad <= MAX_FILAS_NUEVAS:
+        raise ValidationError(f"Se pueden agregar entre 1 y {MAX_FILAS_NUEVAS} filas.")
+    modelo = DetalleIPER(matriz=matriz)
+    for campo, valor in valores.items():
+        setattr(modelo, campo, limpiar_valor(modelo, campo, valor))
+    # bulk_create no pasa por save(): la valoración se calcula aquí
+    modelo.calcular_valoracion()
+    datos = {campo.attname: getattr(modelo, campo.attname) for campo in DetalleIPER._meta.concrete_fields if not campo.primary_key}
+
+    with transaction.atomic():
+        datos['revision'] = nueva_revision(matriz.pk)
+        historial.asegurar_base(matriz.pk, datos['revision'] - 1)
+        filas = DetalleIPER.objects.bulk_create([DetalleIPER(**datos) for _ in range(cantidad)])
+        historial.registrar(matriz.pk, datos['revision'], [historial.creacion(fila) for fila in filas], usuario)
+        resumen.aplicar(matriz.pk, resumen.delta_filas([resumen.clasificaciones(modelo)] * cantidad))
+    return filas
+
+
+def actualizar_celda(detalle, campo, valor, usuario=None):
+    """Guarda una sola celda de una fila existente, tocando solo esa columna."""
+    with transaction.atomic():
+        anterior = getattr(detalle, campo, None)
+        clasificaciones = resumen.clasificaciones(detalle)
+        setattr(detalle, campo, limpiar_valor(detalle, campo, valor))
+        detalle.revision = nueva_revision(detalle.matriz_id)
+        historial.asegurar_base(detalle.matriz_id, detalle.revision - 1)
+        detalle.save(update_fields=[campo, 'revision'])
+        historial.registrar(detalle.matriz_id, detalle.revision, [historial.edicion(detalle, campo, anterior)], usuario)
+        resumen.aplicar(detalle.matriz_id, resumen.delta_edicion(clasificaciones, resumen.clasificaciones(detalle)))
+    return detalle
+
+
+def eliminar_fila(detalle, usuario=None):
+    """Elimina la fila y deja constancia para la sincronización por revisiones."""
+    with transaction.atomic():
+        revision = nueva_revision(detalle.matriz_id)
+        historial.asegurar_base(detalle.matriz_id, revision - 1)
+        FilaIPEREliminada.objects.create(matriz_id=detalle.matriz_id, fila_id=detalle.pk, revision=revision)
+        cambio = historial.eliminacion(detalle)
+        detalle.delete()
+        historial.registrar(detalle.matriz_id, revision, [cambio], usuario)
+        resumen.aplicar(detalle.matriz_id, resumen.delta_filas([resumen.clasificaciones(detalle)], signo=-1))
+
+
+def aplicar_ediciones(ediciones, filas, usuario=None):
+    """
+    Aplica un lote de ediciones [{id, field, value}, ...] en una sola transacción.
+
+    `filas` es el queryset de DetalleIPER sobre el que el usuario tiene permiso.
+    Las filas se agrupan según el conjunto de columnas modificadas y cada grupo
+    se guarda con un único bulk_update que toca solo esas columnas.
+    Devuelve el estado de cada edición, en el mismo orden recibido.
+    """
+    resultados = []
+    ids = set()
+    for edicion in ediciones:
+        try:
+            ids.add(int(edicion.get('id')))
+        except (TypeError, ValueError, AttributeError):
+            pass
+
+    with transaction.atomic():
+        detalles = filas.select_for_update().in_bulk(ids)
+        clasificaciones = {pk: resumen.clasificaciones(detalle) for pk, detalle in detalles.items()}
+        tablas = {}  # matriz_id -> escala de valoración de su empresa
+        modificados = {}  # id -> conjunto de campos cambiados
+        cambios = {}  # matriz_id -> entradas para el historial
+
+        for edicion in ediciones:
+            if not isinstance(edicion, dict):
+                resultados.append({'status': 'error', 'message': 'Edición inválida.'})
+                continue
+
+            row_id = edicion.get('id')
+            field = edicion.get('field')
+            resultado = {'id': row_id, 'field': field}
+            try:
+                detalle = detalles.get(int(row_id))
+            except (TypeError, ValueError):
+                detalle = None
+
+            if detalle is None:
+                resultado.update(status='error', message='Fila no encontrada.')
+            else:
+                try:
+                    valor = limpiar_valor(detalle, field, edicion.get('value'))
+                except ValidationError as e:
+                    resultado.update(status='error', message=' '.join(e.messages))
+                else:
+                    anterior = getattr(detalle, field)
+                    setattr(detalle, field, valor)
+                    cambios.setdefault(detalle.matriz_id, []).append(historial.edicion(detalle, field, anterior))
+                    campos = modificados.setdefault(detalle.pk, set())
+                    campos.add(field)
+                    resultado['status'] = 'ok'
+                    derivados = DetalleIPER.CAMPOS_VALORACION.get(field)
+                    if derivados:
+                        if detalle.matriz_id not in tablas:
+                            tablas[detalle.matriz_id] = escalas.tabla_de_matriz(detalle.matriz_id)
+                        detalle.calcular_valoracion(tablas[detalle.matriz_id])
+                        campos.update(derivados)
+                        resultado['valores'] = {campo: getattr(detalle, campo) for campo in derivados}
+            resultados.append(resultado)
+
+        # Una revisión nueva por cada matriz tocada por el lote
+        revisiones = {}
+        for pk, campos in modificados.items():
+            detalle = detalles[pk]
+            if detalle.matriz_id not in revisiones:
+                revisiones[detalle.matriz_id] = nueva_revision(detalle.matriz_id)
+                historial.asegurar_base(detalle.matriz_id, revisiones[detalle.matriz_id] - 1)
+            detalle.revision = revisiones[detalle.matriz_id]
+            campos.add('revision')
+
+        grupos = {}
+        for pk, campos in modificados.items():
+            grupos.setdefault(frozenset(campos), []).append(detalles[pk])
+        for campos, grupo in grupos.items():
+            DetalleIPER.objects.bulk_update(grupo, sorted(campos))
+
+        for matriz_id, revision in revisiones.items():
+            historial.registrar(matriz_id, revision, cambios[matriz_id], usuario)
+
+        deltas = {matriz_id: Counter() for matriz_id in revisiones}
+        for pk in modificados:
+            detalle = detalles[pk]
+            deltas[detalle.matriz_id].update(
+                resumen.delta_edicion(clasificaciones[pk], resumen.clasificaciones(detalle)))
+        for matriz_id, delta in deltas.items():
+            resumen.aplicar(matriz_id, delta)
+
+    return resultados
+
+
+def campos_proyeccion(parametro):
+    """
+    Traduce el parámetro 'fields' (separado por comas) a la lista de columnas
+    a consultar. El id siempre se incluye porque es la clave de paginación.
+    """
+    if not parametro:
+        return list(CAMPOS_FILA)
+    pedidos = [nombre.strip() for nombre in parametro.split(',') if nombre.strip()]
+    invalidos = [nombre for nombre in pedidos if nombre not in CAMPOS_FILA]
+    if invalidos:
+        raise ValidationError(f"Columnas desconocidas: {', '.join(invalidos)}")
+    return ['id'] + [nombre for nombre in pedidos if nombre != 'id']
+
+
+def pagina_filas(filas, campos, despues_de=0, limite=LIMITE_FILAS_DEFECTO):
+    """
+    Devuelve una página de filas con paginación por clave (keyset) sobre el id:
+    WHERE id > despues_de ORDER BY id LIMIT limite. No usa OFFSET, así que el
+    costo no crece a medida que el usuario avanza en la matriz.
+    """
+    pagina = list(
+        filas.filter(id__gt=despues_de).order_by('id').values(*campos)[:limite + 1]
+    )
+    hay_mas = len(pagina) > limite
+    pagina = pagina[:limite]
+    return {
+        'count': len(pagina),
+        'has_more': hay_mas,
+        'next_after': pagina[-1]['id'] if hay_mas else None,
+        'filas': pagina,
+    }
+
+
+def cambios_desde(matriz, revision, campos):
+    """
+    Devuelve las filas creadas/modificadas y los ids eliminados después de
+    `revision`. Si son demasiados, indica al cliente que recargue la matriz.
+    """
+    filas = matriz.filas.filter(revision__gt=revision).order_by('id').values(*campos)
+    filas = list(filas[:LIMITE_CAMBIOS + 1])
+    if len(filas) > LIMITE_CAMBIOS:
+        return {'resync': True, 'filas': [], 'eliminadas': []}
+    eliminadas = matriz.filas_eliminadas.filter(revision__gt=revision).values_list('fila_id', flat=True)
+    return {'resync': False, 'filas': filas, 'eliminadas': list(eliminadas)}
+
+
+# --- NUEVA REVISIÓN (CLONACIÓN) ---
+
+# Campos del encabezado que no se copian a la nueva revisión
+CAMPOS_NO_CLONABLES = {'id', 'fecha_creacion', 'revision', 'revision_indexada', 'version', 'fecha_documento'}
+
+
+def siguiente_version(version):
+    """'1.0' -> '2.0', 'Rev. 3' -> 'Rev. 4'; si no hay número, se agrega ' (2)'."""
+    coincidencia = re.search(r'\d+', version or '')
+    if not coincidencia:
+        return f"{version} (2)" if version else "2.0"
+    return f"{version[:coincidencia.start()]}{int(coincidencia.group()) + 1}{version[coincidencia.end():]}"
+
+
+def clonar_matriz(matriz):
+    """
+    Crea una nueva revisión de la matriz: copia el encabezado con la versión
+    incrementada y todas sus filas con un único INSERT ... SELECT en la BD,
+    sin traer las filas a Python. Devuelve la nueva MatrizIPER.
+    """
+    encabezado = {
+        campo.attname: getattr(matriz, campo.attname)
+        for campo in MatrizIPER._meta.concrete_fields if campo.name not in CAMPOS_NO_CLONABLES
+    }
+    with transaction.atomic():
+        nueva = MatrizIPER.objects.create(
+            **encabezado,
+            version=siguiente_version(matriz.version),
+            fecha_documento=timezone.localdate(),
+        )
+        revision = nueva_revision(nueva.pk)
+
+        qn = connection.ops.quote_name
+        columnas = [
+            qn(campo.column) for campo in DetalleIPER._meta.concrete_fields
+            if campo.name not in ('id', 'matriz', 'revision')
+        ]
+        tabla = qn(DetalleIPER._meta.db_table)
+        matriz_col = qn(DetalleIPER._meta.get_field('matriz').column)
+        revision_col = qn(DetalleIPER._meta.get_field('revision').column)
+        with connection.cursor() as cursor:
+            # ORDER BY id conserva el orden de las filas en la copia
+            cursor.execute(
+                f"INSERT INTO {tabla} ({matriz_col}, {revision_col}, {', '.join(columnas)}) "
+                f"SELECT %s, %s, {', '.join(columnas)} FROM {tabla} "
+                f"WHERE {matriz_col} = %s ORDER BY {qn(DetalleIPER._meta.pk.column)}",
+                [nueva.pk, revision, matriz.pk],
+            )
+        # La copia nace con su foto base para el historial y el resumen del original
+        historial.tomar_snapshot(nueva.pk, revision)
+        resumen.copiar(matriz.pk, nueva.pk)
+    nueva.revision = revision
+    return nueva
@@ -0,0 +1,38 @@
+# gestion_riesgos/management/commands/migrar_matrices_legacy.py
+
+from django.core.management.base import BaseCommand
+
+from gestion_riesgos import migracion_legacy
+from gestion_riesgos.models import Matriz
+
+
+class Command(BaseCommand):
+    help = (
+        'Aplana las matrices por procesos (Matriz/Proceso/Tarea/Riesgo) en Matrices IPER. '
+        'Las ya migradas se omiten y las interrumpidas continúan donde quedaron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='Limitar a una empresa (id).')
+        parser.add_argument('--matriz', type=int, help='Limitar a una matriz por procesos (id).')
+        parser.add_argument('--lote', type=int, default=migracion_legacy.TAMANO_LOTE,
+                            help='Riesgos por lote (cada lote se confirma por separado).')
+        parser.add_argument('--rehacer', action='store_true',
+                            help='Eliminar la Matriz IPER generada antes y volver a migrar.')
+
+    def handle(self, *args, **options):
+        matrices = Matriz.objects.all()
+        if options['empresa']:
+            matrices = matrices.filter(empresa_id=options['empresa'])
+        if options['matriz']:
+            matrices = matrices.filter(pk=options['matriz'])
+
+        def al_avanzar(migracion, filas):
+            self.stdout.write(f"  matriz {migracion.pk}: +{filas} filas")
+
+        migraciones = migracion_legacy.migrar_matrices(
+            matrices, tamano_lote=options['lote'], rehacer=options['rehacer'], al_avanzar=al_avanzar)
+        for migracion in migraciones:
+            self.stdout.write(
+                f"Matriz {migracion.pk} -> IPER {migracion.matriz_iper_id}: {migracion.filas_migradas} filas")
+        self.stdout.write(self.style.SUCCESS(f"Matrices migradas: {len(migraciones)}"))
@@ -0,0 +1,29 @@
+# gestion_riesgos/management/commands/recalcular_resumen_iper.py
+
+from django.core.management.base import BaseCommand
+
+from gestion_riesgos import resumen
+from gestion_riesgos.models import MatrizIPER
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye desde las filas el resumen de riesgo (conteos por clasificación) '
+        'de las matrices IPER y corrige los que estén desfasados o falten.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='Limitar a una empresa (id).')
+        parser.add_argument('--matriz', type=int, help='Limitar a una matriz IPER (id).')
+
+    def handle(self, *args, **options):
+        matrices = MatrizIPER.objects.all()
+        if options['empresa']:
+            matrices = matrices.filter(empresa_id=options['empresa'])
+        if options['matriz']:
+            matrices = matrices.filter(pk=options['matriz'])
+
+        corregidos = resumen.recalcular_matrices(matrices)
+        self.stdout.write(self.style.SUCCESS(
+            f"Matrices revisadas: {matrices.count()}, resúmenes corregidos: {corregidos}"
+        ))
@@ -0,0 +1,29 @@
+# gestion_riesgos/management/commands/reindexar_busqueda.py
+
+from django.core.management.base import BaseCommand
+
+from gestion_riesgos import busqueda
+from gestion_riesgos.models import MatrizIPER
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye el índice de búsqueda de texto (filas IPER, peligros y normativa). '
+        'Con --empresa o --matriz solo reindexa las filas de esas matrices.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='Limitar a las matrices IPER de una empresa (id).')
+        parser.add_argument('--matriz', type=int, help='Limitar a una matriz IPER (id).')
+
+    def handle(self, *args, **options):
+        matrices = None
+        if options['empresa'] or options['matriz']:
+            matrices = MatrizIPER.objects.all()
+            if options['empresa']:
+                matrices = matrices.filter(empresa_id=options['empresa'])
+            if options['matriz']:
+                matrices = matrices.filter(pk=options['matriz'])
+
+        total = busqueda.reindexar(matrices)
+        self.stdout.write(self.style.SUCCESS(f"Documentos indexados: {total}"))
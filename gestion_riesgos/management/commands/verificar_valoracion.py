@@ -0,0 +1,42 @@
+# gestion_riesgos/management/commands/verificar_valoracion.py
+
+from django.core.management.base import BaseCommand
+
+from gestion_riesgos import evaluacion, resumen
+from gestion_riesgos.models import DetalleIPER, MatrizIPER, Riesgo
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula con el motor vectorizado el VEP/valoración de Riesgo y DetalleIPER '
+        'y reporta (o corrige con --corregir) las filas cuyo valor almacenado no coincide.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='Limitar a una empresa (id).')
+        parser.add_argument('--corregir', action='store_true', help='Recalcular en la BD las filas con diferencias.')
+
+    def handle(self, *args, **options):
+        riesgos = Riesgo.objects.all()
+        detalles = DetalleIPER.objects.all()
+        if options['empresa']:
+            riesgos = riesgos.filter(tarea__proceso__matriz__empresa_id=options['empresa'])
+            detalles = detalles.filter(matriz__empresa_id=options['empresa'])
+
+        ids, resultado = evaluacion.evaluar_riesgos(riesgos)
+        distintos_riesgos = evaluacion.diferencias(riesgos, ids, resultado)
+        self.stdout.write(f"Riesgos evaluados: {len(ids)}, con diferencias: {len(distintos_riesgos)}")
+        conteo = evaluacion.conteo_por_clasificacion(resultado['clasificacion_riesgo_inherente_maximo'])
+        for clasificacion, cantidad in sorted(conteo.items()):
+            self.stdout.write(f"  {clasificacion}: {cantidad}")
+
+        ids, resultado = evaluacion.evaluar_detalles(detalles)
+        distintos_detalles = evaluacion.diferencias(detalles, ids, resultado)
+        self.stdout.write(f"Filas IPER evaluadas: {len(ids)}, con diferencias: {len(distintos_detalles)}")
+
+        if options['corregir']:
+            corregidos = Riesgo.objects.filter(pk__in=distintos_riesgos).recalcular_vep()
+            corregidos += DetalleIPER.objects.filter(pk__in=distintos_detalles).recalcular_valoracion()
+            # Cambiar clasificaciones desfasa el resumen de esas matrices
+            resumen.recalcular_matrices(MatrizIPER.objects.filter(filas__in=distintos_detalles).distinct())
+            self.stdout.write(self.style.SUCCESS(f"Filas corregidas: {corregidos}"))
@@ -0,0 +1,186 @@
+# gestion_riesgos/mapa_calor.py
+"""
+Mapa de calor Probabilidad x Severidad (Consecuencia en la matriz por
+procesos) de una matriz, de una empresa o de toda la cartera.
+
+Cada celda trae su cantidad de filas y los ids para el detalle. Las filas
+IPER se agrupan en SQL con un único GROUP BY por sus cuatro columnas P/S
+(pura y residual), del que salen las dos grillas; un P o S vacío o en 0
+cuenta como 1, igual que en la valoración y los resúmenes. Los Riesgo
+pasan por el motor vectorizado, porque su posición inherente depende de la
+categoría con mayor VEP.
+
+El resultado se guarda en caché por alcance. La clave incluye una huella de
+los datos leída de la BD, así que un cambio hecho en cualquier proceso
+genera una clave nueva y no hay que invalidar:
+- IPER: cantidad, último id y suma de revisiones de las matrices del alcance
+  (cada escritura de filas sube la revisión de su matriz).
+- Riesgos: cantidad y último `actualizado` de los riesgos del alcance (un
+  alta o una edición cambian la fecha y una baja, la cantidad).
+"""
+from django.core.cache import cache
+from django.db.models import Aggregate, Count, Max, Sum, TextField
+
+from . import escalas, evaluacion, valoracion
+from .models import DetalleIPER, MatrizIPER, Riesgo
+
+# Valores de cada eje: en la IPER la severidad llega a 8; en la matriz por
+# procesos probabilidad y consecuencia valen 1, 2 o 4
+EJES = {
+    'iper': ([1, 2, 4], [1, 2, 4, 8]),
+    'riesgos': ([1, 2, 4], [1, 2, 4]),
+}
+# Ids de detalle que se envían por celda (la cantidad siempre es la real)
+IDS_POR_CELDA = 200
+CACHE_SEGUNDOS = 60 * 60
+
+TIPOS = ('inherente', 'residual')
+CAMPOS_IPER = {
+    'inherente': ('eval_probabilidad', 'eval_severidad'),
+    'residual': ('residual_probabilidad', 'residual_severidad'),
+}
+
+
+class ListaIds(Aggregate):
+    """Ids del grupo separados por coma (GROUP_CONCAT; STRING_AGG en PostgreSQL)."""
+    function = 'GROUP_CONCAT'
+    output_field = TextField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection, function='STRING_AGG',
+            template="%(function)s(%(expressions)s::text, ',')", **extra_context,
+        )
+
+
+# --- 1. ARMADO DE LA GRILLA ---
+
+class Grilla:
+    """Acumula conteos e ids por celda (P, S) de un mapa."""
+
+    def __init__(self, probabilidades, severidades):
+        self.celdas = {(p, s): [0, []] for p in probabilidades for s in severidades}
+        # Filas con P o S fuera de la escala (en la matriz por procesos, también sin evaluar)
+        self.sin_evaluar = 0
+
+    def sumar(self, p, s, cantidad, ids):
+        celda = self.celdas.get((p, s))
+        if celda is None:
+            self.sin_evaluar += cantidad
+            return
+        celda[0] += cantidad
+        celda[1].extend(ids)
+
+    def como_dict(self, valorar):
+        """`valorar(p, s)` -> (valor, clasificación) según la escala de la matriz."""
+        celdas = []
+        for (p, s), (cantidad, ids) in self.celdas.items():
+            valor, clasificacion = valorar(p, s)
+            ids = sorted(ids)
+            celdas.append({
+                'p': p, 's': s, 'valor': valor, 'clasificacion': clasificacion,
+                # Misma convención de clases que el semáforo de la grilla IPER
+                'css': f"riesgo-{clasificacion.lower()}",
+                'cantidad': cantidad,
+                'ids': ids[:IDS_POR_CELDA],
+                'ids_truncados': len(ids) > IDS_POR_CELDA,
+            })
+        total = sum(celda['cantidad'] for celda in celdas) + self.sin_evaluar
+        return {'celdas': celdas, 'sin_evaluar': self.sin_evaluar, 'total': total}
+
+
+def _valorar_vep(p, c):
+    vep = valoracion.calcular_vep(p, c)
+    return vep, valoracion.clasificar_vep(vep)
+
+
+def _factor_iper(valor):
+    # Misma regla que TablaValoracion.valorar: vacío o 0 vale 1
+    return valor if valor and valor > 0 else 1
+
+
+def calcular_mapa_iper(filas, tabla=valoracion.TABLA_IPER):
+    """
+    Grillas inherente y residual de un queryset de DetalleIPER (un solo GROUP BY).
+    `tabla` es la escala con que se rotula cada celda.
+    """
+    campos = [campo for par in CAMPOS_IPER.values() for campo in par]
+    grupos = filas.order_by().values(*campos).annotate(cantidad=Count('id'), ids=ListaIds('id'))
+    grillas = {tipo: Grilla(*EJES['iper']) for tipo in TIPOS}
+    for grupo in grupos:
+        ids = [int(pk) for pk in grupo['ids'].split(',')] if grupo['ids'] else []
+        for tipo, (campo_p, campo_s) in CAMPOS_IPER.items():
+            grillas[tipo].sumar(
+                _factor_iper(grupo[campo_p]), _factor_iper(grupo[campo_s]), grupo['cantidad'], ids,
+            )
+    return {tipo: grilla.como_dict(tabla.valorar) for tipo, grilla in grillas.items()}
+
+
+def calcular_mapa_riesgos(riesgos):
+    """Grillas inherente y residual de un queryset de Riesgo (motor NumPy)."""
+    ids, ejes = evaluacion.ejes_riesgos(riesgos)
+    grillas = {}
+    for tipo in TIPOS:
+        probabilidades, consecuencias = ejes[tipo]
+        grilla = Grilla(*EJES['riesgos'])
+        ubicados = 0
+        for p in EJES['riesgos'][0]:
+            for c in EJES['riesgos'][1]:
+                en_celda = (probabilidades == p) & (consecuencias == c)
+                seleccion = ids[en_celda].tolist()
+                ubicados += len(seleccion)
+                grilla.sumar(p, c, len(seleccion), seleccion)
+        grilla.sin_evaluar = len(ids) - ubicados
+        grillas[tipo] = grilla.como_dict(_valorar_vep)
+    return grillas
+
+
+# --- 2. ALCANCE Y CACHÉ ---
+
+def _huella_iper(matrices):
+    datos = matrices.aggregate(n=Count('id'), ultima=Max('id'), revisiones=Sum('revision'))
+    return f"{datos['n']}.{datos['ultima'] or 0}.{datos['revisiones'] or 0}"
+
+
+def _huella_riesgos(riesgos):
+    datos = riesgos.order_by().aggregate(n=Count('id'), ultimo=Max('actualizado'))
+    ultimo = datos['ultimo'].timestamp() * 1e6 if datos['ultimo'] else 0
+    return f"{datos['n']}.{ultimo:.0f}"
+
+
+def mapa_iper(usuario, empresa_id=None, matriz_id=None):
+    """Mapa de las matrices IPER del usuario, opcionalmente de una empresa o una matriz."""
+    matrices = MatrizIPER.objects.filter(empresa__prevencionista=usuario)
+    if empresa_id:
+        matrices = matrices.filter(empresa_id=empresa_id)
+    if matriz_id:
+        matrices = matrices.filter(pk=matriz_id)
+
+    # Una empresa o matriz se rotula con su escala; la cartera, con la predeterminada
+    escala_id = None
+    if empresa_id or matriz_id:
+        escala_id = matrices.values_list('empresa__escala_valoracion', flat=True).first()
+    tabla = escalas.tabla_de_escala(escala_id)
+
+    clave = f"mapa_calor:iper:{usuario.pk}:{empresa_id or '-'}:{matriz_id or '-'}:{_huella_iper(matrices)}:{tabla.version}"
+    mapa = cache.get(clave)
+    if mapa is None:
+        mapa = calcular_mapa_iper(DetalleIPER.objects.filter(matriz__in=matrices), tabla)
+        cache.set(clave, mapa, CACHE_SEGUNDOS)
+    return mapa
+
+
+def mapa_riesgos(usuario, empresa_id=None, matriz_id=None):
+    """Mapa de los Riesgo de la matriz por procesos, con los mismos alcances."""
+    riesgos = Riesgo.objects.filter(tarea__proceso__matriz__empresa__prevencionista=usuario)
+    if empresa_id:
+        riesgos = riesgos.filter(tarea__proceso__matriz__empresa_id=empresa_id)
+    if matriz_id:
+        riesgos = riesgos.filter(tarea__proceso__matriz_id=matriz_id)
+
+    clave = f"mapa_calor:riesgos:{usuario.pk}:{empresa_id or '-'}:{matriz_id or '-'}:{_huella_riesgos(riesgos)}"
+    mapa = cache.get(clave)
+    if mapa is None:
+        mapa = calcular_mapa_riesgos(riesgos)
+        cache.set(clave, mapa, CACHE_SEGUNDOS)
+    return mapa
@@ -0,0 +1,178 @@
+# gestion_riesgos/migracion_legacy.py
+"""
+Aplanado de la matriz por procesos (Matriz -> Proceso -> Tarea -> Riesgo ->
+MedidaControl) en una Matriz IPER: cada Riesgo pasa a ser una fila DetalleIPER.
+
+Los riesgos se leen por lotes en orden de id: una consulta con sus tareas,
+procesos y peligros (select_related) y otra con sus medidas de control
+(prefetch). Cada lote se inserta con bulk_create en su propia transacción,
+junto con el avance guardado en MigracionMatrizLegacy. Así:
+- una matriz ya migrada no se vuelve a copiar (idempotente);
+- si el proceso se corta, la próxima ejecución sigue desde el último
+  riesgo confirmado, sin duplicar filas (reanudable).
+"""
+from django.db import transaction
+from django.db.models import F
+
+from . import escalas, historial, resumen, valoracion
+from .iper import nueva_revision
+from .models import DetalleIPER, MatrizIPER, MigracionMatrizLegacy, Riesgo
+
+TAMANO_LOTE = 500
+
+
+# --- 1. MAPEO RIESGO -> FILA IPER ---
+
+def _genero(tarea):
+    if tarea.genero_hombres and tarea.genero_mujeres:
+        return 'Ambos'
+    if tarea.genero_hombres:
+        return 'Hombre'
+    if tarea.genero_mujeres:
+        return 'Mujer'
+    return None
+
+
+def _evaluacion_inherente(riesgo):
+    """
+    (P, C) de la categoría con mayor VEP (la primera si empatan), el mismo
+    criterio del mapa de calor. (None, None) si no hay ninguna evaluada.
+    """
+    mejor, par = None, (None, None)
+    for nombre in Riesgo.CATEGORIAS_INHERENTES:
+        campo_p, campo_c = Riesgo.EVALUACIONES_VEP[nombre]
+        vep = valoracion.calcular_vep(getattr(riesgo, campo_p), getattr(riesgo, campo_c))
+        if vep is not None and (mejor is None or vep > mejor):
+            mejor, par = vep, (getattr(riesgo, campo_p), getattr(riesgo, campo_c))
+    return par
+
+
+def _medidas(riesgo):
+    # Usa el prefetch: no hay una consulta por riesgo
+    lineas = [medida.descripcion for medida in riesgo.medidas_control.all()]
+    if riesgo.nueva_medida_control:
+        lineas.append(f"Por implementar: {riesgo.nueva_medida_control}")
+    return "\n".join(lineas) or None
+
+
+def fila_desde_riesgo(riesgo, tabla):
+    """DetalleIPER (sin guardar ni matriz) equivalente a un Riesgo con su tarea y proceso."""
+    tarea = riesgo.tarea
+    proceso = tarea.proceso
+    peligro = riesgo.peligro
+    eval_p, eval_s = _evaluacion_inherente(riesgo)
+
+    detalle = DetalleIPER(
+        proceso=f"{proceso.nombre} / {proceso.subproceso}" if proceso.subproceso else proceso.nombre,
+        genero=_genero(tarea),
+        puesto_trabajo=tarea.puesto_trabajo,
+        tarea=tarea.descripcion,
+        tipo_rutina='Rutinaria' if tarea.es_rutinaria else 'No Rutinaria',
+        codigo_riesgo=peligro.codigo,
+        peligro_factor=peligro.familia_riesgo,
+        riesgo=peligro.riesgo_especifico,
+        consecuencia=riesgo.consecuencias or None,
+        gema=None if riesgo.identificacion_gema == Riesgo.Gema.NO_APLICA else riesgo.get_identificacion_gema_display(),
+        medida_control_actual=_medidas(riesgo),
+        # La consecuencia (1, 2, 4) es la severidad en la escala IPER (1, 2, 4, 8)
+        eval_probabilidad=eval_p,
+        eval_severidad=eval_s,
+        requisito_legal=riesgo.requisito_legal or None,
+        responsable_ejecucion=riesgo.responsable_gestion or None,
+        responsable_seguimiento=riesgo.responsable_seguimiento or None,
+        residual_probabilidad=riesgo.probabilidad_residual,
+        residual_severidad=riesgo.consecuencia_residual,
+        condicion_especial=riesgo.medidas_control_especiales or None,
+    )
+    # bulk_create no pasa por save(): la valoración se calcula aquí
+    detalle.calcular_valoracion(tabla)
+    return detalle
+
+
+# --- 2. MIGRACIÓN POR LOTES ---
+
+def _iniciar(matriz):
+    """Crea la MatrizIPER de destino (vacía, con su resumen) y el vínculo de avance."""
+    with transaction.atomic():
+        matriz_iper = MatrizIPER.objects.create(
+            empresa_id=matriz.empresa_id,
+            proyecto=matriz.nombre_proyecto,
+            version=f"{matriz.version}.0",
+        )
+        resumen.crear(matriz_iper.pk)
+        return MigracionMatrizLegacy.objects.create(matriz=matriz, matriz_iper=matriz_iper)
+
+
+def _migrar_lote(migracion, tabla, tamano_lote):
+    """
+    Copia el siguiente lote de riesgos. El avance se lee bloqueado y se
+    actualiza en la misma transacción que las filas: dos ejecuciones
+    simultáneas no pueden copiar el mismo lote. Devuelve las filas creadas.
+    """
+    with transaction.atomic():
+        ultimo = MigracionMatrizLegacy.objects.select_for_update()\
+            .values_list('ultimo_riesgo_id', flat=True).get(pk=migracion.pk)
+        riesgos = list(
+            Riesgo.objects.filter(tarea__proceso__matriz_id=migracion.pk, pk__gt=ultimo)
+            .select_related('tarea__proceso', 'peligro')
+            .prefetch_related('medidas_control')
+            .order_by('pk')[:tamano_lote]
+        )
+        if not riesgos:
+            return 0
+
+        revision = nueva_revision(migracion.matriz_iper_id)
+        filas = [fila_desde_riesgo(riesgo, tabla) for riesgo in riesgos]
+        for fila in filas:
+            fila.matriz_id = migracion.matriz_iper_id
+            fila.revision = revision
+        DetalleIPER.objects.bulk_create(filas, batch_size=TAMANO_LOTE)
+        resumen.aplicar(migracion.matriz_iper_id, resumen.delta_filas(resumen.clasificaciones(f) for f in filas))
+        MigracionMatrizLegacy.objects.filter(pk=migracion.pk).update(
+            ultimo_riesgo_id=riesgos[-1].pk, filas_migradas=F('filas_migradas') + len(filas))
+    return len(filas)
+
+
+def _completar(migracion):
+    with transaction.atomic():
+        if MigracionMatrizLegacy.objects.select_for_update().values_list('completada', flat=True).get(pk=migracion.pk):
+            return
+        revision = MatrizIPER.objects.filter(pk=migracion.matriz_iper_id).values_list('revision', flat=True).get()
+        # Foto base para el historial: las filas migradas no se registran una a una
+        historial.tomar_snapshot(migracion.matriz_iper_id, revision)
+        MigracionMatrizLegacy.objects.filter(pk=migracion.pk).update(completada=True)
+
+
+def migrar_matriz(matriz, tamano_lote=TAMANO_LOTE, rehacer=False, al_avanzar=None):
+    """
+    Aplana la Matriz por procesos en una MatrizIPER de la misma empresa y
+    devuelve su MigracionMatrizLegacy. Si ya estaba migrada no hace nada; si
+    quedó a medias, continúa. Con `rehacer`, elimina la MatrizIPER generada
+    antes y vuelve a empezar. `al_avanzar(migracion, filas_del_lote)` se
+    llama después de cada lote confirmado.
+    """
+    migracion = MigracionMatrizLegacy.objects.filter(matriz=matriz).first()
+    if migracion and rehacer:
+        # Borra la MatrizIPER con sus filas; el vínculo cae en cascada
+        MatrizIPER.objects.filter(pk=migracion.matriz_iper_id).delete()
+        migracion = None
+    if migracion is None:
+        migracion = _iniciar(matriz)
+    if migracion.completada:
+        return migracion
+
+    tabla = escalas.tabla_de_empresa(matriz.empresa)
+    while True:
+        creadas = _migrar_lote(migracion, tabla, tamano_lote)
+        if not creadas:
+            break
+        if al_avanzar:
+            al_avanzar(migracion, creadas)
+    _completar(migracion)
+    migracion.refresh_from_db()
+    return migracion
+
+
+def migrar_matrices(matrices, **opciones):
+    """Migra cada matriz del queryset (con su empresa); devuelve la lista de migraciones."""
+    return [migrar_matriz(matriz, **opciones) for matriz in matrices.select_related('empresa').order_by('pk')]
@@ -2,6 +2,28 @@
 
 from django.db import migrations, models
 
+CAMPOS = [
+    ('eval_probabilidad', models.IntegerField(verbose_name='P', blank=True, null=True, default=0)),
+    ('eval_severidad', models.IntegerField(verbose_name='S', blank=True, null=True, default=0)),
+    ('eval_valor', models.IntegerField(verbose_name='Valor Riesgo', blank=True, null=True, default=0)),
+    ('eval_clasificacion', models.CharField(max_length=50, verbose_name='Clasificación', blank=True, null=True)),
+]
+
+
+def agregar_faltantes(apps, schema_editor):
+    # La 0003 actual ya crea estas columnas; solo faltan en las bases que se
+    # migraron con una versión anterior de ella. En una base nueva (tests,
+    # despliegues desde cero) agregarlas de nuevo fallaría por duplicadas.
+    DetalleIPER = apps.get_model('gestion_riesgos', 'DetalleIPER')
+    tabla = DetalleIPER._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        existentes = {
+            columna.name for columna in schema_editor.connection.introspection.get_table_description(cursor, tabla)
+        }
+    for nombre, _ in CAMPOS:
+        if nombre not in existentes:
+            schema_editor.add_field(DetalleIPER, DetalleIPER._meta.get_field(nombre))
+
 
 class Migration(migrations.Migration):
 
@@ -11,24 +33,13 @@ class Migration(migrations.Migration):
 
     operations = [
         # Add the missing simple evaluation fields
-        migrations.AddField(
-            model_name='detalleiper',
-            name='eval_probabilidad',
-            field=models.IntegerField(verbose_name='P', blank=True, null=True, default=0),
-        ),
-        migrations.AddField(
-            model_name='detalleiper',
-            name='eval_severidad',
-            field=models.IntegerField(verbose_name='S', blank=True, null=True, default=0),
-        ),
-        migrations.AddField(
-            model_name='detalleiper',
-            name='eval_valor',
-            field=models.IntegerField(verbose_name='Valor Riesgo', blank=True, null=True, default=0),
-        ),
-        migrations.AddField(
-            model_name='detalleiper',
-            name='eval_clasificacion',
-            field=models.CharField(max_length=50, verbose_name='Clasificación', blank=True, null=True),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(model_name='detalleiper', name=nombre, field=campo)
+                for nombre, campo in CAMPOS
+            ],
+            database_operations=[
+                migrations.RunPython(agregar_faltantes, migrations.RunPython.noop),
+            ],
         ),
     ]
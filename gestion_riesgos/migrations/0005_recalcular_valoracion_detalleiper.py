@@ -0,0 +1,37 @@
+# Recalcula en la BD el valor y la clasificación de las filas IPER existentes,
+# que hasta ahora escribía la grilla (JS) al abrir cada matriz.
+
+from django.db import migrations
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.lookups import GreaterThanOrEqual
+
+NIVELES = [(16, 'INTOLERABLE'), (8, 'IMPORTANTE'), (4, 'MODERADO'), (2, 'TOLERABLE')]
+
+
+def _factor(campo):
+    return Case(When(**{f'{campo}__gt': 0}, then=F(campo)), default=Value(1), output_field=IntegerField())
+
+
+def _expresiones(prefijo):
+    valor = _factor(f'{prefijo}_probabilidad') * _factor(f'{prefijo}_severidad')
+    clasificacion = Case(
+        *[When(GreaterThanOrEqual(valor, minimo), then=Value(nombre)) for minimo, nombre in NIVELES],
+        default=Value('TRIVIAL'),
+    )
+    return {f'{prefijo}_valor': valor, f'{prefijo}_clasificacion': clasificacion}
+
+
+def recalcular(apps, schema_editor):
+    DetalleIPER = apps.get_model('gestion_riesgos', 'DetalleIPER')
+    DetalleIPER.objects.update(**_expresiones('eval'), **_expresiones('residual'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_riesgos', '0004_add_missing_detalleiper_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(recalcular, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_riesgos', '0005_recalcular_valoracion_detalleiper'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='detalleiper',
+            index=models.Index(fields=['matriz', 'id'], name='detalleiper_matriz_id_idx'),
+        ),
+    ]
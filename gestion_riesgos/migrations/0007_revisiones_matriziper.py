@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_riesgos', '0006_detalleiper_matriz_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilaIPEREliminada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fila_id', models.BigIntegerField()),
+                ('revision', models.PositiveBigIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='detalleiper',
+            name='revision',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='matriziper',
+            name='revision',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='detalleiper',
+            index=models.Index(fields=['matriz', 'revision'], name='detalleiper_matriz_rev_idx'),
+        ),
+        migrations.AddField(
+            model_name='filaipereliminada',
+            name='matriz',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='filas_eliminadas', to='gestion_riesgos.matriziper'),
+        ),
+        migrations.AddIndex(
+            model_name='filaipereliminada',
+            index=models.Index(fields=['matriz', 'revision'], name='filaeliminada_matriz_rev_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_riesgos', '0007_revisiones_matriziper'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioIPER',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fila_id', models.BigIntegerField()),
+                ('tipo', models.CharField(choices=[('C', 'Fila creada'), ('E', 'Celda editada'), ('D', 'Fila eliminada')], default='E', max_length=1)),
+                ('campo', models.CharField(blank=True, max_length=50)),
+                ('valor_anterior', models.JSONField(blank=True, null=True)),
+                ('valor_nuevo', models.JSONField(blank=True, null=True)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('revision', models.PositiveBigIntegerField()),
+                ('matriz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cambios', to='gestion_riesgos.matriziper')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['matriz', 'revision'], name='cambioiper_matriz_rev_idx'), models.Index(fields=['matriz', 'fila_id'], name='cambioiper_matriz_fila_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SnapshotIPER',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revision', models.PositiveBigIntegerField()),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('total_filas', models.PositiveIntegerField(default=0)),
+                ('datos', models.BinaryField()),
+                ('matriz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='gestion_riesgos.matriziper')),
+            ],
+            options={
+                'ordering': ['-revision'],
+                'indexes': [models.Index(fields=['matriz', 'fecha'], name='snapshotiper_matriz_fecha_idx')],
+            },
+        ),
+    ]
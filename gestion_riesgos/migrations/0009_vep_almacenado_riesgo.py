@@ -0,0 +1,139 @@
+# Persiste el VEP y la clasificación de cada evaluación del Riesgo (antes eran
+# propiedades en Python) y los calcula para los riesgos existentes.
+
+from django.db import migrations, models
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest, NullIf
+from django.db.models.lookups import GreaterThanOrEqual
+
+NIVELES = [(9, 'Intolerable'), (5, 'Importante'), (3, 'Moderado'), (0, 'Tolerable')]
+
+EVALUACIONES = {
+    'seguridad': ('probabilidad_seguridad', 'consecuencia_seguridad'),
+    'higienicos': ('probabilidad_higienicos', 'consecuencia_higienicos'),
+    'psicosociales': ('probabilidad_psicosociales', 'consecuencia_psicosociales'),
+    'musculoesqueleticos': ('probabilidad_musculoesqueleticos', 'consecuencia_musculoesqueleticos'),
+    'residual': ('probabilidad_residual', 'consecuencia_residual'),
+    'especial': ('probabilidad_especial', 'consecuencia_especial'),
+}
+INHERENTES = ('seguridad', 'higienicos', 'psicosociales', 'musculoesqueleticos')
+
+
+def _vep(campo_p, campo_c):
+    return Case(
+        When(Q(**{f'{campo_p}__gt': 0}) & Q(**{f'{campo_c}__gt': 0}), then=F(campo_p) * F(campo_c)),
+        default=Value(None),
+        output_field=IntegerField(),
+    )
+
+
+def _clasificacion(vep):
+    return Case(
+        *[When(GreaterThanOrEqual(vep, minimo), then=Value(nombre)) for minimo, nombre in NIVELES],
+        default=Value('No evaluado'),
+    )
+
+
+def recalcular(apps, schema_editor):
+    Riesgo = apps.get_model('gestion_riesgos', 'Riesgo')
+    expresiones = {}
+    for nombre, (campo_p, campo_c) in EVALUACIONES.items():
+        expresiones[f'valor_vep_{nombre}'] = _vep(campo_p, campo_c)
+        expresiones[f'clasificacion_riesgo_{nombre}'] = _clasificacion(_vep(campo_p, campo_c))
+    maximo = NullIf(Greatest(*[Coalesce(_vep(*EVALUACIONES[n]), Value(0)) for n in INHERENTES]), Value(0))
+    expresiones['valor_vep_inherente_maximo'] = maximo
+    expresiones['clasificacion_riesgo_inherente_maximo'] = _clasificacion(maximo)
+    Riesgo.objects.update(**expresiones)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_riesgos', '0008_historial_iper'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='riesgo',
+            name='clasificacion_riesgo_especial',
+            field=models.CharField(default='No evaluado', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='riesgo',
+            name='clasificacion_riesgo_higienicos',
+            field=models.CharField(default='No evaluado', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='riesgo',
+            name='clasificacion_riesgo_inherente_maximo',
+            field=models.CharField(default='No evaluado', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='riesgo',
+            name='clasificacion_riesgo_musculoesqueleticos',
+            field=models.CharField(default='No evaluado', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='riesgo',
+            name='clasificacion_riesgo_psicosociales',
+            field=models.CharField(default='No evaluado', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='riesgo',
+            name='clasificacion_riesgo_residual',
+            field=models.CharField(default='No evaluado', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='riesgo',
+            name='clasificacion_riesgo_seguridad',
+            field=models.CharField(default='No evaluado', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='riesgo',
+            name='valor_vep_especial',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='riesgo',
+            name='valor_vep_higienicos',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='riesgo',
+            name='valor_vep_inherente_maximo',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='riesgo',
+            name='valor_vep_musculoesqueleticos',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='riesgo',
+            name='valor_vep_psicosociales',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='riesgo',
+            name='valor_vep_residual',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='riesgo',
+            name='valor_vep_seguridad',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='riesgo',
+            index=models.Index(fields=['clasificacion_riesgo_inherente_maximo'], name='riesgo_clasif_inherente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='riesgo',
+            index=models.Index(fields=['clasificacion_riesgo_residual'], name='riesgo_clasif_residual_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='riesgo',
+            index=models.Index(fields=['valor_vep_inherente_maximo'], name='riesgo_vep_inherente_idx'),
+        ),
+        migrations.RunPython(recalcular, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Resumen de riesgo por MatrizIPER (conteos por clasificación), con los
+# conteos iniciales de las matrices existentes.
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+CLASIFICACIONES = ['INTOLERABLE', 'IMPORTANTE', 'MODERADO', 'TOLERABLE', 'TRIVIAL']
+
+
+def crear_resumenes(apps, schema_editor):
+    """Cuenta las filas existentes de cada matriz con un único GROUP BY."""
+    MatrizIPER = apps.get_model('gestion_riesgos', 'MatrizIPER')
+    DetalleIPER = apps.get_model('gestion_riesgos', 'DetalleIPER')
+    ResumenMatrizIPER = apps.get_model('gestion_riesgos', 'ResumenMatrizIPER')
+
+    agregados = {'total_filas': Count('id')}
+    for prefijo in ('eval', 'residual'):
+        for clasificacion in CLASIFICACIONES:
+            agregados[f'{prefijo}_{clasificacion.lower()}'] = Count(
+                'id', filter=Q(**{f'{prefijo}_clasificacion': clasificacion}))
+    conteos = {
+        grupo.pop('matriz_id'): grupo
+        for grupo in DetalleIPER.objects.order_by().values('matriz_id').annotate(**agregados)
+    }
+    ResumenMatrizIPER.objects.bulk_create([
+        ResumenMatrizIPER(matriz_id=matriz_id, **conteos.get(matriz_id, {}))
+        for matriz_id in MatrizIPER.objects.values_list('pk', flat=True)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_riesgos', '0009_vep_almacenado_riesgo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenMatrizIPER',
+            fields=[
+                ('matriz', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumen', serialize=False, to='gestion_riesgos.matriziper')),
+                ('total_filas', models.PositiveIntegerField(default=0)),
+                ('eval_intolerable', models.PositiveIntegerField(default=0)),
+                ('eval_importante', models.PositiveIntegerField(default=0)),
+                ('eval_moderado', models.PositiveIntegerField(default=0)),
+                ('eval_tolerable', models.PositiveIntegerField(default=0)),
+                ('eval_trivial', models.PositiveIntegerField(default=0)),
+                ('residual_intolerable', models.PositiveIntegerField(default=0)),
+                ('residual_importante', models.PositiveIntegerField(default=0)),
+                ('residual_moderado', models.PositiveIntegerField(default=0)),
+                ('residual_tolerable', models.PositiveIntegerField(default=0)),
+                ('residual_trivial', models.PositiveIntegerField(default=0)),
+                ('actualizado', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(crear_resumenes, migrations.RunPython.noop),
+    ]
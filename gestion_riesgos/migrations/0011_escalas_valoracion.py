@@ -0,0 +1,81 @@
+# Escalas de valoración configurables de la Matriz IPER, con dos escalas de
+# partida: la estándar (la que ya se usaba, predeterminada) y la de la matriz
+# por procesos. Como la estándar no cambia ningún umbral, las filas existentes
+# no se recalculan.
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+COLORES = {
+    'INTOLERABLE': ('#ef5350', '#ffffff'),
+    'IMPORTANTE': ('#ffa726', '#ffffff'),
+    'MODERADO': ('#fff176', '#333333'),
+    'TOLERABLE': ('#66bb6a', '#ffffff'),
+    'TRIVIAL': ('#a5d6a7', '#1b5e20'),
+}
+ESCALAS = [
+    ('IPER estándar (P x S)', 'Umbrales de la planilla IPER: 16, 8, 4, 2.', True,
+     [(16, 'INTOLERABLE'), (8, 'IMPORTANTE'), (4, 'MODERADO'), (2, 'TOLERABLE'), (0, 'TRIVIAL')]),
+    ('Matriz por procesos (VEP)', 'Umbrales del VEP de la matriz por procesos: 9, 5, 3.', False,
+     [(9, 'INTOLERABLE'), (5, 'IMPORTANTE'), (3, 'MODERADO'), (0, 'TOLERABLE')]),
+]
+
+
+def crear_escalas(apps, schema_editor):
+    EscalaValoracion = apps.get_model('gestion_riesgos', 'EscalaValoracion')
+    NivelEscala = apps.get_model('gestion_riesgos', 'NivelEscala')
+    for nombre, descripcion, predeterminada, niveles in ESCALAS:
+        escala, creada = EscalaValoracion.objects.get_or_create(
+            nombre=nombre, defaults={'descripcion': descripcion, 'predeterminada': predeterminada})
+        if creada:
+            NivelEscala.objects.bulk_create([
+                NivelEscala(escala=escala, valor_minimo=minimo, clasificacion=clasificacion,
+                            color=COLORES[clasificacion][0], color_texto=COLORES[clasificacion][1])
+                for minimo, clasificacion in niveles
+            ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_riesgos', '0010_resumen_matriz_iper'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EscalaValoracion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100, unique=True)),
+                ('descripcion', models.TextField(blank=True)),
+                ('predeterminada', models.BooleanField(default=False)),
+                ('actualizada', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Escala de valoración',
+                'verbose_name_plural': 'Escalas de valoración',
+                'ordering': ['nombre'],
+            },
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='escala_valoracion',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='empresas', to='gestion_riesgos.escalavaloracion', verbose_name='Escala de valoración'),
+        ),
+        migrations.CreateModel(
+            name='NivelEscala',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clasificacion', models.CharField(choices=[('INTOLERABLE', 'Intolerable'), ('IMPORTANTE', 'Importante'), ('MODERADO', 'Moderado'), ('TOLERABLE', 'Tolerable'), ('TRIVIAL', 'Trivial')], max_length=20)),
+                ('valor_minimo', models.PositiveIntegerField(help_text='Valor P x S desde el que rige este nivel')),
+                ('color', models.CharField(default='#cccccc', help_text='Color de fondo (#RRGGBB)', max_length=7)),
+                ('color_texto', models.CharField(default='#ffffff', help_text='Color del texto (#RRGGBB)', max_length=7)),
+                ('escala', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='niveles', to='gestion_riesgos.escalavaloracion')),
+            ],
+            options={
+                'ordering': ['escala', '-valor_minimo'],
+                'constraints': [models.UniqueConstraint(fields=('escala', 'clasificacion'), name='nivelescala_clasificacion_unica'), models.UniqueConstraint(fields=('escala', 'valor_minimo'), name='nivelescala_minimo_unico')],
+            },
+        ),
+        migrations.RunPython(crear_escalas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_riesgos', '0011_escalas_valoracion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MigracionMatrizLegacy',
+            fields=[
+                ('matriz', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='migracion_iper', serialize=False, to='gestion_riesgos.matriz')),
+                ('ultimo_riesgo_id', models.BigIntegerField(default=0)),
+                ('filas_migradas', models.PositiveIntegerField(default=0)),
+                ('completada', models.BooleanField(default=False)),
+                ('iniciada', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actualizada', models.DateTimeField(auto_now=True)),
+                ('matriz_iper', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='origen_legacy', to='gestion_riesgos.matriziper')),
+            ],
+            options={
+                'verbose_name': 'Migración de matriz por procesos',
+                'verbose_name_plural': 'Migraciones de matrices por procesos',
+            },
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Índice de búsqueda de texto (ver gestion_riesgos/busqueda.py). Además de la
+# tabla de documentos, crea el índice de texto propio de cada motor:
+# - SQLite: tabla virtual FTS5 (contenido externo) y los triggers que la
+#   mantienen al día con cada INSERT/UPDATE/DELETE de la tabla de documentos.
+# - PostgreSQL: índice GIN sobre to_tsvector('simple', texto).
+# El contenido se carga con `manage.py reindexar_busqueda`.
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+TABLA = 'gestion_riesgos_indicebusqueda'
+FTS = 'gestion_riesgos_indicebusqueda_fts'
+
+SQL_SQLITE = [
+    f"CREATE VIRTUAL TABLE {FTS} USING fts5(texto, content='{TABLA}', content_rowid='id')",
+    f"""CREATE TRIGGER {FTS}_ai AFTER INSERT ON {TABLA} BEGIN
+        INSERT INTO {FTS}(rowid, texto) VALUES (new.id, new.texto);
+    END""",
+    f"""CREATE TRIGGER {FTS}_ad AFTER DELETE ON {TABLA} BEGIN
+        INSERT INTO {FTS}({FTS}, rowid, texto) VALUES ('delete', old.id, old.texto);
+    END""",
+    f"""CREATE TRIGGER {FTS}_au AFTER UPDATE ON {TABLA} BEGIN
+        INSERT INTO {FTS}({FTS}, rowid, texto) VALUES ('delete', old.id, old.texto);
+        INSERT INTO {FTS}(rowid, texto) VALUES (new.id, new.texto);
+    END""",
+]
+SQL_SQLITE_REVERSA = [
+    f"DROP TRIGGER IF EXISTS {FTS}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS}_au",
+    f"DROP TABLE IF EXISTS {FTS}",
+]
+
+
+def _indice_gin():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+    return GinIndex(SearchVector('texto', config='simple'), name='indicebusqueda_texto_gin')
+
+
+def crear_indice_texto(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for sql in SQL_SQLITE:
+            schema_editor.execute(sql)
+    elif vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('gestion_riesgos', 'IndiceBusqueda'), _indice_gin())
+
+
+def eliminar_indice_texto(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for sql in SQL_SQLITE_REVERSA:
+            schema_editor.execute(sql)
+    elif vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('gestion_riesgos', 'IndiceBusqueda'), _indice_gin())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_riesgos', '0012_migracion_matriz_legacy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matriziper',
+            name='revision_indexada',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='IndiceBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('fila', 'Fila IPER'), ('peligro', 'Peligro'), ('normativa', 'Normativa')], max_length=10)),
+                ('objeto_id', models.BigIntegerField()),
+                ('titulo', models.CharField(max_length=255)),
+                ('extracto', models.TextField(blank=True)),
+                ('texto', models.TextField()),
+                ('empresa', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='gestion_riesgos.empresa')),
+                ('matriz', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='gestion_riesgos.matriziper')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['empresa', 'tipo'], name='indicebusqueda_empresa_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'objeto_id'), name='indicebusqueda_objeto_unico')],
+            },
+        ),
+        migrations.RunPython(crear_indice_texto, eliminar_indice_texto),
+    ]
@@ -0,0 +1,21 @@
+# La versión del índice de autocompletado se deriva del catálogo en la BD
+# (fecha del último cambio y cantidad de peligros), igual en todos los procesos.
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_riesgos', '0013_indice_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='peligro',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,21 @@
+# La huella de los mapas de calor de Riesgo se deriva de la BD (fecha del
+# último cambio y cantidad de riesgos), igual en todos los procesos.
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_riesgos', '0014_peligro_actualizado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='riesgo',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Las versiones de los datos del dashboard por usuario se derivan de la BD
+# (fecha del último cambio y cantidad), igual en todos los procesos.
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_riesgos', '0015_riesgo_actualizado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empresa',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='medidacontrol',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -3,8 +3,11 @@
 from django.db import models
 from django.conf import settings
 from django.urls import reverse
+from django.utils import timezone
 import uuid
 
+from . import valoracion
+
 # --- MÓDULO 1: GESTIÓN DE EMPRESAS Y USUARIOS ---
 
 class Empresa(models.Model):
@@ -15,6 +18,13 @@ class Empresa(models.Model):
     direccion = models.CharField(max_length=255, blank=True)
     telefono = models.CharField(max_length=20, blank=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Junto con los de riesgos, medidas y agenda, da las versiones del dashboard (gestion_riesgos/tablero.py)
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
+    # Metodología de valoración de sus matrices IPER; vacía = la predeterminada
+    escala_valoracion = models.ForeignKey(
+        'EscalaValoracion', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='empresas', verbose_name="Escala de valoración",
+    )
 
     def __str__(self):
         return self.razon_social
@@ -41,6 +51,8 @@ class Peligro(models.Model):
     riesgo_especifico = models.CharField(max_length=255, help_text="Ej: Caída de personas")
     definicion = models.TextField(blank=True)
     codigo = models.CharField(max_length=10, unique=True)
+    # Junto con la cantidad de peligros, da la versión del catálogo (gestion_riesgos/catalogo.py)
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.riesgo_especifico} ({self.codigo})"
@@ -86,6 +98,21 @@ class Tarea(models.Model):
         return self.descripcion
 
 # --- MODELO RIESGO ACTUALIZADO CON LÓGICA DE EVALUACIÓN POR CATEGORÍAS (SIN ABREVIACIONES) ---
+class RiesgoQuerySet(models.QuerySet):
+    def recalcular_vep(self):
+        """Recalcula VEP y clasificaciones de los riesgos en la BD (set-based)."""
+        expresiones = {}
+        veps = {}
+        for nombre, (campo_p, campo_c) in Riesgo.EVALUACIONES_VEP.items():
+            veps[nombre] = valoracion.expresion_vep(campo_p, campo_c)
+            expresiones[f'valor_vep_{nombre}'] = veps[nombre]
+            expresiones[f'clasificacion_riesgo_{nombre}'] = valoracion.expresion_clasificacion_vep(veps[nombre])
+        maximo = valoracion.expresion_vep_maximo(*[veps[nombre] for nombre in Riesgo.CATEGORIAS_INHERENTES])
+        expresiones['valor_vep_inherente_maximo'] = maximo
+        expresiones['clasificacion_riesgo_inherente_maximo'] = valoracion.expresion_clasificacion_vep(maximo)
+        # update() no aplica auto_now: se marca a mano para que cambie la huella de los mapas de calor
+        return self.update(actualizado=timezone.now(), **expresiones)
+
 class Riesgo(models.Model):
     class Probabilidad(models.IntegerChoices):
         BAJA = 1, 'Baja'
@@ -162,90 +189,71 @@ class Riesgo(models.Model):
     probabilidad_especial = models.PositiveIntegerField("Probabilidad Especial", choices=Probabilidad.choices, null=True, blank=True)
     consecuencia_especial = models.PositiveIntegerField("Consecuencia Especial", choices=Consecuencia.choices, null=True, blank=True)
 
-    # --- MÉTODOS PRIVADOS DE CÁLCULO ---
-    def _calcular_vep(self, probabilidad, consecuencia):
-        if probabilidad and consecuencia:
-            return probabilidad * consecuencia
-        return None
-
-    def _clasificar_riesgo(self, vep):
-        if vep is None: return "No evaluado"
-        # Valores actualizados según la lógica P(1,2,4) * C(1,2,4) -> Max 16
-        if vep >= 9: return "Intolerable" # 4x4, 4x3(no existe), 3x4(no existe), 3x3(no existe) -> 16, 12, 9
-        if vep >= 5: return "Importante" # -> 8, 6
-        if vep >= 3: return "Moderado" # -> 4, 3
-        return "Tolerable" # -> 2, 1
-
-    # --- PROPIEDADES PARA CÁLCULOS DE SEGURIDAD Y EMERGENCIAS ---
-    @property
-    def valor_vep_seguridad(self):
-        return self._calcular_vep(self.probabilidad_seguridad, self.consecuencia_seguridad)
-
-    @property
-    def clasificacion_riesgo_seguridad(self):
-        return self._clasificar_riesgo(self.valor_vep_seguridad)
-
-    # --- PROPIEDADES PARA CÁLCULOS HIGIÉNICOS ---
-    @property
-    def valor_vep_higienicos(self):
-        return self._calcular_vep(self.probabilidad_higienicos, self.consecuencia_higienicos)
-
-    @property
-    def clasificacion_riesgo_higienicos(self):
-        return self._clasificar_riesgo(self.valor_vep_higienicos)
-
-    # --- PROPIEDADES PARA CÁLCULOS PSICOSOCIALES ---
-    @property
-    def valor_vep_psicosociales(self):
-        return self._calcular_vep(self.probabilidad_psicosociales, self.consecuencia_psicosociales)
-    
-    @property
-    def clasificacion_riesgo_psicosociales(self):
-        return self._clasificar_riesgo(self.valor_vep_psicosociales)
-
-    # --- PROPIEDADES PARA CÁLCULOS MÚSCULO-ESQUELÉTICOS ---
-    @property
-    def valor_vep_musculoesqueleticos(self):
-        return self._calcular_vep(self.probabilidad_musculoesqueleticos, self.consecuencia_musculoesqueleticos)
+    # --- VEP Y CLASIFICACIONES (calculados al guardar, persistidos para agrupar en SQL) ---
+    valor_vep_seguridad = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    clasificacion_riesgo_seguridad = models.CharField(max_length=20, default=valoracion.SIN_EVALUAR, editable=False)
+    valor_vep_higienicos = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    clasificacion_riesgo_higienicos = models.CharField(max_length=20, default=valoracion.SIN_EVALUAR, editable=False)
+    valor_vep_psicosociales = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    clasificacion_riesgo_psicosociales = models.CharField(max_length=20, default=valoracion.SIN_EVALUAR, editable=False)
+    valor_vep_musculoesqueleticos = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    clasificacion_riesgo_musculoesqueleticos = models.CharField(max_length=20, default=valoracion.SIN_EVALUAR, editable=False)
+    # El VEP inherente más alto de todas las categorías
+    valor_vep_inherente_maximo = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    clasificacion_riesgo_inherente_maximo = models.CharField(max_length=20, default=valoracion.SIN_EVALUAR, editable=False)
+    valor_vep_residual = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    clasificacion_riesgo_residual = models.CharField(max_length=20, default=valoracion.SIN_EVALUAR, editable=False)
+    # Riesgo especial (Paso 25/26)
+    valor_vep_especial = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    clasificacion_riesgo_especial = models.CharField(max_length=20, default=valoracion.SIN_EVALUAR, editable=False)
+    # Junto con la cantidad de riesgos, da la huella de los mapas de calor (gestion_riesgos/mapa_calor.py)
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
+
+    # Evaluación -> (campo probabilidad, campo consecuencia)
+    EVALUACIONES_VEP = {
+        'seguridad': ('probabilidad_seguridad', 'consecuencia_seguridad'),
+        'higienicos': ('probabilidad_higienicos', 'consecuencia_higienicos'),
+        'psicosociales': ('probabilidad_psicosociales', 'consecuencia_psicosociales'),
+        'musculoesqueleticos': ('probabilidad_musculoesqueleticos', 'consecuencia_musculoesqueleticos'),
+        'residual': ('probabilidad_residual', 'consecuencia_residual'),
+        'especial': ('probabilidad_especial', 'consecuencia_especial'),
+    }
+    # Categorías que cuentan para el riesgo inherente máximo
+    CATEGORIAS_INHERENTES = ('seguridad', 'higienicos', 'psicosociales', 'musculoesqueleticos')
+
+    objects = RiesgoQuerySet.as_manager()
 
-    @property
-    def clasificacion_riesgo_musculoesqueleticos(self):
-        return self._clasificar_riesgo(self.valor_vep_musculoesqueleticos)
-
-    # --- PROPIEDADES PARA EL RIESGO INHERENTE MÁXIMO ---
-    @property
-    def valor_vep_inherente_maximo(self):
-        """Devuelve el VEP inherente más alto de todas las categorías."""
-        veps = [
-            self.valor_vep_seguridad, 
-            self.valor_vep_higienicos, 
-            self.valor_vep_psicosociales, 
-            self.valor_vep_musculoesqueleticos
+    class Meta:
+        indexes = [
+            models.Index(fields=['clasificacion_riesgo_inherente_maximo'], name='riesgo_clasif_inherente_idx'),
+            models.Index(fields=['clasificacion_riesgo_residual'], name='riesgo_clasif_residual_idx'),
+            models.Index(fields=['valor_vep_inherente_maximo'], name='riesgo_vep_inherente_idx'),
         ]
-        valid_veps = [v for v in veps if v is not None]
-        return max(valid_veps) if valid_veps else None
-
-    @property
-    def clasificacion_riesgo_inherente_maximo(self):
-        return self._clasificar_riesgo(self.valor_vep_inherente_maximo)
-
-    # --- PROPIEDADES PARA EL RIESGO RESIDUAL ---
-    @property
-    def valor_vep_residual(self):
-        return self._calcular_vep(self.probabilidad_residual, self.consecuencia_residual)
 
-    @property
-    def clasificacion_riesgo_residual(self):
-        return self._clasificar_riesgo(self.valor_vep_residual)
-    
-    # --- PROPIEDADES PARA EL RIESGO ESPECIAL (Paso 25/26) ---
-    @property
-    def valor_vep_especial(self):
-        return self._calcular_vep(self.probabilidad_especial, self.consecuencia_especial)
-
-    @property
-    def clasificacion_riesgo_especial(self):
-        return self._clasificar_riesgo(self.valor_vep_especial)
+    @classmethod
+    def campos_calculados(cls):
+        campos = []
+        for nombre in [*cls.EVALUACIONES_VEP, 'inherente_maximo']:
+            campos += [f'valor_vep_{nombre}', f'clasificacion_riesgo_{nombre}']
+        return campos
+
+    def calcular_vep(self):
+        """Deriva el VEP y la clasificación de cada evaluación, y el inherente máximo."""
+        for nombre, (campo_p, campo_c) in self.EVALUACIONES_VEP.items():
+            vep = valoracion.calcular_vep(getattr(self, campo_p), getattr(self, campo_c))
+            setattr(self, f'valor_vep_{nombre}', vep)
+            setattr(self, f'clasificacion_riesgo_{nombre}', valoracion.clasificar_vep(vep))
+        veps = [getattr(self, f'valor_vep_{nombre}') for nombre in self.CATEGORIAS_INHERENTES]
+        veps = [vep for vep in veps if vep is not None]
+        self.valor_vep_inherente_maximo = max(veps) if veps else None
+        self.clasificacion_riesgo_inherente_maximo = valoracion.clasificar_vep(self.valor_vep_inherente_maximo)
+
+    def save(self, *args, **kwargs):
+        self.calcular_vep()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(self.campos_calculados()) | {'actualizado'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return str(self.peligro)
@@ -254,6 +262,7 @@ class MedidaControl(models.Model):
     """Medida de control existente (Paso 14)"""
     riesgo = models.ForeignKey(Riesgo, on_delete=models.CASCADE, related_name="medidas_control")
     descripcion = models.TextField()
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
     
     def __str__(self):
         return self.descripcion[:50]
@@ -328,12 +337,43 @@ class MatrizIPER(models.Model):
     # Logo específico para esta matriz (opcional, si difiere del de la empresa)
     logo_cliente = models.ImageField(upload_to='logos_matrices/', blank=True, null=True, verbose_name="Logo Cliente")
 
+    # Contador de cambios de las filas (sincronización entre pestañas/usuarios)
+    revision = models.PositiveBigIntegerField(default=0, editable=False)
+    # Última revisión cuyas filas ya están en el índice de búsqueda (busqueda.py)
+    revision_indexada = models.PositiveBigIntegerField(default=0, editable=False)
+
     def __str__(self):
         return f"IPER {self.codigo_documento} - {self.empresa.razon_social}"
 
+    def recalcular_valoracion(self):
+        """Recalcula valor y clasificación de todas las filas con un UPDATE masivo."""
+        return self.filas.recalcular_valoracion()
+
 # ==========================================
 # 2. FILAS DE LA MATRIZ (El "Excel")
 # ==========================================
+class DetalleIPERQuerySet(models.QuerySet):
+    def recalcular_valoracion(self, tabla=None):
+        """
+        Recalcula la evaluación pura y residual de las filas en la BD (set-based).
+        Con `tabla` (TablaValoracion) es un único UPDATE; sin ella cada fila usa
+        la escala de su empresa, con un UPDATE por escala presente.
+        """
+        if tabla is not None:
+            return self.update(
+                **tabla.expresiones_valoracion('eval_probabilidad', 'eval_severidad', 'eval_valor', 'eval_clasificacion'),
+                **tabla.expresiones_valoracion('residual_probabilidad', 'residual_severidad', 'residual_valor', 'residual_clasificacion'),
+            )
+        from .escalas import tabla_de_escala
+
+        actualizadas = 0
+        escalas = self.order_by().values_list('matriz__empresa__escala_valoracion', flat=True).distinct()
+        for escala_id in list(escalas):
+            filas = self.filter(matriz__empresa__escala_valoracion=escala_id) if escala_id \
+                else self.filter(matriz__empresa__escala_valoracion__isnull=True)
+            actualizadas += filas.recalcular_valoracion(tabla_de_escala(escala_id))
+        return actualizadas
+
 class DetalleIPER(models.Model):
     """
     Cada fila de la matriz IPER.
@@ -377,5 +417,272 @@ class DetalleIPER(models.Model):
     condicion_especial = models.TextField(verbose_name="Condición Especial", blank=True, null=True, help_text="Si no cuenta con trabajadores...")
     reevaluacion = models.TextField(verbose_name="Reevaluación Especial", blank=True, null=True)
 
+    # Revisión de la matriz en la que se creó o modificó la fila por última vez
+    revision = models.PositiveBigIntegerField(default=0, editable=False)
+
+    # Campos derivados de P x S: los calcula el servidor, nunca la grilla
+    CAMPOS_VALORACION = {
+        'eval_probabilidad': ('eval_valor', 'eval_clasificacion'),
+        'eval_severidad': ('eval_valor', 'eval_clasificacion'),
+        'residual_probabilidad': ('residual_valor', 'residual_clasificacion'),
+        'residual_severidad': ('residual_valor', 'residual_clasificacion'),
+    }
+
+    objects = DetalleIPERQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['id'] # Para mantener el orden de creación
+        indexes = [
+            # Paginación por clave (matriz, id) para la API de filas
+            models.Index(fields=['matriz', 'id'], name='detalleiper_matriz_id_idx'),
+            # Consulta de "filas cambiadas desde la revisión N"
+            models.Index(fields=['matriz', 'revision'], name='detalleiper_matriz_rev_idx'),
+        ]
+
+    def calcular_valoracion(self, tabla=None):
+        """
+        Deriva valor y clasificación (pura y residual) desde probabilidad/severidad,
+        con la escala de la empresa de la matriz si no se indica `tabla`.
+        """
+        if tabla is None:
+            from .escalas import tabla_de_matriz
+            tabla = tabla_de_matriz(self.matriz_id)
+        self.eval_valor, self.eval_clasificacion = tabla.valorar(self.eval_probabilidad, self.eval_severidad)
+        self.residual_valor, self.residual_clasificacion = tabla.valorar(self.residual_probabilidad, self.residual_severidad)
+
+    def save(self, *args, **kwargs):
+        self.calcular_valoracion()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            # Si se guardó P o S, también deben guardarse sus campos derivados
+            extra = set()
+            for campo in update_fields:
+                extra.update(self.CAMPOS_VALORACION.get(campo, ()))
+            kwargs['update_fields'] = set(update_fields) | extra
+        super().save(*args, **kwargs)
+
+    @property
+    def eval_css(self):
+        return valoracion.clase_css(self.eval_clasificacion)
+
+    @property
+    def residual_css(self):
+        return valoracion.clase_css(self.residual_clasificacion)
+
+class FilaIPEREliminada(models.Model):
+    """
+    Registro mínimo de una fila borrada, para que la sincronización por
+    revisiones pueda informar eliminaciones a los clientes.
+    """
+    matriz = models.ForeignKey(MatrizIPER, on_delete=models.CASCADE, related_name='filas_eliminadas')
+    fila_id = models.BigIntegerField()
+    revision = models.PositiveBigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['matriz', 'revision'], name='filaeliminada_matriz_rev_idx'),
+        ]
+
+    def __str__(self):
+        return f"Fila {self.fila_id} eliminada (rev. {self.revision})"
+
+# ==========================================
+# 3. HISTORIAL DE CAMBIOS (Auditoría)
+# ==========================================
+class CambioIPER(models.Model):
+    """
+    Registro append-only de las ediciones de la grilla: una entrada por celda
+    modificada (o por fila creada/eliminada), escrita en la misma transacción.
+    """
+    CREACION = 'C'
+    EDICION = 'E'
+    ELIMINACION = 'D'
+    TIPO_CHOICES = [
+        (CREACION, 'Fila creada'),
+        (EDICION, 'Celda editada'),
+        (ELIMINACION, 'Fila eliminada'),
+    ]
+
+    matriz = models.ForeignKey(MatrizIPER, on_delete=models.CASCADE, related_name='cambios')
+    fila_id = models.BigIntegerField()
+    tipo = models.CharField(max_length=1, choices=TIPO_CHOICES, default=EDICION)
+    # Para ediciones: nombre del campo; en creaciones/eliminaciones queda vacío
+    campo = models.CharField(max_length=50, blank=True)
+    # En creaciones/eliminaciones el valor es la fila completa (dict campo -> valor)
+    valor_anterior = models.JSONField(null=True, blank=True)
+    valor_nuevo = models.JSONField(null=True, blank=True)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    fecha = models.DateTimeField(default=timezone.now)
+    revision = models.PositiveBigIntegerField()
+
     class Meta:
-        ordering = ['id'] # Para mantener el orden de creación
\ No newline at end of file
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['matriz', 'revision'], name='cambioiper_matriz_rev_idx'),
+            models.Index(fields=['matriz', 'fila_id'], name='cambioiper_matriz_fila_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} fila {self.fila_id} {self.campo} (rev. {self.revision})"
+
+class SnapshotIPER(models.Model):
+    """
+    Foto comprimida (JSON + zlib) de todas las filas de la matriz en una revisión.
+    Se toma cada cierta cantidad de cambios, así reconstruir una versión pasada
+    solo requiere aplicar los cambios posteriores a la foto más cercana.
+    """
+    matriz = models.ForeignKey(MatrizIPER, on_delete=models.CASCADE, related_name='snapshots')
+    revision = models.PositiveBigIntegerField()
+    fecha = models.DateTimeField(default=timezone.now)
+    total_filas = models.PositiveIntegerField(default=0)
+    datos = models.BinaryField()
+
+    class Meta:
+        ordering = ['-revision']
+        indexes = [
+            models.Index(fields=['matriz', 'fecha'], name='snapshotiper_matriz_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"Snapshot {self.matriz_id} rev. {self.revision} ({self.total_filas} filas)"
+
+class ResumenMatrizIPER(models.Model):
+    """
+    Conteos de filas de una MatrizIPER por clasificación (pura y residual).
+    Se mantiene con deltas en la misma transacción de cada escritura de filas
+    (ver resumen.py), así los listados muestran el estado de riesgo de muchas
+    matrices sin recorrer sus filas. El comando recalcular_resumen_iper lo
+    reconstruye si se desfasa.
+    """
+    matriz = models.OneToOneField(MatrizIPER, on_delete=models.CASCADE, primary_key=True, related_name='resumen')
+    total_filas = models.PositiveIntegerField(default=0)
+
+    eval_intolerable = models.PositiveIntegerField(default=0)
+    eval_importante = models.PositiveIntegerField(default=0)
+    eval_moderado = models.PositiveIntegerField(default=0)
+    eval_tolerable = models.PositiveIntegerField(default=0)
+    eval_trivial = models.PositiveIntegerField(default=0)
+
+    residual_intolerable = models.PositiveIntegerField(default=0)
+    residual_importante = models.PositiveIntegerField(default=0)
+    residual_moderado = models.PositiveIntegerField(default=0)
+    residual_tolerable = models.PositiveIntegerField(default=0)
+    residual_trivial = models.PositiveIntegerField(default=0)
+
+    # Última escritura de filas de la matriz
+    actualizado = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Resumen {self.matriz_id} ({self.total_filas} filas)"
+
+# ==========================================
+# 4. ESCALAS DE VALORACIÓN (Matriz IPER)
+# ==========================================
+class EscalaValoracion(models.Model):
+    """
+    Metodología de valoración P x S de la matriz IPER: el valor mínimo de
+    cada nivel y su color. Se compila en una tabla P x S -> (valor,
+    clasificación) que usan los guardados, el recálculo masivo y la grilla
+    (ver escalas.py).
+    """
+    nombre = models.CharField(max_length=100, unique=True)
+    descripcion = models.TextField(blank=True)
+    # Rige para las empresas que no eligieron escala; solo una puede serlo
+    predeterminada = models.BooleanField(default=False)
+    actualizada = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['nombre']
+        verbose_name = "Escala de valoración"
+        verbose_name_plural = "Escalas de valoración"
+
+    def __str__(self):
+        return self.nombre
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if self.predeterminada:
+            EscalaValoracion.objects.exclude(pk=self.pk).filter(predeterminada=True).update(predeterminada=False)
+
+class NivelEscala(models.Model):
+    """Un nivel de la escala: desde qué valor P x S rige y cómo se pinta."""
+    # Los nombres son fijos (resúmenes, semáforo y reportes cuentan por clasificación);
+    # cada escala define sus umbrales y colores
+    CLASIFICACION_CHOICES = [(nombre, nombre.capitalize()) for _, nombre, _ in valoracion.NIVELES_IPER]
+
+    escala = models.ForeignKey(EscalaValoracion, on_delete=models.CASCADE, related_name='niveles')
+    clasificacion = models.CharField(max_length=20, choices=CLASIFICACION_CHOICES)
+    valor_minimo = models.PositiveIntegerField(help_text="Valor P x S desde el que rige este nivel")
+    color = models.CharField(max_length=7, default='#cccccc', help_text="Color de fondo (#RRGGBB)")
+    color_texto = models.CharField(max_length=7, default='#ffffff', help_text="Color del texto (#RRGGBB)")
+
+    class Meta:
+        ordering = ['escala', '-valor_minimo']
+        constraints = [
+            models.UniqueConstraint(fields=['escala', 'clasificacion'], name='nivelescala_clasificacion_unica'),
+            models.UniqueConstraint(fields=['escala', 'valor_minimo'], name='nivelescala_minimo_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.escala}: {self.clasificacion} (>= {self.valor_minimo})"
+
+# ==========================================
+# 5. MIGRACIÓN DESDE LA MATRIZ POR PROCESOS
+# ==========================================
+class MigracionMatrizLegacy(models.Model):
+    """
+    Vínculo entre una Matriz por procesos y la MatrizIPER en que se aplanó
+    (ver migracion_legacy.py). Guarda el último Riesgo copiado, así una
+    migración interrumpida continúa donde quedó y una completa no se repite.
+    """
+    matriz = models.OneToOneField(Matriz, on_delete=models.CASCADE, primary_key=True, related_name='migracion_iper')
+    # Si se elimina la MatrizIPER generada, el vínculo desaparece y se puede volver a migrar
+    matriz_iper = models.OneToOneField(MatrizIPER, on_delete=models.CASCADE, related_name='origen_legacy')
+    ultimo_riesgo_id = models.BigIntegerField(default=0)
+    filas_migradas = models.PositiveIntegerField(default=0)
+    completada = models.BooleanField(default=False)
+    iniciada = models.DateTimeField(default=timezone.now)
+    actualizada = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Migración de matriz por procesos"
+        verbose_name_plural = "Migraciones de matrices por procesos"
+
+    def __str__(self):
+        estado = "completa" if self.completada else f"hasta riesgo {self.ultimo_riesgo_id}"
+        return f"{self.matriz} -> IPER {self.matriz_iper_id} ({estado})"
+
+# ==========================================
+# 6. BÚSQUEDA DE TEXTO
+# ==========================================
+class IndiceBusqueda(models.Model):
+    """
+    Un documento del índice de búsqueda (ver busqueda.py): una fila IPER, un
+    peligro o una normativa. `texto` guarda los términos ya normalizados (sin
+    tildes, sin palabras vacías y reducidos a su raíz); sobre él se indexa con
+    FTS5 en SQLite y con tsvector + GIN en PostgreSQL.
+    """
+    FILA = 'fila'
+    PELIGRO = 'peligro'
+    NORMATIVA = 'normativa'
+    TIPO_CHOICES = [(FILA, 'Fila IPER'), (PELIGRO, 'Peligro'), (NORMATIVA, 'Normativa')]
+
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    objeto_id = models.BigIntegerField()
+    # Alcance: las filas pertenecen a una empresa; el catálogo (peligros, normativa) es común
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    matriz = models.ForeignKey(MatrizIPER, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    titulo = models.CharField(max_length=255)
+    extracto = models.TextField(blank=True)
+    texto = models.TextField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'objeto_id'], name='indicebusqueda_objeto_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['empresa', 'tipo'], name='indicebusqueda_empresa_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.objeto_id}: {self.titulo}"
@@ -0,0 +1,131 @@
+# gestion_riesgos/resumen.py
+"""
+Resumen de riesgo por MatrizIPER (ResumenMatrizIPER).
+
+Cada camino de escritura de filas (grilla, importación, clonación) arma un
+delta de conteos y lo suma con un UPDATE ... SET campo = campo + n dentro de
+su transacción; nunca se recorren las filas de la matriz. recalcular() y
+recalcular_matrices() cuentan desde cero, para matrices sin resumen y para
+reparar desfases.
+"""
+from collections import Counter
+
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from . import valoracion
+from .models import DetalleIPER, ResumenMatrizIPER
+
+PREFIJOS = ('eval', 'residual')
+CLASIFICACIONES = [nombre for _, nombre, _ in valoracion.NIVELES_IPER]
+
+
+def campo_conteo(prefijo, clasificacion):
+    """('eval', 'INTOLERABLE') -> 'eval_intolerable'"""
+    return f"{prefijo}_{clasificacion.lower()}"
+
+
+CAMPOS_CONTEO = ['total_filas'] + [campo_conteo(p, c) for p in PREFIJOS for c in CLASIFICACIONES]
+
+
+def clasificaciones(detalle):
+    return (detalle.eval_clasificacion, detalle.residual_clasificacion)
+
+
+# --- 1. DELTAS ---
+
+def delta_filas(lista_clasificaciones, signo=1):
+    """Delta por filas creadas (signo=1) o eliminadas (signo=-1), dadas sus clasificaciones."""
+    delta = Counter()
+    for par in lista_clasificaciones:
+        delta['total_filas'] += signo
+        for prefijo, clasificacion in zip(PREFIJOS, par):
+            # Una fila sin clasificar (insertada sin pasar por save()) solo suma al total
+            if clasificacion:
+                delta[campo_conteo(prefijo, clasificacion)] += signo
+    return delta
+
+
+def delta_edicion(antes, despues):
+    """Delta por una fila cuyas clasificaciones pasaron de `antes` a `despues`."""
+    delta = Counter()
+    for prefijo, anterior, nueva in zip(PREFIJOS, antes, despues):
+        if anterior == nueva:
+            continue
+        if anterior:
+            delta[campo_conteo(prefijo, anterior)] -= 1
+        if nueva:
+            delta[campo_conteo(prefijo, nueva)] += 1
+    return delta
+
+
+def aplicar(matriz_id, delta):
+    """
+    Suma el delta al resumen de la matriz y marca la fecha de actualización.
+    Debe llamarse dentro de la transacción y después de escribir las filas:
+    si la matriz todavía no tiene resumen, se cuenta completo desde la BD.
+    """
+    cambios = {campo: F(campo) + cantidad for campo, cantidad in delta.items() if cantidad}
+    actualizados = ResumenMatrizIPER.objects.filter(matriz_id=matriz_id).update(actualizado=timezone.now(), **cambios)
+    if not actualizados:
+        recalcular(matriz_id)
+
+
+def crear(matriz_id, delta=None):
+    """Resumen de una matriz recién creada, con las filas que se le acaban de insertar."""
+    return ResumenMatrizIPER.objects.create(matriz_id=matriz_id, **{c: n for c, n in (delta or {}).items() if n})
+
+
+def copiar(origen_id, destino_id):
+    """Resumen de una revisión clonada: mismas filas, mismos conteos."""
+    origen = ResumenMatrizIPER.objects.filter(matriz_id=origen_id).values(*CAMPOS_CONTEO).first()
+    if origen is None:
+        return recalcular(destino_id)
+    return crear(destino_id, origen)
+
+
+# --- 2. RECÁLCULO COMPLETO ---
+
+def _agregados():
+    agregados = {'total_filas': Count('id')}
+    for prefijo in PREFIJOS:
+        for clasificacion in CLASIFICACIONES:
+            agregados[campo_conteo(prefijo, clasificacion)] = Count(
+                'id', filter=Q(**{f'{prefijo}_clasificacion': clasificacion}))
+    return agregados
+
+
+def recalcular(matriz_id):
+    """Cuenta las filas de la matriz con un solo aggregate y guarda el resumen."""
+    conteos = DetalleIPER.objects.filter(matriz_id=matriz_id).aggregate(**_agregados())
+    resumen, _ = ResumenMatrizIPER.objects.update_or_create(
+        matriz_id=matriz_id, defaults={**conteos, 'actualizado': timezone.now()})
+    return resumen
+
+
+def recalcular_matrices(matrices):
+    """
+    Reconstruye el resumen de todas las matrices del queryset con un único
+    GROUP BY sobre las filas. Devuelve la cantidad de resúmenes que estaban
+    desfasados (o no existían) y se corrigieron.
+    """
+    vacio = {campo: 0 for campo in CAMPOS_CONTEO}
+    conteos = {matriz_id: dict(vacio) for matriz_id in matrices.values_list('pk', flat=True)}
+    grupos = DetalleIPER.objects.filter(matriz__in=matrices).order_by().values('matriz_id').annotate(**_agregados())
+    for grupo in grupos:
+        conteos[grupo.pop('matriz_id')] = grupo
+    guardados = {
+        fila.pop('matriz_id'): fila
+        for fila in ResumenMatrizIPER.objects.filter(matriz_id__in=conteos).values('matriz_id', *CAMPOS_CONTEO)
+    }
+
+    ahora = timezone.now()
+    nuevos, desfasados = [], []
+    for matriz_id, conteo in conteos.items():
+        if matriz_id not in guardados:
+            nuevos.append(ResumenMatrizIPER(matriz_id=matriz_id, actualizado=ahora, **conteo))
+        elif guardados[matriz_id] != conteo:
+            desfasados.append(ResumenMatrizIPER(matriz_id=matriz_id, **conteo))
+    ResumenMatrizIPER.objects.bulk_create(nuevos, batch_size=500)
+    ResumenMatrizIPER.objects.bulk_update(desfasados, CAMPOS_CONTEO, batch_size=500)
+    return len(nuevos) + len(desfasados)
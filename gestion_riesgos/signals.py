@@ -0,0 +1,74 @@
+# gestion_riesgos/signals.py
+"""Receptores de señales de la app; se conectan en GestionRiesgosConfig.ready()."""
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from agenda.models import Recordatorio, Visita
+from . import busqueda, tablero
+from .models import Empresa, MedidaControl, Normativa, Peligro, Riesgo, Tarea
+
+
+# --- DASHBOARD POR USUARIO ---
+# Cada receptor ubica al prevencionista dueño del objeto con una sola consulta
+# y borra solo los datos del dashboard que ese cambio puede alterar.
+
+def riesgo_cambiado(sender, instance, **kwargs):
+    usuario_id = Tarea.objects.filter(pk=instance.tarea_id)\
+        .values_list('proceso__matriz__empresa__prevencionista_id', flat=True).first()
+    tablero.invalidar(usuario_id, tablero.GRAFICOS)
+
+
+def medida_cambiada(sender, instance, **kwargs):
+    usuario_id = Riesgo.objects.filter(pk=instance.riesgo_id)\
+        .values_list('tarea__proceso__matriz__empresa__prevencionista_id', flat=True).first()
+    tablero.invalidar(usuario_id, tablero.GRAFICOS)
+
+
+def visita_cambiada(sender, instance, **kwargs):
+    usuario_id = Empresa.objects.filter(pk=instance.empresa_id).values_list('prevencionista_id', flat=True).first()
+    tablero.invalidar(usuario_id, tablero.EVENTOS)
+
+
+def recordatorio_cambiado(sender, instance, **kwargs):
+    tablero.invalidar(instance.prevencionista_id, tablero.EVENTOS)
+
+
+def empresa_por_guardar(sender, instance, **kwargs):
+    # Prevencionista guardado en la BD, para saber si la edición traspasa la empresa
+    instance._prevencionista_anterior = None
+    if instance.pk:
+        instance._prevencionista_anterior = Empresa.objects.filter(pk=instance.pk)\
+            .values_list('prevencionista_id', flat=True).first()
+
+
+def empresa_cambiada(sender, instance, **kwargs):
+    anterior = getattr(instance, '_prevencionista_anterior', None)
+    if anterior is not None and anterior != instance.prevencionista_id:
+        # Sus riesgos, visitas y la empresa misma pasan de un dashboard al otro
+        for usuario_id in (anterior, instance.prevencionista_id):
+            tablero.invalidar(usuario_id, tablero.GRAFICOS, tablero.EVENTOS, tablero.EMPRESAS)
+        return
+    # Los eventos guardados muestran la razón social de la empresa visitada
+    tablero.invalidar(instance.prevencionista_id, tablero.EVENTOS, tablero.EMPRESAS)
+
+
+RECEPTORES_TABLERO = [
+    (Riesgo, riesgo_cambiado),
+    (MedidaControl, medida_cambiada),
+    (Visita, visita_cambiada),
+    (Recordatorio, recordatorio_cambiado),
+    (Empresa, empresa_cambiada),
+]
+
+
+def conectar():
+    # Índice de búsqueda del catálogo (las filas IPER se sincronizan por revisión)
+    post_save.connect(busqueda.peligro_guardado, sender=Peligro, dispatch_uid='busqueda_peligro_save')
+    post_delete.connect(busqueda.peligro_eliminado, sender=Peligro, dispatch_uid='busqueda_peligro_delete')
+    post_save.connect(busqueda.normativa_guardada, sender=Normativa, dispatch_uid='busqueda_normativa_save')
+    post_delete.connect(busqueda.normativa_eliminada, sender=Normativa, dispatch_uid='busqueda_normativa_delete')
+
+    pre_save.connect(empresa_por_guardar, sender=Empresa, dispatch_uid='tablero_empresa_pre_save')
+    for modelo, receptor in RECEPTORES_TABLERO:
+        nombre = modelo._meta.model_name
+        post_save.connect(receptor, sender=modelo, dispatch_uid=f'tablero_{nombre}_save')
+        post_delete.connect(receptor, sender=modelo, dispatch_uid=f'tablero_{nombre}_delete')
@@ -0,0 +1,135 @@
+# gestion_riesgos/tablero.py
+"""
+Datos del dashboard guardados en caché por prevencionista.
+
+Los gráficos de riesgos, los próximos eventos y las empresas del filtro se
+calculan una vez y se sirven desde la caché hasta que cambia algo del
+usuario. Cada entrada se guarda junto con la versión de sus datos (cantidad
+y último `actualizado` de las tablas de las que sale), que se lee de la BD
+en cada petición: un cambio hecho en cualquier proceso, o con update(), la
+deja fuera de uso aunque la caché sea local. Además, los receptores de
+signals.py borran las claves afectadas al confirmarse la transacción que
+hizo el cambio (si se borraran antes, otra petición podría volver a guardar
+los datos viejos).
+"""
+from itertools import chain
+from operator import attrgetter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from agenda.models import Recordatorio, Visita
+from .models import Empresa, MedidaControl, Riesgo
+
+GRAFICOS = 'graficos'
+EVENTOS = 'eventos'
+EMPRESAS = 'empresas'
+
+# Eventos que se guardan por usuario; al leerlos se descartan los que ya pasaron
+EVENTOS_EN_CACHE = 20
+EVENTOS_MOSTRADOS = 4
+
+
+def clave(usuario_id, nombre):
+    return f"tablero:{usuario_id}:{nombre}"
+
+
+def version(*consultas):
+    """(cantidad, último `actualizado`) de cada queryset: un alta o una edición cambian la fecha y una baja, la cantidad."""
+    partes = []
+    for consulta in consultas:
+        datos = consulta.order_by().aggregate(cantidad=Count('id'), ultimo=Max('actualizado'))
+        ultimo = datos['ultimo'].timestamp() * 1e6 if datos['ultimo'] else 0
+        partes.append(f"{datos['cantidad']}.{ultimo:.0f}")
+    return '-'.join(partes)
+
+
+def _en_cache(usuario, nombre, calcular, version_datos):
+    guardado = cache.get(clave(usuario.pk, nombre))
+    if guardado is not None and guardado[0] == version_datos:
+        return guardado[1]
+    datos = calcular(usuario)
+    cache.set(clave(usuario.pk, nombre), (version_datos, datos))
+    return datos
+
+
+def invalidar(usuario_id, *nombres):
+    """Borra de la caché los datos `nombres` del usuario al confirmar la transacción."""
+    if usuario_id is None:
+        return
+    claves = [clave(usuario_id, nombre) for nombre in nombres]
+    transaction.on_commit(lambda: cache.delete_many(claves))
+
+
+# --- 1. GRÁFICOS DE RIESGOS ---
+
+def _calcular_graficos(usuario):
+    # Datos para el gráfico de Clasificación de Riesgos
+    clasificacion_data = Riesgo.objects.filter(tarea__proceso__matriz__empresa__prevencionista=usuario)\
+        .values('clasificacion_riesgo_inherente_maximo')\
+        .annotate(count=Count('id'))\
+        .order_by('clasificacion_riesgo_inherente_maximo')
+
+    # Datos para el gráfico de Jerarquía de Controles (Top 5 de medidas)
+    jerarquia_data = MedidaControl.objects.filter(riesgo__tarea__proceso__matriz__empresa__prevencionista=usuario)\
+        .values('descripcion')\
+        .annotate(count=Count('id'))\
+        .order_by('-count')[:5]
+
+    return {
+        'clasificacion_labels': [item['clasificacion_riesgo_inherente_maximo'] for item in clasificacion_data],
+        'clasificacion_counts': [item['count'] for item in clasificacion_data],
+        'jerarquia_labels': [item['descripcion'] for item in jerarquia_data],
+        'jerarquia_counts': [item['count'] for item in jerarquia_data],
+    }
+
+
+def datos_graficos(usuario):
+    version_datos = version(
+        Riesgo.objects.filter(tarea__proceso__matriz__empresa__prevencionista=usuario),
+        MedidaControl.objects.filter(riesgo__tarea__proceso__matriz__empresa__prevencionista=usuario),
+    )
+    return _en_cache(usuario, GRAFICOS, _calcular_graficos, version_datos)
+
+
+# --- 2. PRÓXIMOS EVENTOS ---
+
+def _calcular_eventos(usuario):
+    ahora = timezone.now()
+    visitas = Visita.objects.filter(empresa__prevencionista=usuario, fecha_hora__gte=ahora)\
+        .select_related('empresa').order_by('fecha_hora')[:EVENTOS_EN_CACHE]
+    recordatorios = Recordatorio.objects.filter(prevencionista=usuario, fecha_hora__gte=ahora)\
+        .order_by('fecha_hora')[:EVENTOS_EN_CACHE]
+    # Visitas y recordatorios en una sola lista ordenada
+    return sorted(chain(visitas, recordatorios), key=attrgetter('fecha_hora'))[:EVENTOS_EN_CACHE]
+
+
+def proximos_eventos(usuario):
+    """Los EVENTOS_MOSTRADOS eventos más próximos del usuario."""
+    # Las visitas muestran la razón social de su empresa
+    version_datos = version(
+        Visita.objects.filter(empresa__prevencionista=usuario),
+        Recordatorio.objects.filter(prevencionista=usuario),
+        Empresa.objects.filter(prevencionista=usuario),
+    )
+    eventos = _en_cache(usuario, EVENTOS, _calcular_eventos, version_datos)
+    ahora = timezone.now()
+    vigentes = [evento for evento in eventos if evento.fecha_hora >= ahora]
+    if len(vigentes) < EVENTOS_MOSTRADOS and len(eventos) == EVENTOS_EN_CACHE:
+        # Ya pasaron casi todos los guardados y puede haber más adelante
+        vigentes = _calcular_eventos(usuario)
+        cache.set(clave(usuario.pk, EVENTOS), (version_datos, vigentes))
+    return vigentes[:EVENTOS_MOSTRADOS]
+
+
+# --- 3. EMPRESAS ---
+
+def _calcular_empresas(usuario):
+    return list(Empresa.objects.filter(prevencionista=usuario).order_by('razon_social').values('id', 'razon_social'))
+
+
+def empresas(usuario):
+    version_datos = version(Empresa.objects.filter(prevencionista=usuario))
+    return _en_cache(usuario, EMPRESAS, _calcular_empresas, version_datos)
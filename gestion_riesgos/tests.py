@@ -1,3 +1,1176 @@
+import asyncio
+import csv
+import io
+import json
+import zipfile
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from agenda.models import Recordatorio, Visita
+from . import (
+    arbol, busqueda, catalogo, difusion, escalas, evaluacion, exportacion, historial, importacion, iper, mapa_calor,
+    migracion_legacy, resumen, tablero, valoracion,
+)
+from .models import (
+    CambioIPER, DetalleIPER, Empresa, EscalaValoracion, IndiceBusqueda, Matriz, MatrizIPER, MedidaControl,
+    MigracionMatrizLegacy, NivelEscala, Normativa, Peligro, Proceso, ResumenMatrizIPER, Riesgo, SnapshotIPER, Tarea,
+)
+
+
+class MatrizIPERTestCase(TestCase):
+    """Prevencionista con una empresa y una matriz IPER vacía, con sesión iniciada."""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('prevencionista', password='clave')
+        self.empresa = Empresa.objects.create(prevencionista=self.usuario, razon_social='ACME', rut='76.123.456-7')
+        self.matriz = MatrizIPER.objects.create(empresa=self.empresa, codigo_documento='IPER-001')
+        self.client.force_login(self.usuario)
+
+    def otro_usuario(self):
+        otro = User.objects.create_user('otro', password='clave')
+        empresa = Empresa.objects.create(prevencionista=otro, razon_social='Otra', rut='77.000.000-0')
+        return otro, MatrizIPER.objects.create(empresa=empresa)
+
+    def post_json(self, nombre, datos, *args, cliente=None):
+        return (cliente or self.client).post(
+            reverse(nombre, args=args), json.dumps(datos), content_type='application/json',
+        )
+
+
+# --- Guardado de celdas (una y por lote) ---
+
+class ActualizarCeldaTests(MatrizIPERTestCase):
+
+    def test_crea_y_edita_fila(self):
+        respuesta = self.post_json('update_detalle_iper', {
+            'id': 'new', 'matriz_id': self.matriz.pk, 'field': 'proceso', 'value': 'Bodega',
+        })
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['status'], 'created')
+        fila_id = respuesta.json()['id']
+
+        respuesta = self.post_json('update_detalle_iper', {'id': fila_id, 'field': 'proceso', 'value': 'Patio'})
+        self.assertEqual(respuesta.json(), {'status': 'ok', 'revision': 2})
+        self.assertEqual(DetalleIPER.objects.get(pk=fila_id).proceso, 'Patio')
+
+    def test_requiere_sesion_y_post(self):
+        fila = iper.crear_fila(self.matriz, proceso='Bodega')
+        self.assertEqual(self.client.get(reverse('update_detalle_iper')).status_code, 405)
+        self.client.logout()
+        respuesta = self.post_json('update_detalle_iper', {'id': fila.pk, 'field': 'proceso', 'value': 'X'})
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(DetalleIPER.objects.get(pk=fila.pk).proceso, 'Bodega')
+
+    def test_no_toca_filas_de_otra_empresa(self):
+        _, ajena = self.otro_usuario()
+        fila = iper.crear_fila(ajena, proceso='Ajeno')
+        respuesta = self.post_json('update_detalle_iper', {'id': fila.pk, 'field': 'proceso', 'value': 'X'})
+        self.assertEqual(respuesta.status_code, 404)
+        respuesta = self.post_json('update_detalle_iper', {
+            'id': 'new', 'matriz_id': ajena.pk, 'field': 'proceso', 'value': 'X',
+        })
+        self.assertEqual(respuesta.status_code, 404)
+        self.assertEqual(ajena.filas.count(), 1)
+
+    def test_rechaza_campo_invalido_o_protegido(self):
+        fila = iper.crear_fila(self.matriz)
+        for campo in ('no_existe', 'eval_valor', None):
+            respuesta = self.post_json('update_detalle_iper', {'id': fila.pk, 'field': campo, 'value': 1})
+            self.assertEqual(respuesta.status_code, 400, campo)
+        respuesta = self.post_json('update_detalle_iper', {'id': 'abc', 'field': 'proceso', 'value': 'X'})
+        self.assertEqual(respuesta.status_code, 400)
+
+
+class ActualizarLoteTests(MatrizIPERTestCase):
+
+    def test_estado_por_edicion(self):
+        fila = iper.crear_fila(self.matriz)
+        respuesta = self.post_json('update_detalle_iper_lote', {'ediciones': [
+            {'id': fila.pk, 'field': 'proceso', 'value': 'Bodega'},
+            {'id': fila.pk, 'field': 'eval_probabilidad', 'value': 4},
+            {'id': fila.pk, 'field': 'eval_severidad', 'value': 4},
+            {'id': fila.pk, 'field': 'eval_valor', 'value': 99},
+            {'id': 999999, 'field': 'proceso', 'value': 'X'},
+            'no es un objeto',
+        ]})
+        self.assertEqual(respuesta.status_code, 200)
+        resultados = respuesta.json()['resultados']
+        self.assertEqual([r['status'] for r in resultados], ['ok', 'ok', 'ok', 'error', 'error', 'error'])
+        self.assertEqual(resultados[2]['valores'], {'eval_valor': 16, 'eval_clasificacion': 'INTOLERABLE'})
+
+        fila.refresh_from_db()
+        self.assertEqual((fila.proceso, fila.eval_valor, fila.eval_clasificacion), ('Bodega', 16, 'INTOLERABLE'))
+        # Todo el lote es una sola revisión de la matriz
+        self.assertEqual(fila.revision, 2)
+
+    def test_filas_ajenas_no_se_encuentran(self):
+        _, ajena = self.otro_usuario()
+        fila = iper.crear_fila(ajena, proceso='Ajeno')
+        respuesta = self.post_json('update_detalle_iper_lote', {'ediciones': [
+            {'id': fila.pk, 'field': 'proceso', 'value': 'X'},
+        ]})
+        self.assertEqual(respuesta.json()['resultados'][0]['message'], 'Fila no encontrada.')
+        self.assertEqual(DetalleIPER.objects.get(pk=fila.pk).proceso, 'Ajeno')
+
+    def test_error_al_guardar_revierte_todo_el_lote(self):
+        primera = iper.crear_fila(self.matriz, proceso='A')
+        segunda = iper.crear_fila(self.matriz, proceso='B')
+        ediciones = [
+            {'id': primera.pk, 'field': 'proceso', 'value': 'A2'},
+            {'id': segunda.pk, 'field': 'proceso', 'value': 'B2'},
+        ]
+        with mock.patch('gestion_riesgos.iper.historial.registrar', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                iper.aplicar_ediciones(ediciones, DetalleIPER.objects.all())
+
+        self.assertEqual(sorted(self.matriz.filas.values_list('proceso', flat=True)), ['A', 'B'])
+        self.matriz.refresh_from_db()
+        self.assertEqual(self.matriz.revision, 2)
+
+    def test_valida_el_lote(self):
+        respuesta = self.post_json('update_detalle_iper_lote', {'ediciones': []})
+        self.assertEqual(respuesta.status_code, 400)
+        respuesta = self.post_json('update_detalle_iper_lote', {
+            'ediciones': [{'id': 1, 'field': 'proceso', 'value': ''}] * (iper.MAX_EDICIONES_POR_LOTE + 1),
+        })
+        self.assertEqual(respuesta.status_code, 400)
+
+
+# --- Valoración calculada en el servidor ---
+
+class ValoracionTests(MatrizIPERTestCase):
+
+    def test_guardar_calcula_valor_y_clasificacion(self):
+        fila = DetalleIPER.objects.create(
+            matriz=self.matriz, eval_probabilidad=2, eval_severidad=4, residual_probabilidad=1, residual_severidad=0,
+        )
+        self.assertEqual((fila.eval_valor, fila.eval_clasificacion), (8, 'IMPORTANTE'))
+        # P o S vacío (o 0) vale 1, como en la grilla
+        self.assertEqual((fila.residual_valor, fila.residual_clasificacion), (1, 'TRIVIAL'))
+
+    def test_recalculo_masivo_en_un_update(self):
+        DetalleIPER.objects.create(matriz=self.matriz, eval_probabilidad=4, eval_severidad=4)
+        DetalleIPER.objects.filter(matriz=self.matriz).update(eval_valor=0, eval_clasificacion=None)
+        with self.assertNumQueries(3):
+            # Escalas presentes, escala predeterminada y el UPDATE
+            self.matriz.recalcular_valoracion()
+        fila = self.matriz.filas.get()
+        self.assertEqual((fila.eval_valor, fila.eval_clasificacion), (16, 'INTOLERABLE'))
+
+    def test_abrir_la_matriz_no_escribe(self):
+        iper.crear_fila(self.matriz, eval_probabilidad=4, eval_severidad=2)
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('matriz_riesgos_view', args=[self.matriz.pk]))
+        self.assertEqual(respuesta.status_code, 200)
+        escrituras = [
+            consulta['sql'] for consulta in consultas
+            if consulta['sql'].lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE'))
+            and 'django_session' not in consulta['sql']
+        ]
+        self.assertEqual(escrituras, [])
+
+
+# --- API de filas paginada por clave ---
+
+class FilasPaginadasTests(MatrizIPERTestCase):
+
+    def test_recorre_la_matriz_por_paginas(self):
+        filas = iper.crear_filas(self.matriz, 5, proceso='Bodega')
+        url = reverse('detalle_iper_filas', args=[self.matriz.pk])
+
+        pagina = self.client.get(url, {'limit': 2, 'fields': 'proceso'}).json()
+        self.assertEqual((pagina['count'], pagina['total'], pagina['has_more']), (2, 5, True))
+        self.assertEqual(pagina['filas'][0], {'id': filas[0].pk, 'proceso': 'Bodega'})
+
+        recibidos = [fila['id'] for fila in pagina['filas']]
+        while pagina['has_more']:
+            pagina = self.client.get(url, {'limit': 2, 'after': pagina['next_after']}).json()
+            recibidos += [fila['id'] for fila in pagina['filas']]
+        self.assertEqual(recibidos, [fila.pk for fila in filas])
+        self.assertIsNone(pagina['next_after'])
+
+    def test_parametros_invalidos(self):
+        url = reverse('detalle_iper_filas', args=[self.matriz.pk])
+        self.assertEqual(self.client.get(url, {'fields': 'proceso,clave'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'after': 'x'}).status_code, 400)
+        _, ajena = self.otro_usuario()
+        self.assertEqual(self.client.get(reverse('detalle_iper_filas', args=[ajena.pk])).status_code, 404)
+
+
+# --- Sincronización por revisiones ---
+
+class CambiosDesdeRevisionTests(MatrizIPERTestCase):
+
+    def cambios(self, desde, **cabeceras):
+        return self.client.get(reverse('detalle_iper_cambios', args=[self.matriz.pk]), {'desde': desde}, **cabeceras)
+
+    def test_filas_modificadas_y_eliminadas(self):
+        primera = iper.crear_fila(self.matriz, proceso='A')
+        segunda = iper.crear_fila(self.matriz, proceso='B')
+        revision, eliminada = segunda.revision, segunda.pk
+        iper.actualizar_celda(primera, 'proceso', 'A2')
+        iper.eliminar_fila(segunda)
+
+        datos = self.cambios(revision).json()
+        self.assertFalse(datos['resync'])
+        self.assertEqual([(fila['id'], fila['proceso']) for fila in datos['filas']], [(primera.pk, 'A2')])
+        self.assertEqual(datos['eliminadas'], [eliminada])
+        self.assertEqual(datos['revision'], revision + 2)
+
+    def test_304_si_no_hubo_cambios(self):
+        iper.crear_fila(self.matriz)
+        respuesta = self.cambios(1)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self.cambios(1, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304)
+        iper.crear_fila(self.matriz)
+        self.assertEqual(self.cambios(1, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 200)
+
+    def test_pide_recargar_si_cambiaron_demasiadas_filas(self):
+        with mock.patch.object(iper, 'LIMITE_CAMBIOS', 3):
+            iper.crear_filas(self.matriz, 4)
+            datos = self.cambios(0).json()
+        self.assertEqual(datos, {**datos, 'resync': True, 'filas': [], 'eliminadas': []})
+
+
+# --- Importación masiva desde Excel/CSV ---
+
+PLANILLA_CSV = (
+    "MATRIZ IPER;;;;;;\n"
+    "Empresa;ACME;;;;;\n"
+    ";;;;;;\n"
+    "Proceso;Tarea;Peligro;Riesgo;P;S;Género\n"
+    "Bodega;Apilar cajas;Altura;Caída;4;4;hombre\n"
+    "Bodega;Despachar;Grúa;Golpe;2;3;Mujer\n"
+    ";;;;;;\n"
+    "Oficina;Digitar;Pantalla;Fatiga;1;;\n"
+)
+
+
+class ImportacionTests(MatrizIPERTestCase):
+
+    def importar(self, nombre, contenido, **datos):
+        archivo = SimpleUploadedFile(nombre, contenido.encode() if isinstance(contenido, str) else contenido)
+        return self.client.post(
+            reverse('matriz_iper_import', args=[self.empresa.pk]), {'archivo': archivo, **datos},
+        )
+
+    def test_con_errores_no_importa_nada(self):
+        respuesta = self.importar('matriz.csv', PLANILLA_CSV)
+        self.assertEqual(respuesta.status_code, 400)
+        # S = 3 no es un valor de la escala; la fila 6 es la de Excel
+        self.assertEqual(
+            [(e['fila'], e['columna']) for e in respuesta.context['errores']], [(6, 'eval_severidad')],
+        )
+        self.assertEqual(MatrizIPER.objects.filter(empresa=self.empresa).count(), 1)
+
+    def test_omitir_errores_importa_las_filas_validas(self):
+        respuesta = self.importar('matriz.csv', PLANILLA_CSV, omitir_errores='on', codigo_documento='IPER-9')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['filas_importadas'], 2)
+
+        matriz = respuesta.context['matriz']
+        filas = list(matriz.filas.values_list('proceso', 'genero', 'eval_valor', 'eval_clasificacion', 'eval_severidad'))
+        self.assertEqual(filas, [
+            ('Bodega', 'Hombre', 16, 'INTOLERABLE', 4),
+            ('Oficina', None, 1, 'TRIVIAL', 0),
+        ])
+        self.assertEqual(matriz.resumen.total_filas, 2)
+        self.assertEqual(matriz.resumen.eval_intolerable, 1)
+
+    def test_archivos_ilegibles_son_errores_de_importacion(self):
+        libro_sin_hojas = io.BytesIO()
+        with zipfile.ZipFile(libro_sin_hojas, 'w') as zip_:
+            zip_.writestr('hola.txt', 'no es un libro')
+        casos = [
+            ('matriz.xlsx', b'esto no es un zip'),
+            ('matriz.xlsx', libro_sin_hojas.getvalue()),
+            ('matriz.csv', b'\n \n'),
+            ('matriz.csv', b'Proceso;Tarea\n"sin cerrar;x\n'),
+            ('matriz.csv', 'Proceso;Tarea\nA;B\n'),
+            ('matriz.pdf', b'%PDF-1.4'),
+        ]
+        for nombre, contenido in casos:
+            with self.subTest(nombre=nombre, contenido=contenido[:20]):
+                respuesta = self.importar(nombre, contenido)
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertTrue(respuesta.context['error'])
+        self.assertEqual(MatrizIPER.objects.filter(empresa=self.empresa).count(), 1)
+
+    def test_solo_en_empresas_propias(self):
+        _, ajena = self.otro_usuario()
+        archivo = SimpleUploadedFile('matriz.csv', PLANILLA_CSV.encode())
+        respuesta = self.client.post(reverse('matriz_iper_import', args=[ajena.empresa_id]), {'archivo': archivo})
+        self.assertEqual(respuesta.status_code, 404)
+
+
+# --- Exportación a CSV y Excel ---
+
+class ExportacionTests(MatrizIPERTestCase):
+
+    def setUp(self):
+        super().setUp()
+        iper.crear_fila(self.matriz, proceso='Bodega', tarea='Apilar; cajas', eval_probabilidad=4, eval_severidad=2)
+        iper.crear_fila(self.matriz, proceso='Oficina')
+
+    def exportar(self, formato, matriz=None):
+        return self.client.get(reverse('matriz_iper_export', args=[(matriz or self.matriz).pk, formato]))
+
+    def test_csv_en_streaming(self):
+        respuesta = self.exportar('csv')
+        self.assertTrue(respuesta.streaming)
+        texto = b''.join(respuesta.streaming_content).decode()
+        self.assertTrue(texto.startswith('\ufeff'))
+        lineas = list(csv.reader(io.StringIO(texto.lstrip('\ufeff')), delimiter=';'))
+        self.assertEqual(len({len(linea) for linea in lineas}), 1)
+        inicio = lineas.index(exportacion.encabezados_columnas())
+        self.assertEqual(lineas[inicio + 1][:3], ['1', 'Bodega', ''])
+        self.assertIn('Apilar; cajas', lineas[inicio + 1])
+        self.assertEqual(len(lineas), inicio + 3)
+
+    def test_xlsx_sin_textos_compartidos_y_reimportable(self):
+        respuesta = self.exportar('xlsx')
+        contenido = b''.join(respuesta.streaming_content)
+        with zipfile.ZipFile(io.BytesIO(contenido)) as libro:
+            self.assertNotIn('xl/sharedStrings.xml', libro.namelist())
+            self.assertIn(b't="inlineStr"', libro.read('xl/worksheets/sheet1.xml'))
+
+        resultado = importacion.importar_iper(SimpleUploadedFile('copia.xlsx', contenido), self.empresa)
+        copia = resultado['matriz'].filas.values_list('proceso', 'tarea', 'eval_valor')
+        self.assertEqual(list(copia), [('Bodega', 'Apilar; cajas', 8), ('Oficina', None, 1)])
+
+    def test_formato_y_alcance(self):
+        self.assertEqual(self.exportar('pdf').status_code, 404)
+        _, ajena = self.otro_usuario()
+        self.assertEqual(self.exportar('csv', ajena).status_code, 404)
+
+
+# --- Filas nuevas sin recargar la página ---
+
+class CrearFilasTests(MatrizIPERTestCase):
+
+    def test_crea_varias_filas_en_una_revision(self):
+        respuesta = self.post_json(
+            'crear_filas_iper', {'cantidad': 3, 'valores': {'proceso': 'Bodega'}}, self.matriz.pk,
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        self.assertEqual(len(datos['ids']), 3)
+        self.assertEqual(datos['revision'], 1)
+        for pk in datos['ids']:
+            self.assertIn(f'data-id="{pk}"', datos['html'])
+        self.assertEqual(set(self.matriz.filas.values_list('proceso', 'revision')), {('Bodega', 1)})
+        self.assertEqual(self.matriz.resumen.total_filas, 3)
+
+    def test_valida_cantidad_y_valores(self):
+        for datos in ({'cantidad': 0}, {'cantidad': iper.MAX_FILAS_NUEVAS + 1}, {'cantidad': 'x'},
+                      {'valores': {'eval_valor': 4}}, {'valores': ['proceso']}):
+            with self.subTest(datos=datos):
+                self.assertEqual(self.post_json('crear_filas_iper', datos, self.matriz.pk).status_code, 400)
+        self.assertFalse(self.matriz.filas.exists())
+        _, ajena = self.otro_usuario()
+        self.assertEqual(self.post_json('crear_filas_iper', {}, ajena.pk).status_code, 404)
+
+
+# --- Nueva revisión (clonación en la BD) ---
+
+class ClonarMatrizTests(MatrizIPERTestCase):
+
+    def test_siguiente_version(self):
+        for actual, siguiente in [('1.0', '2.0'), ('Rev. 3', 'Rev. 4'), ('', '2.0'), ('final', 'final (2)')]:
+            self.assertEqual(iper.siguiente_version(actual), siguiente)
+
+    def test_copia_encabezado_filas_y_resumen(self):
+        self.matriz.proyecto = 'Planta'
+        self.matriz.save()
+        originales = [
+            iper.crear_fila(self.matriz, proceso=f'P{n}', eval_probabilidad=4, eval_severidad=n % 2 + 1)
+            for n in range(4)
+        ]
+        respuesta = self.client.post(reverse('matriz_iper_clone', args=[self.matriz.pk]))
+        nueva = MatrizIPER.objects.exclude(pk=self.matriz.pk).get()
+        self.assertRedirects(respuesta, reverse('matriz_riesgos_view', args=[nueva.pk]))
+
+        self.assertEqual((nueva.version, nueva.proyecto, nueva.revision), ('2.0', 'Planta', 1))
+        campos = ('proceso', 'eval_valor', 'eval_clasificacion')
+        self.assertEqual(list(nueva.filas.values_list(*campos)), [tuple(getattr(f, c) for c in campos) for f in originales])
+        self.assertEqual(set(nueva.filas.values_list('revision', flat=True)), {1})
+        self.assertEqual(self.matriz.filas.count(), 4)
+        self.assertEqual(nueva.resumen.total_filas, 4)
+        self.assertEqual(nueva.resumen.eval_intolerable, self.matriz.resumen.eval_intolerable)
+
+    def test_solo_post_y_empresas_propias(self):
+        url = reverse('matriz_iper_clone', args=[self.matriz.pk])
+        self.assertEqual(self.client.get(url).status_code, 405)
+        _, ajena = self.otro_usuario()
+        self.assertEqual(self.client.post(reverse('matriz_iper_clone', args=[ajena.pk])).status_code, 404)
+        self.assertEqual(MatrizIPER.objects.count(), 2)
+
+
+# --- Historial de ediciones y reconstrucción ---
+
+class HistorialTests(MatrizIPERTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.inicio = timezone.now() - timedelta(days=3)
+        MatrizIPER.objects.filter(pk=self.matriz.pk).update(fecha_creacion=self.inicio - timedelta(hours=1))
+        self.matriz.refresh_from_db()
+
+        fila = iper.crear_fila(self.matriz, usuario=self.usuario, proceso='A', eval_probabilidad=4, eval_severidad=4)
+        self.fila_id = fila.pk
+        self.en(self.inicio, revision__lte=1)
+        iper.actualizar_celda(fila, 'proceso', 'A2', usuario=self.usuario)
+        self.en(self.inicio + timedelta(days=1), revision=2)
+        self.otra = iper.crear_fila(self.matriz, proceso='B')
+        iper.eliminar_fila(fila)
+        self.en(self.inicio + timedelta(days=2), revision__gt=2)
+
+    def en(self, fecha, **filtro):
+        """Fecha los cambios (y fotos) de esas revisiones como si hubieran ocurrido en `fecha`."""
+        CambioIPER.objects.filter(matriz=self.matriz, **filtro).update(fecha=fecha)
+        SnapshotIPER.objects.filter(matriz=self.matriz, **filtro).update(fecha=fecha - timedelta(minutes=1))
+
+    def procesos(self, fecha):
+        return [(fila['id'], fila['proceso'], fila['eval_valor']) for fila in historial.reconstruir(self.matriz, fecha)]
+
+    def test_reconstruye_cada_momento(self):
+        self.assertEqual(self.procesos(self.inicio + timedelta(hours=12)), [(self.fila_id, 'A', 16)])
+        self.assertEqual(self.procesos(self.inicio + timedelta(days=1, hours=1)), [(self.fila_id, 'A2', 16)])
+        self.assertEqual(self.procesos(timezone.now()), [(self.otra.pk, 'B', 1)])
+        self.assertEqual(historial.reconstruir(self.matriz, self.inicio - timedelta(days=1)), [])
+
+    def test_foto_periodica_da_el_mismo_resultado(self):
+        esperado = self.procesos(timezone.now())
+        with mock.patch.object(historial, 'CAMBIOS_POR_SNAPSHOT', 1):
+            iper.actualizar_celda(self.otra, 'tarea', 'Revisar')
+        self.assertEqual(self.matriz.snapshots.count(), 2)
+        self.assertEqual(self.procesos(timezone.now()), esperado)
+
+    def test_api(self):
+        url = reverse('historial_matriz_iper', args=[self.matriz.pk])
+        fecha = (self.inicio + timedelta(days=1, hours=1)).isoformat()
+        datos = self.client.get(url, {'fecha': fecha}).json()
+        self.assertEqual([fila['proceso'] for fila in datos['filas']], ['A2'])
+
+        datos = self.client.get(url, {'fila': self.fila_id}).json()
+        self.assertEqual([c['tipo'] for c in datos['cambios']], ['C', 'E', 'D'])
+        self.assertEqual(datos['cambios'][1]['valor_anterior'], 'A')
+        self.assertEqual(datos['cambios'][1]['usuario_nombre'], 'prevencionista')
+
+        self.assertEqual(self.client.get(url, {'fecha': 'ayer'}).status_code, 400)
+
+
+# --- Difusión en vivo de cambios ---
+
+class DifusionTests(MatrizIPERTestCase):
+
+    def test_publica_solo_al_confirmar(self):
+        with mock.patch.object(difusion, 'publicar_cambio') as publicar:
+            with self.captureOnCommitCallbacks(execute=True):
+                fila = iper.crear_fila(self.matriz, proceso='A')
+            publicar.assert_called_once_with(self.matriz.pk, fila.revision)
+
+    def test_evento_con_las_filas_cambiadas(self):
+        iper.crear_fila(self.matriz, proceso='A')
+        fila = iper.crear_fila(self.matriz, proceso='B')
+        self.matriz.refresh_from_db()
+
+        evento, hasta = difusion._evento_cambios(self.matriz.pk, 1)
+        self.assertEqual(hasta, self.matriz.revision)
+        cabecera, tipo, data = evento.strip().split('\n')
+        self.assertEqual((cabecera, tipo), (f'id: {hasta}', 'event: cambios'))
+        datos = json.loads(data[len('data: '):])
+        self.assertEqual([f['id'] for f in datos['filas']], [fila.pk])
+
+        self.assertEqual(difusion._evento_cambios(self.matriz.pk, hasta), (None, hasta))
+        self.assertEqual(difusion._evento_cambios(0, 3)[0], "event: eliminada\ndata: {}\n\n")
+
+    async def test_flujo_entrega_lo_pendiente_y_lo_publicado(self):
+        flujo = difusion.flujo_eventos(self.matriz.pk, 0)
+        try:
+            self.assertTrue((await anext(flujo)).startswith('retry:'))
+            # Al conectar no hay nada nuevo: queda esperando el siguiente aviso
+            siguiente = asyncio.ensure_future(anext(flujo))
+            await asyncio.sleep(0)
+            self.assertFalse(siguiente.done())
+
+            await sync_to_async(iper.crear_fila)(self.matriz, proceso='A')
+            difusion.publicar_cambio(self.matriz.pk, 1)
+            evento = await asyncio.wait_for(siguiente, timeout=5)
+            self.assertIn('event: cambios', evento)
+            self.assertEqual(difusion.obtener_broker().total_suscriptores(difusion.canal_matriz(self.matriz.pk)), 1)
+        finally:
+            await flujo.aclose()
+        self.assertEqual(difusion.obtener_broker().total_suscriptores(difusion.canal_matriz(self.matriz.pk)), 0)
+
+    def test_sin_asgi_responde_204(self):
+        url = reverse('eventos_matriz_iper', args=[self.matriz.pk])
+        self.assertEqual(self.client.get(url).status_code, 204)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+
+# --- VEP y clasificaciones persistidos en Riesgo ---
+
+class MatrizProcesosTestCase(MatrizIPERTestCase):
+    """Agrega una matriz por procesos con un proceso, una tarea y un peligro del catálogo."""
+
+    def setUp(self):
+        super().setUp()
+        self.matriz_procesos = Matriz.objects.create(empresa=self.empresa, nombre_proyecto='Planta')
+        self.proceso = Proceso.objects.create(matriz=self.matriz_procesos, nombre='Soldadura')
+        self.tarea = Tarea.objects.create(proceso=self.proceso, puesto_trabajo='Soldador', descripcion='Cortar planchas')
+        self.peligro = Peligro.objects.create(
+            familia_riesgo='Riesgos de Seguridad', riesgo_especifico='Caída de personas', codigo='S-01',
+        )
+
+    def crear_riesgo(self, **valores):
+        return Riesgo.objects.create(tarea=self.tarea, peligro=self.peligro, **valores)
+
+
+class VEPAlmacenadoTests(MatrizProcesosTestCase):
+
+    def test_se_calcula_al_guardar(self):
+        riesgo = self.crear_riesgo(
+            probabilidad_seguridad=4, consecuencia_seguridad=4,
+            probabilidad_higienicos=2, consecuencia_higienicos=1,
+            probabilidad_residual=1, consecuencia_residual=2,
+        )
+        riesgo.refresh_from_db()
+        self.assertEqual((riesgo.valor_vep_seguridad, riesgo.clasificacion_riesgo_seguridad), (16, 'Intolerable'))
+        self.assertEqual((riesgo.valor_vep_higienicos, riesgo.clasificacion_riesgo_higienicos), (2, 'Tolerable'))
+        self.assertEqual((riesgo.valor_vep_inherente_maximo, riesgo.clasificacion_riesgo_inherente_maximo), (16, 'Intolerable'))
+        self.assertEqual(riesgo.clasificacion_riesgo_residual, 'Tolerable')
+        self.assertEqual((riesgo.valor_vep_especial, riesgo.clasificacion_riesgo_especial), (None, 'No evaluado'))
+
+        # Guardar solo los campos editados también actualiza los derivados
+        riesgo.probabilidad_seguridad = 1
+        riesgo.save(update_fields=['probabilidad_seguridad'])
+        riesgo.refresh_from_db()
+        self.assertEqual((riesgo.valor_vep_seguridad, riesgo.clasificacion_riesgo_seguridad), (4, 'Moderado'))
+        self.assertEqual(riesgo.valor_vep_inherente_maximo, 4)
+
+    def test_recalculo_en_bd_coincide_con_el_de_python(self):
+        combinaciones = [(None, None), (1, None), (1, 1), (2, 2), (2, 4), (4, 4)]
+        for p, c in combinaciones:
+            self.crear_riesgo(probabilidad_seguridad=p, consecuencia_seguridad=c, probabilidad_psicosociales=c,
+                              consecuencia_psicosociales=p, probabilidad_residual=p, consecuencia_residual=2)
+        campos = Riesgo.campos_calculados()
+        esperado = {r.pk: [getattr(r, campo) for campo in campos] for r in Riesgo.objects.all()}
+
+        # Se borran los derivados por fuera de save() y se recalculan en un solo UPDATE
+        Riesgo.objects.update(**{campo: None if campo.startswith('valor') else '' for campo in campos})
+        with self.assertNumQueries(1):
+            self.assertEqual(Riesgo.objects.recalcular_vep(), len(combinaciones))
+        obtenido = {r.pk: [getattr(r, campo) for campo in campos] for r in Riesgo.objects.all()}
+        self.assertEqual(obtenido, esperado)
+        self.assertEqual(Riesgo.objects.filter(clasificacion_riesgo_inherente_maximo='No evaluado').count(), 2)
+
+
+# --- Motor de evaluación vectorizado ---
+
+class EvaluacionVectorizadaTests(MatrizProcesosTestCase):
+
+    def test_riesgos_coinciden_con_lo_almacenado(self):
+        for p, c in [(None, None), (1, 2), (2, 4), (4, 4), (4, None)]:
+            self.crear_riesgo(probabilidad_seguridad=p, consecuencia_seguridad=c,
+                              probabilidad_higienicos=c, consecuencia_higienicos=2, probabilidad_especial=p,
+                              consecuencia_especial=p)
+        riesgos = Riesgo.objects.all()
+        ids, resultado = evaluacion.evaluar_riesgos(riesgos)
+        self.assertEqual(sorted(resultado), sorted(Riesgo.campos_calculados()))
+        self.assertEqual(evaluacion.diferencias(riesgos, ids, resultado), [])
+        self.assertEqual(
+            evaluacion.conteo_por_clasificacion(resultado['clasificacion_riesgo_inherente_maximo']),
+            {'Importante': 1, 'Intolerable': 1, 'Moderado': 1, 'No evaluado': 2},
+        )
+
+    def test_detalles_coinciden_y_detecta_desfasados(self):
+        for p, s in [(0, 0), (1, 2), (2, 4), (4, 4), (None, 3)]:
+            iper.crear_fila(self.matriz, eval_probabilidad=p, eval_severidad=s,
+                            residual_probabilidad=s, residual_severidad=1)
+        detalles = DetalleIPER.objects.filter(matriz=self.matriz)
+        ids, resultado = evaluacion.evaluar_detalles(detalles)
+        self.assertEqual(evaluacion.diferencias(detalles, ids, resultado), [])
+
+        # Una fila editada por SQL directo queda con su valor desfasado
+        editada = detalles.get(eval_probabilidad=4)
+        DetalleIPER.objects.filter(pk=editada.pk).update(eval_probabilidad=1)
+        ids, resultado = evaluacion.evaluar_detalles(detalles)
+        self.assertEqual(evaluacion.diferencias(detalles, ids, resultado), [editada.pk])
+
+    def test_matriz_vacia(self):
+        ids, resultado = evaluacion.evaluar_riesgos(Riesgo.objects.none())
+        self.assertEqual(len(ids), 0)
+        self.assertEqual(len(resultado['valor_vep_inherente_maximo']), 0)
+        ids, resultado = evaluacion.evaluar_detalles(DetalleIPER.objects.none())
+        self.assertEqual(evaluacion.conteo_por_clasificacion(resultado['eval_clasificacion']), {})
+
+
+# --- Mapa de calor P x S ---
+
+class MapaCalorTests(MatrizProcesosTestCase):
+
+    def celda(self, datos, p, s):
+        return next(c for c in datos['celdas'] if (c['p'], c['s']) == (p, s))
+
+    def pedir(self, **params):
+        return self.client.get(reverse('mapa_calor_data'), params)
+
+    def test_cuenta_filas_iper_por_celda(self):
+        a = iper.crear_fila(self.matriz, eval_probabilidad=4, eval_severidad=8, residual_probabilidad=1, residual_severidad=2)
+        b = iper.crear_fila(self.matriz, eval_probabilidad=4, eval_severidad=8)
+        vacia = iper.crear_fila(self.matriz, eval_probabilidad=0, eval_severidad=None)
+
+        datos = self.pedir(matriz=self.matriz.pk).json()
+        alta = self.celda(datos['inherente'], 4, 8)
+        self.assertEqual((alta['cantidad'], alta['ids'], alta['valor']), (2, [a.pk, b.pk], 32))
+        # P o S vacío o en 0 vale 1, como en la valoración
+        self.assertEqual(self.celda(datos['inherente'], 1, 1)['ids'], [vacia.pk])
+        self.assertEqual(self.celda(datos['residual'], 1, 1)['ids'], [b.pk, vacia.pk])
+        self.assertEqual(self.celda(datos['residual'], 1, 2)['ids'], [a.pk])
+        self.assertEqual((datos['inherente']['total'], datos['inherente']['sin_evaluar']), (3, 0))
+
+        # Editar sube la revisión de la matriz: el mapa en caché no se reutiliza
+        iper.actualizar_celda(b, 'eval_severidad', '2')
+        datos = self.pedir(matriz=self.matriz.pk, tipo='inherente').json()
+        self.assertNotIn('residual', datos)
+        self.assertEqual(self.celda(datos['inherente'], 4, 8)['ids'], [a.pk])
+        self.assertEqual(self.celda(datos['inherente'], 4, 2)['ids'], [b.pk])
+
+    def test_riesgos_por_categoria_dominante(self):
+        riesgo = self.crear_riesgo(probabilidad_seguridad=1, consecuencia_seguridad=2,
+                                   probabilidad_higienicos=4, consecuencia_higienicos=2)
+        self.crear_riesgo()
+        datos = self.pedir(fuente='riesgos', empresa=self.empresa.pk).json()
+        self.assertEqual(self.celda(datos['inherente'], 4, 2)['ids'], [riesgo.pk])
+        self.assertEqual(datos['inherente']['sin_evaluar'], 1)
+        self.assertEqual(datos['residual']['sin_evaluar'], 2)
+
+        # Editar cambia la huella leída de la BD: el mapa en caché no se reutiliza
+        riesgo.probabilidad_higienicos = 1
+        riesgo.save()
+        datos = self.pedir(fuente='riesgos', empresa=self.empresa.pk).json()
+        self.assertEqual(self.celda(datos['inherente'], 1, 2)['ids'], [riesgo.pk])
+        with self.assertNumQueries(1):
+            mapa_calor.mapa_riesgos(self.usuario, empresa_id=self.empresa.pk)
+
+    def test_cambios_sin_signals_cambian_la_huella(self):
+        riesgo = self.crear_riesgo(probabilidad_seguridad=4, consecuencia_seguridad=4)
+        self.assertEqual(self.celda(mapa_calor.mapa_riesgos(self.usuario)['inherente'], 4, 4)['ids'], [riesgo.pk])
+
+        # Como verificar_valoracion --corregir (u otro proceso): update() y recálculo en SQL
+        Riesgo.objects.filter(pk=riesgo.pk).update(consecuencia_seguridad=1)
+        Riesgo.objects.filter(pk=riesgo.pk).recalcular_vep()
+        self.assertEqual(self.celda(mapa_calor.mapa_riesgos(self.usuario)['inherente'], 4, 1)['ids'], [riesgo.pk])
+
+        Riesgo.objects.filter(pk=riesgo.pk).delete()
+        self.assertEqual(mapa_calor.mapa_riesgos(self.usuario)['inherente']['total'], 0)
+
+    def test_parametros_y_alcance(self):
+        self.assertEqual(self.pedir(fuente='otra').status_code, 400)
+        self.assertEqual(self.pedir(tipo='otro').status_code, 400)
+        self.assertEqual(self.pedir(matriz='uno').status_code, 400)
+        _, ajena = self.otro_usuario()
+        iper.crear_fila(ajena, eval_probabilidad=4, eval_severidad=4)
+        self.assertEqual(self.pedir(matriz=ajena.pk).status_code, 404)
+        self.assertEqual(self.pedir(empresa=ajena.empresa_id).status_code, 404)
+        # La cartera solo incluye las matrices propias
+        self.assertEqual(self.pedir().json()['inherente']['total'], 0)
+
+
+# --- Resumen de riesgo por matriz ---
+
+class ResumenMatrizTests(MatrizIPERTestCase):
+
+    def guardado(self, matriz):
+        return ResumenMatrizIPER.objects.filter(matriz=matriz).values(*resumen.CAMPOS_CONTEO).get()
+
+    def recontado(self, matriz):
+        """Conteo independiente, recorriendo las filas en Python."""
+        conteo = dict.fromkeys(resumen.CAMPOS_CONTEO, 0)
+        for fila in DetalleIPER.objects.filter(matriz=matriz):
+            conteo['total_filas'] += 1
+            for prefijo, clasificacion in zip(resumen.PREFIJOS, resumen.clasificaciones(fila)):
+                conteo[resumen.campo_conteo(prefijo, clasificacion)] += 1
+        return conteo
+
+    def assertResumenAlDia(self, matriz):
+        self.assertEqual(self.guardado(matriz), self.recontado(matriz))
+
+    def test_deltas_igualan_un_recuento(self):
+        a = iper.crear_fila(self.matriz, eval_probabilidad=4, eval_severidad=8)
+        self.assertResumenAlDia(self.matriz)
+        filas = iper.crear_filas(self.matriz, 3, eval_probabilidad=2, eval_severidad=2, residual_probabilidad=1)
+        self.assertResumenAlDia(self.matriz)
+
+        iper.actualizar_celda(a, 'eval_severidad', '1')
+        iper.actualizar_celda(a, 'proceso', 'Sin efecto en el resumen')
+        self.assertResumenAlDia(self.matriz)
+        iper.aplicar_ediciones(
+            [{'id': filas[0].pk, 'field': 'eval_probabilidad', 'value': '4'},
+             {'id': filas[1].pk, 'field': 'residual_severidad', 'value': '8'},
+             {'id': filas[1].pk, 'field': 'eval_severidad', 'value': 'x'}],
+            DetalleIPER.objects.filter(matriz=self.matriz),
+        )
+        self.assertResumenAlDia(self.matriz)
+
+        iper.eliminar_fila(filas[2])
+        self.assertResumenAlDia(self.matriz)
+        self.assertEqual(self.guardado(self.matriz)['total_filas'], 3)
+
+        copia = iper.clonar_matriz(self.matriz)
+        self.assertResumenAlDia(copia)
+        self.assertEqual(self.guardado(copia), self.guardado(self.matriz))
+        self.assertEqual(resumen.recalcular_matrices(MatrizIPER.objects.all()), 0)
+
+    def test_matriz_sin_resumen_se_cuenta_completa(self):
+        iper.crear_fila(self.matriz, eval_probabilidad=4, eval_severidad=4)
+        ResumenMatrizIPER.objects.all().delete()
+        iper.crear_fila(self.matriz, eval_probabilidad=1, eval_severidad=1)
+        self.assertResumenAlDia(self.matriz)
+
+    def test_recalcular_repara_desfases(self):
+        iper.crear_fila(self.matriz, eval_probabilidad=4, eval_severidad=4)
+        _, ajena = self.otro_usuario()
+        ResumenMatrizIPER.objects.filter(matriz=self.matriz).update(total_filas=9, eval_trivial=5)
+        ResumenMatrizIPER.objects.filter(matriz=ajena).delete()
+
+        salida = io.StringIO()
+        call_command('recalcular_resumen_iper', stdout=salida)
+        self.assertIn('resúmenes corregidos: 2', salida.getvalue())
+        self.assertResumenAlDia(self.matriz)
+        self.assertResumenAlDia(ajena)
+
+    def test_verificar_valoracion_corrige_filas_y_resumen(self):
+        fila = iper.crear_fila(self.matriz, eval_probabilidad=4, eval_severidad=4)
+        DetalleIPER.objects.filter(pk=fila.pk).update(eval_severidad=1)
+
+        salida = io.StringIO()
+        call_command('verificar_valoracion', '--corregir', stdout=salida)
+        self.assertIn('Filas IPER evaluadas: 1, con diferencias: 1', salida.getvalue())
+        fila.refresh_from_db()
+        self.assertEqual(fila.eval_valor, 4)
+        self.assertResumenAlDia(self.matriz)
+
+
+# --- Caché del dashboard por usuario ---
+
+class TableroCacheTests(MatrizProcesosTestCase):
+
+    def graficos(self):
+        return self.client.get(reverse('dashboard_chart_data')).json()
+
+    def test_graficos_se_invalidan_al_confirmar(self):
+        self.crear_riesgo(probabilidad_seguridad=4, consecuencia_seguridad=4)
+        self.assertEqual(self.graficos()['clasificacion_counts'], [1])
+        # Solo las consultas de la versión (riesgos y medidas)
+        with self.assertNumQueries(2):
+            tablero.datos_graficos(self.usuario)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            riesgo = self.crear_riesgo(probabilidad_seguridad=1, consecuencia_seguridad=1)
+        datos = self.graficos()
+        self.assertEqual(dict(zip(datos['clasificacion_labels'], datos['clasificacion_counts'])),
+                         {'Intolerable': 1, 'Tolerable': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MedidaControl.objects.create(riesgo=riesgo, descripcion='Uso de arnés')
+        self.assertEqual(self.graficos()['jerarquia_labels'], ['Uso de arnés'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            riesgo.delete()
+        self.assertEqual(self.graficos()['clasificacion_counts'], [1])
+
+    def test_sin_commit_no_se_borra(self):
+        tablero.datos_graficos(self.usuario)
+        with self.captureOnCommitCallbacks(execute=False):
+            self.crear_riesgo()
+        self.assertIsNotNone(cache.get(tablero.clave(self.usuario.pk, tablero.GRAFICOS)))
+
+    def test_cambios_de_otro_proceso_cambian_la_version(self):
+        riesgo = self.crear_riesgo(probabilidad_seguridad=4, consecuencia_seguridad=4)
+        self.assertEqual(tablero.datos_graficos(self.usuario)['clasificacion_labels'], ['Intolerable'])
+        self.assertEqual([e['razon_social'] for e in tablero.empresas(self.usuario)], ['ACME'])
+
+        # Sin ejecutar los on_commit: como si los cambios los hubiera hecho otro worker
+        with self.captureOnCommitCallbacks(execute=False):
+            Riesgo.objects.filter(pk=riesgo.pk).update(consecuencia_seguridad=1)
+            Riesgo.objects.filter(pk=riesgo.pk).recalcular_vep()
+            Empresa.objects.create(prevencionista=self.usuario, razon_social='Beta', rut='76.999.999-9')
+        self.assertEqual(tablero.datos_graficos(self.usuario)['clasificacion_labels'], ['Moderado'])
+        self.assertEqual([e['razon_social'] for e in tablero.empresas(self.usuario)], ['ACME', 'Beta'])
+
+    def test_traspasar_empresa_invalida_a_ambos_usuarios(self):
+        otro, _ = self.otro_usuario()
+        self.crear_riesgo(probabilidad_seguridad=4, consecuencia_seguridad=4)
+        manana = timezone.now() + timedelta(days=1)
+        visita = Visita.objects.create(empresa=self.empresa, asunto='Inspección', fecha_hora=manana)
+        for usuario in (self.usuario, otro):
+            tablero.datos_graficos(usuario)
+            tablero.proximos_eventos(usuario)
+            tablero.empresas(usuario)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.empresa.prevencionista = otro
+            self.empresa.save()
+        for usuario in (self.usuario, otro):
+            for nombre in (tablero.GRAFICOS, tablero.EVENTOS, tablero.EMPRESAS):
+                self.assertIsNone(cache.get(tablero.clave(usuario.pk, nombre)))
+
+        self.assertEqual(tablero.datos_graficos(self.usuario)['clasificacion_counts'], [])
+        self.assertEqual(tablero.proximos_eventos(self.usuario), [])
+        self.assertEqual(tablero.empresas(self.usuario), [])
+        self.assertEqual(tablero.datos_graficos(otro)['clasificacion_counts'], [1])
+        self.assertEqual([e.pk for e in tablero.proximos_eventos(otro)], [visita.pk])
+        self.assertIn('ACME', [e['razon_social'] for e in tablero.empresas(otro)])
+
+    def test_eventos_y_empresas_solo_del_usuario_afectado(self):
+        otro, _ = self.otro_usuario()
+        self.assertEqual(tablero.proximos_eventos(self.usuario), [])
+        self.assertEqual(tablero.proximos_eventos(otro), [])
+        self.assertEqual([e['razon_social'] for e in tablero.empresas(self.usuario)], ['ACME'])
+
+        manana = timezone.now() + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            visita = Visita.objects.create(empresa=self.empresa, asunto='Inspección', fecha_hora=manana)
+            Recordatorio.objects.create(prevencionista=self.usuario, titulo='Informe', fecha_hora=manana - timedelta(hours=1))
+        self.assertEqual([e.pk for e in tablero.proximos_eventos(self.usuario)][1:], [visita.pk])
+        self.assertIsNotNone(cache.get(tablero.clave(otro.pk, tablero.EVENTOS)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.empresa.razon_social = 'ACME Ltda.'
+            self.empresa.save()
+        self.assertEqual([e['razon_social'] for e in tablero.empresas(self.usuario)], ['ACME Ltda.'])
+        self.assertEqual(tablero.proximos_eventos(self.usuario)[1].empresa.razon_social, 'ACME Ltda.')
+
+
+# --- Escalas de valoración configurables ---
+
+class EscalasValoracionTests(MatrizIPERTestCase):
+
+    def crear_escala(self, nombre, umbrales, **kwargs):
+        """`umbrales`: valor mínimo de cada nivel desde INTOLERABLE; el nivel siguiente rige desde 0."""
+        escala = EscalaValoracion.objects.create(nombre=nombre, **kwargs)
+        nombres = [nombre for _, nombre, _ in valoracion.NIVELES_IPER]
+        for clasificacion, minimo in zip(nombres, [*umbrales, 0]):
+            NivelEscala.objects.create(escala=escala, clasificacion=clasificacion, valor_minimo=minimo)
+        return escala
+
+    def clasificaciones(self):
+        return list(DetalleIPER.objects.filter(matriz=self.matriz).order_by('id').values_list('eval_clasificacion', flat=True))
+
+    def test_cambiar_la_escala_recalcula_filas_y_resumen(self):
+        iper.crear_fila(self.matriz, eval_probabilidad=2, eval_severidad=2)
+        iper.crear_fila(self.matriz, eval_probabilidad=4, eval_severidad=2)
+        self.assertEqual(self.clasificaciones(), ['MODERADO', 'IMPORTANTE'])
+
+        escala = self.crear_escala('Estricta', [8, 4, 2, 1], predeterminada=True)
+        self.assertEqual(escalas.aplicar_escala(escala), 2)
+        self.assertEqual(self.clasificaciones(), ['IMPORTANTE', 'INTOLERABLE'])
+        conteo = ResumenMatrizIPER.objects.get(matriz=self.matriz)
+        self.assertEqual((conteo.eval_intolerable, conteo.eval_importante, conteo.eval_moderado), (1, 1, 0))
+        # Las filas nuevas usan la escala vigente
+        self.assertEqual(iper.crear_fila(self.matriz, eval_probabilidad=1, eval_severidad=2).eval_clasificacion, 'MODERADO')
+
+    def test_nueva_version_sin_limpiar_la_cache(self):
+        escala = self.crear_escala('Propia', [16, 8, 4, 2])
+        self.empresa.escala_valoracion = escala
+        self.empresa.save()
+        antes = escalas.tabla_de_escala(escala.pk)
+        self.assertEqual(antes.valorar(2, 4), (8, 'IMPORTANTE'))
+        with self.assertNumQueries(1):
+            self.assertEqual(escalas.tabla_de_escala(escala.pk).version, antes.version)
+
+        # Lo mismo que haría otro proceso: cambia los niveles y marca la escala, sin tocar esta caché
+        escala.niveles.filter(clasificacion='INTOLERABLE').delete()
+        escalas.aplicar_escala(escala)
+        despues = escalas.tabla_de_escala(escala.pk)
+        self.assertNotEqual(despues.version, antes.version)
+        self.assertEqual(despues.valorar(4, 4), (16, 'IMPORTANTE'))
+        self.assertEqual(escalas.tabla_de_matriz(self.matriz.pk).version, despues.version)
+
+    def test_empresa_cambia_de_escala_y_se_elimina(self):
+        fila = iper.crear_fila(self.matriz, eval_probabilidad=2, eval_severidad=1)
+        escala = self.crear_escala('Sensible', [2, 1])
+        self.empresa.escala_valoracion = escala
+        self.empresa.save()
+        escalas.aplicar_a_empresa(self.empresa)
+        self.assertEqual(self.clasificaciones(), ['INTOLERABLE'])
+
+        escalas.eliminar_escala(escala)
+        self.assertEqual(self.clasificaciones(), ['TOLERABLE'])
+        self.empresa.refresh_from_db()
+        self.assertIsNone(self.empresa.escala_valoracion)
+        fila.refresh_from_db()
+        self.assertEqual(fila.eval_valor, 2)
+
+    def test_api_tabla(self):
+        escala = self.crear_escala('Estricta', [8, 4, 2, 1], predeterminada=True)
+        datos = self.client.get(reverse('escala_valoracion_tabla')).json()
+        self.assertEqual(datos['version'], escalas.tabla_de_escala(escala.pk).version)
+
+
+# --- Migración de matrices por procesos a IPER ---
+
+class MigracionLegacyTests(MatrizProcesosTestCase):
+
+    def filas_migradas(self, migracion):
+        return DetalleIPER.objects.filter(matriz_id=migracion.matriz_iper_id).order_by('id')
+
+    def test_aplana_riesgo_con_tarea_y_medidas(self):
+        self.proceso.subproceso = 'Corte'
+        self.proceso.save()
+        self.tarea.genero_mujeres = 2
+        self.tarea.save()
+        riesgo = self.crear_riesgo(
+            probabilidad_seguridad=2, consecuencia_seguridad=1,
+            probabilidad_higienicos=4, consecuencia_higienicos=2,
+            probabilidad_residual=1, consecuencia_residual=2,
+            identificacion_gema=Riesgo.Gema.EQUIPO, nueva_medida_control='Biombo',
+        )
+        MedidaControl.objects.create(riesgo=riesgo, descripcion='Careta')
+
+        migracion = migracion_legacy.migrar_matriz(self.matriz_procesos)
+        fila = self.filas_migradas(migracion).get()
+        self.assertEqual((fila.proceso, fila.genero, fila.tarea), ('Soldadura / Corte', 'Mujer', 'Cortar planchas'))
+        self.assertEqual((fila.codigo_riesgo, fila.riesgo, fila.gema), ('S-01', 'Caída de personas', 'Equipo'))
+        self.assertEqual(fila.medida_control_actual, 'Careta\nPor implementar: Biombo')
+        # La categoría con mayor VEP da la evaluación inherente
+        self.assertEqual((fila.eval_probabilidad, fila.eval_severidad, fila.eval_valor), (4, 2, 8))
+        self.assertEqual((fila.residual_valor, fila.residual_clasificacion), (2, 'TOLERABLE'))
+        self.assertEqual(ResumenMatrizIPER.objects.get(matriz_id=migracion.matriz_iper_id).eval_importante, 1)
+        self.assertTrue(migracion.completada)
+
+    def test_reanuda_sin_duplicar_y_es_idempotente(self):
+        riesgos = [self.crear_riesgo(probabilidad_seguridad=1, consecuencia_seguridad=1) for _ in range(5)]
+
+        def cortar(migracion, filas):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            migracion_legacy.migrar_matriz(self.matriz_procesos, tamano_lote=2, al_avanzar=cortar)
+        migracion = MigracionMatrizLegacy.objects.get(matriz=self.matriz_procesos)
+        self.assertEqual((migracion.filas_migradas, migracion.ultimo_riesgo_id, migracion.completada),
+                         (2, riesgos[1].pk, False))
+
+        migracion = migracion_legacy.migrar_matriz(self.matriz_procesos, tamano_lote=2)
+        self.assertEqual(self.filas_migradas(migracion).count(), 5)
+        self.assertEqual(migracion.filas_migradas, 5)
+        self.assertEqual(migracion_legacy.migrar_matriz(self.matriz_procesos).matriz_iper_id, migracion.matriz_iper_id)
+        self.assertEqual(self.filas_migradas(migracion).count(), 5)
+
+        nueva = migracion_legacy.migrar_matriz(self.matriz_procesos, rehacer=True)
+        self.assertNotEqual(nueva.matriz_iper_id, migracion.matriz_iper_id)
+        self.assertFalse(MatrizIPER.objects.filter(pk=migracion.matriz_iper_id).exists())
+        self.assertEqual(self.filas_migradas(nueva).count(), 5)
+
+    def test_consultas_por_lote_no_dependen_de_los_riesgos(self):
+        def consultas(cantidad):
+            matriz = Matriz.objects.create(empresa=self.empresa, nombre_proyecto=f'Planta {cantidad}')
+            tarea = Tarea.objects.create(proceso=Proceso.objects.create(matriz=matriz, nombre='P'), puesto_trabajo='X', descripcion='Y')
+            for _ in range(cantidad):
+                riesgo = Riesgo.objects.create(tarea=tarea, peligro=self.peligro)
+                MedidaControl.objects.create(riesgo=riesgo, descripcion='Orden y aseo')
+            with CaptureQueriesContext(connection) as capturadas:
+                migracion_legacy.migrar_matriz(matriz)
+            return len(capturadas)
+
+        consultas(1)  # la primera migración también arma lo que queda en caché
+        self.assertEqual(consultas(2), consultas(12))
+
+    def test_comando(self):
+        self.crear_riesgo()
+        salida = io.StringIO()
+        call_command('migrar_matrices_legacy', '--empresa', self.empresa.pk, stdout=salida)
+        self.assertIn('Matrices migradas: 1', salida.getvalue())
+        self.assertTrue(MigracionMatrizLegacy.objects.get(matriz=self.matriz_procesos).completada)
+
+
+# --- Árbol de la matriz por procesos ---
+
+class ArbolMatrizTests(MatrizProcesosTestCase):
+
+    def poblar(self, tareas, riesgos_por_tarea):
+        proceso = Proceso.objects.create(matriz=self.matriz_procesos, nombre=f'Proceso {tareas}')
+        for numero in range(tareas):
+            tarea = Tarea.objects.create(proceso=proceso, puesto_trabajo='Operario', descripcion=f'Tarea {numero}')
+            for _ in range(riesgos_por_tarea):
+                riesgo = Riesgo.objects.create(tarea=tarea, peligro=self.peligro, probabilidad_seguridad=2,
+                                               consecuencia_seguridad=2)
+                MedidaControl.objects.create(riesgo=riesgo, descripcion='Capacitación')
+
+    def test_orden_y_contenido(self):
+        otro = Peligro.objects.create(familia_riesgo='Riesgos Higiénicos', riesgo_especifico='Ruido', codigo='H-01')
+        segundo = Riesgo.objects.create(tarea=self.tarea, peligro=self.peligro, probabilidad_seguridad=4,
+                                        consecuencia_seguridad=4)
+        primero = Riesgo.objects.create(tarea=self.tarea, peligro=otro)
+        MedidaControl.objects.create(riesgo=segundo, descripcion='Baranda')
+        Proceso.objects.create(matriz=self.matriz_procesos, nombre='Armado')
+
+        completo = arbol.construir_arbol(self.matriz_procesos)
+        self.assertEqual([p.nombre for p in completo.procesos], ['Armado', 'Soldadura'])
+        self.assertEqual(completo.riesgos, [primero, segundo])
+
+        datos = completo.como_dict()
+        riesgo = datos['procesos'][1]['tareas'][0]['riesgos'][1]
+        self.assertEqual(riesgo['peligro']['codigo'], 'S-01')
+        self.assertEqual((riesgo['valor_vep_inherente_maximo'], riesgo['clasificacion_riesgo_inherente_maximo']),
+                         (16, 'Intolerable'))
+        self.assertEqual(riesgo['medidas_control'], ['Baranda'])
+        self.assertEqual(datos['procesos'][0]['tareas'], [])
+
+    def test_una_consulta_por_nivel(self):
+        self.poblar(3, 4)
+        with self.assertNumQueries(4):
+            completo = arbol.construir_arbol(self.matriz_procesos)
+            completo.como_dict()
+            self.assertEqual(len(completo.riesgos), 12)
+
+    def test_api_con_consultas_constantes_y_alcance(self):
+        url = reverse('matriz_arbol_data', args=[self.matriz_procesos.pk])
+        self.poblar(1, 1)
+        with CaptureQueriesContext(connection) as chica:
+            self.client.get(url)
+        self.poblar(5, 10)
+        with CaptureQueriesContext(connection) as grande:
+            respuesta = self.client.get(url)
+        self.assertEqual(len(grande), len(chica))
+        self.assertEqual(sum(len(p['tareas']) for p in respuesta.json()['procesos']), 7)
+
+        ajena = Matriz.objects.create(empresa=self.otro_usuario()[1].empresa, nombre_proyecto='Ajena')
+        self.assertEqual(self.client.get(reverse('matriz_arbol_data', args=[ajena.pk])).status_code, 404)
+
+
+# --- Búsqueda de texto ---
+
+class BusquedaTests(MatrizIPERTestCase):
+
+    def encontrados(self, texto, **kwargs):
+        return [(d.tipo, d.objeto_id) for d, _ in busqueda.buscar(self.usuario, texto, **kwargs)]
+
+    def test_normalizacion(self):
+        self.assertEqual(busqueda.terminos('Soldaduras'), busqueda.terminos('soldar'))
+        self.assertEqual(busqueda.terminos('Caída de altura'), busqueda.terminos('caidas ALTURAS'))
+        self.assertEqual(busqueda.terminos('D.S. Eléctrico'), ['ds', 'electric'])
+
+    def test_filas_se_sincronizan_al_confirmar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            fila = iper.crear_fila(self.matriz, riesgo='Caída de altura', tarea='Soldar estructuras')
+        self.assertEqual(self.encontrados('caidas'), [('fila', fila.pk)])
+        self.assertEqual(self.encontrados('soldadura altu'), [('fila', fila.pk)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            iper.actualizar_celda(fila, 'riesgo', 'Atrapamiento')
+        self.assertEqual(self.encontrados('caida'), [])
+        self.assertEqual(self.encontrados('atrapamiento'), [('fila', fila.pk)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            iper.eliminar_fila(fila)
+        self.assertEqual(self.encontrados('atrapamiento'), [])
+
+    def test_alcance_y_relevancia(self):
+        otro, ajena = self.otro_usuario()
+        with self.captureOnCommitCallbacks(execute=True):
+            propia = iper.crear_fila(self.matriz, riesgo='Ruido', consecuencia='Hipoacusia por ruido', tarea='Esmerilar')
+            iper.crear_fila(self.matriz, riesgo='Golpes', tarea='Esmerilar')
+            iper.crear_fila(ajena, riesgo='Ruido')
+        peligro = Peligro.objects.create(familia_riesgo='Higiénicos', riesgo_especifico='Ruido', codigo='H-02')
+
+        self.assertEqual(self.encontrados('ruido'), [('fila', propia.pk), ('peligro', peligro.pk)])
+        self.assertEqual(self.encontrados('ruido', tipos=['peligro']), [('peligro', peligro.pk)])
+        self.assertEqual(len(busqueda.buscar(otro, 'ruido')), 2)
+        self.assertEqual(self.encontrados('de la'), [])
+
+        peligro.delete()
+        self.assertEqual(self.encontrados('ruido', tipos=['peligro']), [])
+
+    def test_reindexar(self):
+        fila = iper.crear_fila(self.matriz, riesgo='Exposición a polvo')
+        Normativa.objects.create(nombre='D.S. N° 594', descripcion='Condiciones sanitarias y ambientales')
+        IndiceBusqueda.objects.all().delete()
+        self.assertEqual(self.encontrados('polvo'), [])
+
+        salida = io.StringIO()
+        call_command('reindexar_busqueda', stdout=salida)
+        self.assertIn('Documentos indexados: 2', salida.getvalue())
+        self.assertEqual(self.encontrados('polvo'), [('fila', fila.pk)])
+        self.assertEqual([tipo for tipo, _ in self.encontrados('ds 594 sanitarias')], ['normativa'])
+
+    def test_api(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            fila = iper.crear_fila(self.matriz, riesgo='Caída de altura', tarea='Montaje')
+        url = reverse('buscar_data')
+        resultado = self.client.get(url, {'q': 'caida', 'empresa': self.empresa.pk}).json()['resultados']
+        self.assertEqual([(r['tipo'], r['id'], r['titulo']) for r in resultado], [('fila', fila.pk, 'Caída de altura')])
+        self.assertEqual(resultado[0]['url'], reverse('matriz_riesgos_view', args=[self.matriz.pk]))
+
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'q': 'x', 'tipo': 'otro'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'q': 'x', 'limite': 'diez'}).status_code, 400)
+        _, ajena = self.otro_usuario()
+        self.assertEqual(self.client.get(url, {'q': 'x', 'empresa': ajena.empresa_id}).status_code, 404)
+
+
+# --- Autocompletado del catálogo de peligros ---
+
+class AutocompletarPeligrosTests(MatrizIPERTestCase):
+
+    def setUp(self):
+        super().setUp()
+        crear = Peligro.objects.create
+        self.caida = crear(codigo='S-01', familia_riesgo='Riesgos de Seguridad', riesgo_especifico='Caída de personas')
+        self.golpe = crear(codigo='S-02', familia_riesgo='Riesgos de Seguridad', riesgo_especifico='Golpes con objetos')
+        self.ruido = crear(codigo='H-01', familia_riesgo='Riesgos Higiénicos', riesgo_especifico='Ruido')
+        self.sobre = crear(codigo='S-10', familia_riesgo='Riesgos de Seguridad', riesgo_especifico='Sobrecaída de carga')
+
+    def codigos(self, texto, **kwargs):
+        return [peligro['codigo'] for peligro in catalogo.autocompletar(texto, **kwargs)]
+
+    def test_orden_por_grupo(self):
+        self.assertEqual(self.codigos('s0'), ['S-01', 'S-02'])
+        self.assertEqual(self.codigos('caida'), ['S-01', 'S-10'])  # la subcadena queda al final
+        self.assertEqual(self.codigos('higienicos ru'), ['H-01'])
+        self.assertEqual(self.codigos('seguridad'), ['S-01', 'S-02', 'S-10'])
+        self.assertEqual(self.codigos('', limite=2), ['H-01', 'S-01'])
+        self.assertEqual(self.codigos('electrico'), [])
+
+    def test_se_reconstruye_al_cambiar_el_catalogo(self):
+        self.assertEqual(self.codigos('golpes'), ['S-02'])
+        # Índice vigente: solo la consulta de versión
+        with self.assertNumQueries(1):
+            self.codigos('golpes')
+
+        self.golpe.riesgo_especifico = 'Atrapamiento'
+        self.golpe.save()
+        self.assertEqual(self.codigos('golpes'), [])
+        self.assertEqual(self.codigos('atrap'), ['S-02'])
+        self.assertEqual(catalogo.etiqueta(self.golpe.pk), 'Atrapamiento (S-02)')
+
+        ruido_id = self.ruido.pk
+        self.ruido.delete()
+        self.assertEqual(self.codigos('ruido'), [])
+        self.assertEqual(catalogo.etiqueta(ruido_id), '')
+        self.assertEqual(catalogo.etiqueta('x'), '')
 
-# Create your tests here.
+    def test_api(self):
+        url = reverse('peligro_autocompletar')
+        datos = self.client.get(url, {'q': 'caida', 'limite': 1}).json()
+        self.assertEqual(datos['resultados'], [{
+            'id': self.caida.pk, 'codigo': 'S-01', 'riesgo_especifico': 'Caída de personas',
+            'familia_riesgo': 'Riesgos de Seguridad', 'texto': 'Caída de personas (S-01)',
+        }])
+        self.assertEqual(self.client.get(url, {'limite': 'todos'}).status_code, 400)
+        self.assertEqual(len(self.client.get(url, {'limite': 0}).json()['resultados']), 1)
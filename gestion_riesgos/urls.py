@@ -6,6 +6,8 @@ urlpatterns = [
     path('', views.LandingPageView.as_view(), name='landing'),
     path('dashboard/', views.DashboardView.as_view(), name='dashboard'),
     path('api/chart-data/', views.dashboard_chart_data, name='dashboard_chart_data'),
+    path('api/mapa-calor/', views.mapa_calor_data, name='mapa_calor_data'),
+    path('api/buscar/', views.buscar_data, name='buscar_data'),
 
     # --- Empresas ---
     path('empresas/', views.EmpresaListView.as_view(), name='empresa_list'), 
@@ -17,15 +19,30 @@ urlpatterns = [
     # --- GESTIÓN MATRIZ IPER (NUEVO ESTILO EXCEL) ---
     # 1. Ruta para crear (Redirige a la vista Excel)
     path('empresa/<int:empresa_pk>/matriz_iper/nueva/', views.crear_nueva_matriz_iper, name='matriz_iper_create'),
+    path('empresa/<int:empresa_pk>/matriz_iper/importar/', views.importar_matriz_iper, name='matriz_iper_import'),
     
     # 2. Vista Principal (Tabla Editable)
     path('matriz_iper/<int:matriz_id>/', views.matriz_riesgos_view, name='matriz_riesgos_view'),
+    path('matriz_iper/<int:matriz_id>/nueva-revision/', views.clonar_matriz_iper, name='matriz_iper_clone'),
+    path('matriz_iper/<int:matriz_id>/exportar/<str:formato>/', views.exportar_matriz_iper, name='matriz_iper_export'),
     
     # 3. API para guardar celdas (AJAX)
     path('api/update-iper/', views.update_detalle_iper, name='update_detalle_iper'),
+    path('api/update-iper/lote/', views.update_detalle_iper_lote, name='update_detalle_iper_lote'),
+    path('api/matriz_iper/<int:matriz_id>/filas/', views.detalle_iper_filas, name='detalle_iper_filas'),
+    path('api/matriz_iper/<int:matriz_id>/filas/nuevas/', views.crear_filas_iper, name='crear_filas_iper'),
+    path('api/matriz_iper/<int:matriz_id>/cambios/', views.detalle_iper_cambios, name='detalle_iper_cambios'),
+    path('api/matriz_iper/<int:matriz_id>/eventos/', views.eventos_matriz_iper, name='eventos_matriz_iper'),
+    path('api/matriz_iper/<int:matriz_id>/historial/', views.historial_matriz_iper, name='historial_matriz_iper'),
+    path('api/update-iper/<int:pk>/eliminar/', views.eliminar_detalle_iper, name='eliminar_detalle_iper'),
+    path('api/escala-valoracion/', views.escala_valoracion_tabla, name='escala_valoracion_tabla'),
+
+    # --- Matriz por procesos (Proceso -> Tarea -> Riesgo) ---
+    path('api/matriz/<int:pk>/arbol/', views.matriz_arbol_data, name='matriz_arbol_data'),
 
     # --- Configuración (Peligros y Normativas) ---
     path('peligros/', views.PeligroListView.as_view(), name='peligro_list'),
+    path('api/peligros/autocompletar/', views.peligro_autocompletar, name='peligro_autocompletar'),
     path('peligros/crear/', views.PeligroCreateView.as_view(), name='peligro_create'),
     path('peligros/<int:pk>/editar/', views.PeligroUpdateView.as_view(), name='peligro_update'),
     path('peligros/<int:pk>/eliminar/', views.PeligroDeleteView.as_view(), name='peligro_delete'),
@@ -0,0 +1,222 @@
+# gestion_riesgos/valoracion.py
+"""
+Escalas de valoración de riesgos.
+
+- Matriz IPER (Valor = P x S): la escala estándar que aplicaba la grilla en
+  JavaScript (calcRisk) y TablaValoracion, la forma compilada de cualquier
+  escala (también las configuradas por empresa, ver escalas.py).
+- Riesgos de la matriz por procesos (VEP = Probabilidad x Consecuencia).
+"""
+import numpy as np
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest, NullIf
+from django.db.models.lookups import GreaterThanOrEqual
+
+# (valor mínimo, clasificación, clase CSS del semáforo), de mayor a menor
+NIVELES_IPER = [
+    (16, 'INTOLERABLE', 'riesgo-intolerable'),
+    (8, 'IMPORTANTE', 'riesgo-importante'),
+    (4, 'MODERADO', 'riesgo-moderado'),
+    (2, 'TOLERABLE', 'riesgo-tolerable'),
+    (0, 'TRIVIAL', 'riesgo-trivial'),
+]
+
+CLASES_CSS = {clasificacion: css for _, clasificacion, css in NIVELES_IPER}
+
+# (fondo, texto) del semáforo de cada clasificación, iguales a las clases CSS de la grilla
+COLORES_IPER = {
+    'INTOLERABLE': ('#ef5350', '#ffffff'),
+    'IMPORTANTE': ('#ffa726', '#ffffff'),
+    'MODERADO': ('#fff176', '#333333'),
+    'TOLERABLE': ('#66bb6a', '#ffffff'),
+    'TRIVIAL': ('#a5d6a7', '#1b5e20'),
+}
+
+# Valores de P y S que ofrece la grilla
+PROBABILIDADES_IPER = (1, 2, 4)
+SEVERIDADES_IPER = (1, 2, 4, 8)
+
+
+def _factor(campo):
+    # P/S vacíos o en 0 valen 1, igual que en valorar()
+    return Case(When(**{f'{campo}__gt': 0}, then=F(campo)), default=Value(1), output_field=IntegerField())
+
+
+class TablaValoracion:
+    """
+    Escala de valoración IPER compilada: valor y clasificación precalculados
+    para cada par P x S de la grilla, más los colores de cada nivel.
+    `niveles` es una lista de (valor mínimo, clasificación, fondo, texto).
+    Un P o S vacío (o 0) se considera 1; los pares que no están en la tabla
+    (p. ej. importados con otra escala) se clasifican por umbral.
+    """
+
+    def __init__(self, niveles, version='base'):
+        self.niveles = sorted(niveles, key=lambda nivel: nivel[0], reverse=True)
+        self.version = version
+        self.tabla = {
+            (p, s): (p * s, self.clasificar(p * s))
+            for p in PROBABILIDADES_IPER for s in SEVERIDADES_IPER
+        }
+
+    def clasificar(self, valor):
+        for minimo, clasificacion, _, _ in self.niveles:
+            if valor >= minimo:
+                return clasificacion
+        return self.niveles[-1][1]
+
+    def valorar(self, probabilidad, severidad):
+        """Devuelve (valor, clasificación) para un par P/S."""
+        p = probabilidad if probabilidad and probabilidad > 0 else 1
+        s = severidad if severidad and severidad > 0 else 1
+        resultado = self.tabla.get((p, s))
+        if resultado is None:
+            resultado = (p * s, self.clasificar(p * s))
+        return resultado
+
+    def valorar_arrays(self, probabilidades, severidades):
+        """Versión vectorizada de valorar() para arreglos NumPy. Devuelve (valores, clasificaciones)."""
+        p = np.asarray(probabilidades, dtype=float)
+        s = np.asarray(severidades, dtype=float)
+        p = np.where(np.isnan(p) | (p <= 0), 1, p)
+        s = np.where(np.isnan(s) | (s <= 0), 1, s)
+        valores = (p * s).astype(int)
+        condiciones = [valores >= minimo for minimo, _, _, _ in self.niveles[:-1]]
+        nombres = [nombre for _, nombre, _, _ in self.niveles[:-1]]
+        clasificaciones = np.select(condiciones, nombres, default=self.niveles[-1][1])
+        return valores, clasificaciones
+
+    def expresiones_valoracion(self, campo_p, campo_s, campo_valor, campo_clasificacion):
+        """
+        Devuelve los kwargs para queryset.update() que recalculan valor y
+        clasificación en un único UPDATE ... CASE, sin traer filas a Python.
+        """
+        valor = _factor(campo_p) * _factor(campo_s)
+        clasificacion = Case(
+            *[When(GreaterThanOrEqual(valor, minimo), then=Value(nombre)) for minimo, nombre, _, _ in self.niveles[:-1]],
+            default=Value(self.niveles[-1][1]),
+        )
+        return {campo_valor: valor, campo_clasificacion: clasificacion}
+
+    def como_dict(self):
+        """Tabla en JSON para la grilla: {tabla: {p: {s: [valor, clasificación]}}, colores, niveles}."""
+        tabla = {}
+        for (p, s), resultado in self.tabla.items():
+            tabla.setdefault(p, {})[s] = list(resultado)
+        return {
+            'version': self.version,
+            'niveles': [{'minimo': minimo, 'clasificacion': nombre} for minimo, nombre, _, _ in self.niveles],
+            'colores': {nombre: {'fondo': fondo, 'texto': texto} for _, nombre, fondo, texto in self.niveles},
+            'tabla': tabla,
+        }
+
+
+# Escala estándar (la que aplicaba calcRisk en la grilla); rige si no hay otra configurada
+TABLA_IPER = TablaValoracion([(minimo, nombre, *COLORES_IPER[nombre]) for minimo, nombre, _ in NIVELES_IPER])
+
+
+def valorar(probabilidad, severidad):
+    """
+    Devuelve (valor, clasificación) para un par P/S con la escala estándar.
+    Igual que la grilla, un P o S vacío (o 0) se considera 1.
+    """
+    return TABLA_IPER.valorar(probabilidad, severidad)
+
+
+def clasificar(valor):
+    return TABLA_IPER.clasificar(valor)
+
+
+def clase_css(clasificacion):
+    return CLASES_CSS.get(clasificacion, '')
+
+
+def valorar_arrays(probabilidades, severidades):
+    """
+    Versión vectorizada de valorar() para arreglos NumPy (importaciones masivas).
+    Devuelve (valores, clasificaciones) alineados con la entrada.
+    """
+    return TABLA_IPER.valorar_arrays(probabilidades, severidades)
+
+
+# --- EXPRESIONES SQL PARA RECÁLCULO MASIVO ---
+
+def expresiones_valoracion(campo_p, campo_s, campo_valor, campo_clasificacion):
+    """
+    Devuelve los kwargs para queryset.update() que recalculan valor y
+    clasificación con la escala estándar en un único UPDATE.
+    """
+    return TABLA_IPER.expresiones_valoracion(campo_p, campo_s, campo_valor, campo_clasificacion)
+
+
+# --- VEP DE LOS RIESGOS (Matriz por procesos) ---
+
+# (VEP mínimo, clasificación), de mayor a menor. P y C valen 1, 2 o 4 (máximo 16)
+NIVELES_VEP = [
+    (9, 'Intolerable'),   # 16
+    (5, 'Importante'),    # 8
+    (3, 'Moderado'),      # 4
+    (0, 'Tolerable'),     # 2, 1
+]
+SIN_EVALUAR = 'No evaluado'
+
+
+def calcular_vep(probabilidad, consecuencia):
+    """VEP = P x C; None si falta alguno de los dos."""
+    if probabilidad and consecuencia:
+        return probabilidad * consecuencia
+    return None
+
+
+def clasificar_vep(vep):
+    if vep is None:
+        return SIN_EVALUAR
+    for minimo, clasificacion in NIVELES_VEP:
+        if vep >= minimo:
+            return clasificacion
+    return NIVELES_VEP[-1][1]
+
+
+def vep_arrays(probabilidades, consecuencias):
+    """
+    Versión vectorizada de calcular_vep(): arreglo float con NaN donde falta
+    P o C (NaN hace el papel de None).
+    """
+    p = np.asarray(probabilidades, dtype=float)
+    c = np.asarray(consecuencias, dtype=float)
+    validos = (p > 0) & (c > 0)  # NaN > 0 es False
+    return np.where(validos, p * c, np.nan)
+
+
+def clasificar_vep_arrays(veps):
+    """Versión vectorizada de clasificar_vep()."""
+    veps = np.asarray(veps, dtype=float)
+    condiciones = [~np.isnan(veps) & (veps >= minimo) for minimo, _ in NIVELES_VEP]
+    nombres = [nombre for _, nombre in NIVELES_VEP]
+    return np.select(condiciones, nombres, default=SIN_EVALUAR)
+
+
+def expresion_vep(campo_p, campo_c):
+    """Equivalente SQL de calcular_vep()."""
+    return Case(
+        When(Q(**{f'{campo_p}__gt': 0}) & Q(**{f'{campo_c}__gt': 0}), then=F(campo_p) * F(campo_c)),
+        default=Value(None),
+        output_field=IntegerField(),
+    )
+
+
+def expresion_vep_maximo(*expresiones):
+    """
+    Mayor VEP entre las expresiones ignorando las vacías (GREATEST trata NULL
+    distinto en SQLite y PostgreSQL, por eso se compara con 0 y se vuelve a NULL).
+    """
+    return NullIf(Greatest(*[Coalesce(e, Value(0)) for e in expresiones]), Value(0))
+
+
+def expresion_clasificacion_vep(vep):
+    """Equivalente SQL de clasificar_vep() sobre una expresión de VEP."""
+    # Con VEP NULL ninguna condición se cumple y queda "No evaluado"
+    return Case(
+        *[When(GreaterThanOrEqual(vep, minimo), then=Value(nombre)) for minimo, nombre in NIVELES_VEP],
+        default=Value(SIN_EVALUAR),
+    )
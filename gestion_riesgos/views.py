@@ -1,9 +1,9 @@
 # gestion_riesgos/views.py
 from django.http import JsonResponse
-from django.db.models import Count
+from django.db.models import F, Sum
 from django.utils import timezone
-from itertools import chain
-from operator import attrgetter
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time
 
 from django.views.generic import TemplateView
 from django.shortcuts import get_object_or_404
@@ -11,13 +11,26 @@ from django.urls import reverse_lazy, reverse
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin
 
-from agenda.models import Visita, Recordatorio
-from .models import Empresa, Matriz, MedidaControl, Normativa, Proceso, Tarea, Riesgo, Documento, Peligro, MatrizIPER, DetalleIPER
-from .forms import EmpresaForm, MatrizForm, ProcesoForm, TareaForm, RiesgoForm, DocumentoForm, PeligroForm, RiesgoEvaluarForm, MatrizIPERForm
+from .models import Empresa, Matriz, MedidaControl, Normativa, Proceso, Tarea, Riesgo, Documento, Peligro, MatrizIPER, DetalleIPER, IndiceBusqueda
+from .forms import EmpresaForm, MatrizForm, ProcesoForm, TareaForm, RiesgoForm, DocumentoForm, PeligroForm, RiesgoEvaluarForm, MatrizIPERForm, ImportarIPERForm
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
-from django.views.decorators.csrf import csrf_exempt
+from django.template.loader import render_to_string
+from django.http import JsonResponse, StreamingHttpResponse, FileResponse, Http404, HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.text import slugify
+from django.views.decorators.http import require_POST, condition
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
 import json
+
+from .importacion import importar_iper, ErrorImportacion
+from .exportacion import generar_csv, generar_xlsx
+from .arbol import construir_arbol
+from . import busqueda, catalogo, difusion, escalas, historial, mapa_calor, resumen, tablero
+from .iper import (
+    aplicar_ediciones, crear_fila, crear_filas, actualizar_celda, clonar_matriz, eliminar_fila, campos_proyeccion,
+    pagina_filas, cambios_desde, MAX_EDICIONES_POR_LOTE, LIMITE_FILAS_DEFECTO, LIMITE_FILAS_MAXIMO,
+)
 # --- LANDING PAGE ---
 class LandingPageView(TemplateView):
     template_name = 'landing.html'
@@ -29,65 +42,131 @@ class DashboardView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        
-        # Obtenemos la fecha y hora actual
-        now = timezone.now()
-        
-        # Buscamos los próximos eventos
-        proximas_visitas = Visita.objects.filter(
-            empresa__prevencionista=self.request.user,
-            fecha_hora__gte=now
-        ).order_by('fecha_hora')
-        
-        proximos_recordatorios = Recordatorio.objects.filter(
-            prevencionista=self.request.user,
-            fecha_hora__gte=now
-        ).order_by('fecha_hora')
-        
-        # Combinamos y ordenamos todos los eventos en una sola lista
-        eventos_combinados = sorted(
-            list(chain(proximas_visitas, proximos_recordatorios)),
-            key=attrgetter('fecha_hora')
-        )
-        
-        # Pasamos los 4 eventos más próximos a la plantilla
-        context['proximos_eventos'] = eventos_combinados[:4]
-        
+        # Próximos eventos (visitas y recordatorios) y empresas del filtro del
+        # mapa de calor, desde la caché del usuario (ver tablero.py)
+        context['proximos_eventos'] = tablero.proximos_eventos(self.request.user)
+        context['empresas'] = tablero.empresas(self.request.user)
         return context
 
+@login_required
 def dashboard_chart_data(request):
     """
     Proporciona los datos en formato JSON para los gráficos del dashboard de riesgos.
     """
-    user = request.user
-    
-    # Datos para el gráfico de Clasificación de Riesgos
-    clasificacion_data = Riesgo.objects.filter(tarea__proceso__matriz__empresa__prevencionista=user)\
-        .values('clasificacion_riesgo_inherente_maximo')\
-        .annotate(count=Count('id'))\
-        .order_by('clasificacion_riesgo_inherente_maximo')
-
-    # Datos para el gráfico de Jerarquía de Controles (esto es un ejemplo, ajústalo a tu modelo MedidaControl si tienes un campo de tipo)
-    # Suponiendo que tu modelo MedidaControl tiene un campo 'jerarquia'
-    # Si no lo tienes, puedes adaptarlo o simplemente devolver datos de ejemplo por ahora.
-    jerarquia_data = MedidaControl.objects.filter(riesgo__tarea__proceso__matriz__empresa__prevencionista=user)\
-        .values('descripcion')\
-        .annotate(count=Count('id'))\
-        .order_by('-count')[:5] # Top 5 como ejemplo
-
-    data = {
-        'clasificacion_labels': [item['clasificacion_riesgo_inherente_maximo'] for item in clasificacion_data],
-        'clasificacion_counts': [item['count'] for item in clasificacion_data],
-        'jerarquia_labels': [item['descripcion'] for item in jerarquia_data], # Ajustar a tu campo real
-        'jerarquia_counts': [item['count'] for item in jerarquia_data],
-    }
-    return JsonResponse(data)
+    return JsonResponse(tablero.datos_graficos(request.user))
+
+@login_required
+def mapa_calor_data(request):
+    """
+    Mapa de calor P x S en JSON para el dashboard.
+    ?fuente=iper (por defecto) o riesgos; ?empresa= y ?matriz= acotan el
+    alcance (sin ellos, toda la cartera); ?tipo=inherente|residual (ambos por defecto).
+    """
+    fuente = request.GET.get('fuente', 'iper')
+    if fuente not in ('iper', 'riesgos'):
+        return JsonResponse({'status': 'error', 'message': 'Fuente inválida.'}, status=400)
+    tipos = mapa_calor.TIPOS
+    if request.GET.get('tipo'):
+        if request.GET['tipo'] not in mapa_calor.TIPOS:
+            return JsonResponse({'status': 'error', 'message': 'Tipo inválido.'}, status=400)
+        tipos = (request.GET['tipo'],)
+
+    for param in ('empresa', 'matriz'):
+        if request.GET.get(param) and not request.GET[param].isdigit():
+            return JsonResponse({'status': 'error', 'message': 'Parámetros de alcance inválidos.'}, status=400)
+    empresa_id = matriz_id = None
+    if request.GET.get('empresa'):
+        empresa_id = get_object_or_404(Empresa, pk=request.GET['empresa'], prevencionista=request.user).pk
+    if request.GET.get('matriz'):
+        modelo_matriz = MatrizIPER if fuente == 'iper' else Matriz
+        matriz_id = get_object_or_404(modelo_matriz, pk=request.GET['matriz'], empresa__prevencionista=request.user).pk
+
+    calcular = mapa_calor.mapa_iper if fuente == 'iper' else mapa_calor.mapa_riesgos
+    mapa = calcular(request.user, empresa_id=empresa_id, matriz_id=matriz_id)
+    return JsonResponse({
+        'fuente': fuente,
+        'empresa_id': empresa_id,
+        'matriz_id': matriz_id,
+        'probabilidades': mapa_calor.EJES[fuente][0],
+        'severidades': mapa_calor.EJES[fuente][1],
+        **{tipo: mapa[tipo] for tipo in tipos},
+    })
+
+def _url_resultado(documento):
+    if documento.tipo == IndiceBusqueda.FILA:
+        return reverse('matriz_riesgos_view', args=[documento.matriz_id])
+    if documento.tipo == IndiceBusqueda.PELIGRO:
+        return reverse('peligro_update', args=[documento.objeto_id])
+    return reverse('normativa_update', args=[documento.objeto_id])
+
+@login_required
+def buscar_data(request):
+    """
+    Búsqueda de texto en filas IPER (solo de las empresas del usuario),
+    peligros y normativa, ordenada por relevancia.
+    ?q= (obligatorio); ?tipo=fila|peligro|normativa (repetible); ?empresa=; ?limite=
+    """
+    texto = request.GET.get('q', '').strip()
+    if not texto:
+        return JsonResponse({'status': 'error', 'message': 'Falta el texto a buscar (q).'}, status=400)
+    tipos = request.GET.getlist('tipo')
+    if any(tipo not in dict(IndiceBusqueda.TIPO_CHOICES) for tipo in tipos):
+        return JsonResponse({'status': 'error', 'message': 'Tipo inválido.'}, status=400)
+    try:
+        limite = min(int(request.GET.get('limite', busqueda.LIMITE_DEFECTO)), busqueda.LIMITE_MAXIMO)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Límite inválido.'}, status=400)
+    empresa_id = None
+    if request.GET.get('empresa'):
+        if not request.GET['empresa'].isdigit():
+            return JsonResponse({'status': 'error', 'message': 'Empresa inválida.'}, status=400)
+        empresa_id = get_object_or_404(Empresa, pk=request.GET['empresa'], prevencionista=request.user).pk
+
+    resultados = busqueda.buscar(request.user, texto, tipos=tipos, empresa_id=empresa_id, limite=max(limite, 1))
+    return JsonResponse({
+        'q': texto,
+        'resultados': [{
+            'tipo': documento.tipo,
+            'id': documento.objeto_id,
+            'titulo': documento.titulo,
+            'extracto': documento.extracto,
+            'matriz': str(documento.matriz) if documento.matriz_id else None,
+            'url': _url_resultado(documento),
+            'rango': round(rango, 4),
+        } for documento, rango in resultados],
+    })
+
+@login_required
+def peligro_autocompletar(request):
+    """
+    Peligros del catálogo cuyo código, riesgo específico o familia coinciden
+    con lo escrito (?q=), para el autocompletado. Sin ?q= devuelve los
+    primeros por código. ?limite= (máx. catalogo.LIMITE_MAXIMO).
+    """
+    try:
+        limite = min(int(request.GET.get('limite', catalogo.LIMITE_DEFECTO)), catalogo.LIMITE_MAXIMO)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Límite inválido.'}, status=400)
+    texto = request.GET.get('q', '').strip()
+    return JsonResponse({
+        'q': texto,
+        'resultados': [
+            {campo: peligro[campo] for campo in ('id', 'codigo', 'riesgo_especifico', 'familia_riesgo', 'texto')}
+            for peligro in catalogo.autocompletar(texto, max(limite, 1))
+        ],
+    })
+
 class EmpresaListView(LoginRequiredMixin, ListView):
     model = Empresa
     template_name = 'empresa_list.html'
     context_object_name = 'empresas'
     def get_queryset(self):
-        return Empresa.objects.filter(prevencionista=self.request.user).order_by('razon_social')
+        # Totales IPER de cada empresa desde los resúmenes: un JOIN por matriz, sin leer filas
+        return Empresa.objects.filter(prevencionista=self.request.user).annotate(
+            iper_filas=Sum('matriziper__resumen__total_filas'),
+            iper_intolerables=Sum('matriziper__resumen__eval_intolerable'),
+            iper_importantes=Sum('matriziper__resumen__eval_importante'),
+        ).order_by('razon_social')
 
 class EmpresaDetailView(LoginRequiredMixin, DetailView):
     model = Empresa
@@ -95,6 +174,10 @@ class EmpresaDetailView(LoginRequiredMixin, DetailView):
     context_object_name = 'empresa'
     def get_queryset(self):
         return Empresa.objects.filter(prevencionista=self.request.user)
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['matrices_iper'] = self.object.matriziper_set.select_related('resumen')
+        return context
 
 class EmpresaCreateView(LoginRequiredMixin, CreateView):
     model = Empresa
@@ -116,6 +199,12 @@ class EmpresaUpdateView(LoginRequiredMixin, UpdateView):
     template_name = 'gestion/generic_form.html'
     def get_queryset(self):
         return Empresa.objects.filter(prevencionista=self.request.user)
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        if 'escala_valoracion' in form.changed_data:
+            # Las filas de sus matrices se reclasifican con la nueva escala
+            escalas.aplicar_a_empresa(self.object)
+        return response
     def get_success_url(self):
         return reverse('empresa_detail', kwargs={'pk': self.object.pk})
 
@@ -157,43 +246,275 @@ def matriz_riesgos_view(request, matriz_id=None):
     return render(request, 'matriz_riesgos.html', {
         'matriz': matriz,
         'form': form,
-        'filas': filas
+        'filas': filas,
+        # Versión de la escala de la empresa: la grilla la pide por URL versionada
+        'escala_version': escalas.tabla_de_empresa(matriz.empresa).version,
     })
 
-@csrf_exempt
+@login_required
+@require_POST
 def update_detalle_iper(request):
     """
     API para actualizar celdas individuales del DetalleIPER.
     """
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            row_id = data.get('id')
-            field = data.get('field')
-            value = data.get('value')
-
-            # Si el ID es 'new', creamos una fila nueva
-            if row_id == 'new':
-                matriz_id = data.get('matriz_id')
-                matriz = MatrizIPER.objects.get(pk=matriz_id)
-                detalle = DetalleIPER.objects.create(matriz=matriz)
-                # Actualizamos el campo que se editó al crear
-                if hasattr(detalle, field):
-                    setattr(detalle, field, value)
-                    detalle.save()
-                return JsonResponse({'status': 'created', 'id': detalle.id})
-            
-            # Actualizar fila existente
-            detalle = DetalleIPER.objects.get(pk=row_id)
-            if hasattr(detalle, field):
-                setattr(detalle, field, value)
-                detalle.save()
-                return JsonResponse({'status': 'ok'})
-            
-        except Exception as e:
-            return JsonResponse({'status': 'error', 'message': str(e)})
-            
-    return JsonResponse({'status': 'error'}, status=400)
+    try:
+        data = json.loads(request.body)
+        row_id = data.get('id')
+        field = data.get('field')
+        value = data.get('value')
+    except (ValueError, AttributeError):
+        return JsonResponse({'status': 'error', 'message': 'JSON inválido.'}, status=400)
+
+    if not isinstance(field, str):
+        return JsonResponse({'status': 'error', 'message': 'Campo inválido.'}, status=400)
+
+    try:
+        # Si el ID es 'new', creamos una fila nueva
+        if row_id == 'new':
+            matriz = MatrizIPER.objects.get(pk=int(data.get('matriz_id')), empresa__prevencionista=request.user)
+            # Asignamos el campo que se editó al crear
+            detalle = crear_fila(matriz, usuario=request.user, **{field: value})
+            return JsonResponse({'status': 'created', 'id': detalle.id, 'revision': detalle.revision})
+
+        # Actualizar fila existente (solo la columna editada)
+        fila = DetalleIPER.objects.get(pk=int(row_id), matriz__empresa__prevencionista=request.user)
+        detalle = actualizar_celda(fila, field, value, usuario=request.user)
+        return JsonResponse({'status': 'ok', 'revision': detalle.revision})
+    except (TypeError, ValueError):
+        return JsonResponse({'status': 'error', 'message': 'Identificador inválido.'}, status=400)
+    except (MatrizIPER.DoesNotExist, DetalleIPER.DoesNotExist):
+        return JsonResponse({'status': 'error', 'message': 'Fila o matriz no encontrada.'}, status=404)
+    except ValidationError as e:
+        return JsonResponse({'status': 'error', 'message': ' '.join(e.messages)}, status=400)
+
+@login_required
+@require_POST
+def update_detalle_iper_lote(request):
+    """
+    API para guardar un lote de celdas del DetalleIPER en una sola petición.
+    Recibe {"ediciones": [{id, field, value}, ...]} y devuelve el estado de cada edición.
+    """
+    try:
+        data = json.loads(request.body)
+        ediciones = data.get('ediciones')
+    except (ValueError, AttributeError):
+        return JsonResponse({'status': 'error', 'message': 'JSON inválido.'}, status=400)
+
+    if not isinstance(ediciones, list) or not ediciones:
+        return JsonResponse({'status': 'error', 'message': 'Se esperaba una lista de ediciones.'}, status=400)
+    if len(ediciones) > MAX_EDICIONES_POR_LOTE:
+        return JsonResponse({'status': 'error', 'message': f'Máximo {MAX_EDICIONES_POR_LOTE} ediciones por lote.'}, status=400)
+
+    filas = DetalleIPER.objects.filter(matriz__empresa__prevencionista=request.user)
+    resultados = aplicar_ediciones(ediciones, filas, usuario=request.user)
+    return JsonResponse({'status': 'ok', 'resultados': resultados})
+
+@login_required
+def detalle_iper_filas(request, matriz_id):
+    """
+    API de lectura de filas para la grilla con scroll virtual.
+    Parámetros GET: after (último id recibido), limit y fields (columnas separadas por coma).
+    """
+    matriz = get_object_or_404(MatrizIPER, pk=matriz_id, empresa__prevencionista=request.user)
+    try:
+        despues_de = int(request.GET.get('after', 0))
+        limite = min(max(int(request.GET.get('limit', LIMITE_FILAS_DEFECTO)), 1), LIMITE_FILAS_MAXIMO)
+        campos = campos_proyeccion(request.GET.get('fields'))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Parámetros de paginación inválidos.'}, status=400)
+    except ValidationError as e:
+        return JsonResponse({'status': 'error', 'message': ' '.join(e.messages)}, status=400)
+
+    data = pagina_filas(matriz.filas.all(), campos, despues_de, limite)
+    data['total'] = matriz.filas.count()
+    data['matriz_id'] = matriz.id
+    # Revisión leída antes que las filas: punto de partida para la sincronización
+    data['revision'] = matriz.revision
+    return JsonResponse(data)
+
+def _etag_cambios_iper(request, matriz_id):
+    revision = MatrizIPER.objects.filter(
+        pk=matriz_id, empresa__prevencionista=request.user
+    ).values_list('revision', flat=True).first()
+    if revision is None:
+        return None
+    return f"iper-{matriz_id}-{revision}-{request.GET.get('desde', '0')}-{request.GET.get('fields', '')}"
+
+@login_required
+@condition(etag_func=_etag_cambios_iper)
+def detalle_iper_cambios(request, matriz_id):
+    """
+    API de sincronización incremental: filas insertadas/modificadas y eliminadas
+    desde la revisión `desde`. Responde 304 si el cliente ya tiene esta versión.
+    """
+    matriz = get_object_or_404(MatrizIPER, pk=matriz_id, empresa__prevencionista=request.user)
+    try:
+        desde = int(request.GET.get('desde', 0))
+        campos = campos_proyeccion(request.GET.get('fields'))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Revisión inválida.'}, status=400)
+    except ValidationError as e:
+        return JsonResponse({'status': 'error', 'message': ' '.join(e.messages)}, status=400)
+
+    data = cambios_desde(matriz, desde, campos)
+    data['desde'] = desde
+    data['revision'] = matriz.revision
+    return JsonResponse(data)
+
+@login_required
+@require_POST
+def crear_filas_iper(request, matriz_id):
+    """
+    API para agregar filas a la matriz sin recargar la página.
+    Recibe {"cantidad": N, "valores": {campo: valor}} y devuelve los ids y el HTML de las filas.
+    """
+    matriz = get_object_or_404(MatrizIPER, pk=matriz_id, empresa__prevencionista=request.user)
+    try:
+        data = json.loads(request.body or '{}')
+        cantidad = int(data.get('cantidad', 1))
+        valores = data.get('valores') or {}
+        if not isinstance(valores, dict):
+            raise ValueError
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'status': 'error', 'message': 'Parámetros inválidos.'}, status=400)
+
+    try:
+        filas = crear_filas(matriz, cantidad, usuario=request.user, **valores)
+    except ValidationError as e:
+        return JsonResponse({'status': 'error', 'message': ' '.join(e.messages)}, status=400)
+
+    html = ''.join(
+        render_to_string('partials/fila_iper.html', {'fila': fila}, request=request) for fila in filas
+    )
+    return JsonResponse({
+        'status': 'created',
+        'ids': [fila.id for fila in filas],
+        'revision': filas[0].revision,
+        'html': html,
+    })
+
+@login_required
+async def eventos_matriz_iper(request, matriz_id):
+    """
+    Canal SSE (Server-Sent Events) de la matriz: empuja a la grilla las filas
+    cambiadas por otros usuarios apenas se confirman. Requiere servidor ASGI.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Bajo WSGI no se mantienen conexiones abiertas; 204 le indica al
+        # navegador que no reintente y la grilla sigue con el polling de cambios
+        return HttpResponse(status=204)
+
+    usuario = await request.auser()
+    revision = await MatrizIPER.objects.filter(
+        pk=matriz_id, empresa__prevencionista=usuario
+    ).values_list('revision', flat=True).afirst()
+    if revision is None:
+        raise Http404("Matriz no encontrada.")
+    try:
+        desde = int(request.headers.get('Last-Event-ID') or request.GET.get('desde') or revision)
+    except ValueError:
+        desde = revision
+
+    response = StreamingHttpResponse(difusion.flujo_eventos(matriz_id, desde), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+def historial_matriz_iper(request, matriz_id):
+    """
+    API de auditoría de la matriz IPER.
+    Con ?fecha=AAAA-MM-DD[THH:MM] devuelve las filas tal como estaban en ese momento;
+    sin fecha, lista las ediciones registradas (paginadas con after/limit, opcionalmente ?fila=).
+    """
+    matriz = get_object_or_404(MatrizIPER, pk=matriz_id, empresa__prevencionista=request.user)
+
+    if request.GET.get('fecha'):
+        fecha = parse_datetime(request.GET['fecha'])
+        if fecha is None:
+            dia = parse_date(request.GET['fecha'])
+            if dia is None:
+                return JsonResponse({'status': 'error', 'message': 'Fecha inválida.'}, status=400)
+            # Una fecha sin hora se refiere al estado al final de ese día
+            fecha = datetime.combine(dia, time.max)
+        if timezone.is_naive(fecha):
+            fecha = timezone.make_aware(fecha)
+        filas = historial.reconstruir(matriz, fecha)
+        if filas is None:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'No hay historial registrado para esa fecha.',
+            }, status=404)
+        return JsonResponse({'matriz_id': matriz.id, 'fecha': fecha.isoformat(), 'count': len(filas), 'filas': filas})
+
+    try:
+        despues_de = int(request.GET.get('after', 0))
+        limite = min(max(int(request.GET.get('limit', LIMITE_FILAS_DEFECTO)), 1), LIMITE_FILAS_MAXIMO)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Parámetros de paginación inválidos.'}, status=400)
+    cambios = matriz.cambios.all()
+    if request.GET.get('fila', '').isdigit():
+        cambios = cambios.filter(fila_id=int(request.GET['fila']))
+    data = pagina_filas(
+        cambios.annotate(usuario_nombre=F('usuario__username')),
+        ['id', 'fila_id', 'tipo', 'campo', 'valor_anterior', 'valor_nuevo', 'usuario_nombre', 'fecha', 'revision'],
+        despues_de, limite,
+    )
+    data['cambios'] = data.pop('filas')
+    return JsonResponse(data)
+
+def _escala_pedida(request):
+    escala = request.GET.get('escala', '')
+    return int(escala) if escala.isdigit() else None
+
+def _etag_escala(request):
+    return f"escala-{escalas.tabla_de_escala(_escala_pedida(request)).version}"
+
+@login_required
+@condition(etag_func=_etag_escala)
+def escala_valoracion_tabla(request):
+    """
+    Escala de valoración compilada (tabla P x S -> valor y clasificación, y colores)
+    para la grilla. ?escala= (vacío = la predeterminada); la URL lleva la versión
+    (?v=), así que el navegador puede guardarla mientras la escala no cambie.
+    """
+    response = JsonResponse(escalas.tabla_de_escala(_escala_pedida(request)).como_dict())
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+@login_required
+@require_POST
+def eliminar_detalle_iper(request, pk):
+    """API para eliminar una fila de la matriz IPER."""
+    detalle = get_object_or_404(DetalleIPER, pk=pk, matriz__empresa__prevencionista=request.user)
+    eliminar_fila(detalle, usuario=request.user)
+    return JsonResponse({'status': 'deleted', 'id': pk})
+
+@login_required
+def exportar_matriz_iper(request, matriz_id, formato):
+    """
+    Descarga la matriz IPER completa (encabezado + filas) en CSV o Excel.
+    Las filas se leen por bloques, así el consumo de memoria no depende del tamaño de la matriz.
+    """
+    matriz = get_object_or_404(
+        MatrizIPER.objects.select_related('empresa'), pk=matriz_id, empresa__prevencionista=request.user
+    )
+    url_logo = request.build_absolute_uri(matriz.logo_cliente.url) if matriz.logo_cliente else None
+    nombre = slugify(f"{matriz.codigo_documento or 'IPER'} v{matriz.version or ''}") or 'matriz-iper'
+
+    if formato == 'csv':
+        response = StreamingHttpResponse(generar_csv(matriz, url_logo), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{nombre}.csv"'
+        return response
+    if formato == 'xlsx':
+        return FileResponse(
+            generar_xlsx(matriz, url_logo),
+            as_attachment=True,
+            filename=f"{nombre}.xlsx",
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+    raise Http404("Formato de exportación no soportado.")
+
 class MatrizCreateView(LoginRequiredMixin, CreateView):
     model = Matriz
     form_class = MatrizForm
@@ -222,38 +543,89 @@ def crear_nueva_matriz_iper(request, empresa_pk):
         codigo_documento="IPER-001",
         version="1.0"
     )
+    historial.tomar_snapshot(nueva_matriz.pk, nueva_matriz.revision)
+    resumen.crear(nueva_matriz.pk)
     # Redirigir a la vista de edición tipo Excel
     return redirect('matriz_riesgos_view', matriz_id=nueva_matriz.id)
+@login_required
+@require_POST
+def clonar_matriz_iper(request, matriz_id):
+    """
+    Crea una nueva revisión de la matriz (versión siguiente) con todas sus filas
+    y redirige a la vista de edición de la copia.
+    """
+    matriz = get_object_or_404(MatrizIPER, pk=matriz_id, empresa__prevencionista=request.user)
+    nueva = clonar_matriz(matriz)
+    return redirect('matriz_riesgos_view', matriz_id=nueva.id)
+
+@login_required
+def importar_matriz_iper(request, empresa_pk):
+    """
+    Crea una matriz IPER a partir de la planilla Excel/CSV del cliente.
+    """
+    empresa = get_object_or_404(Empresa, pk=empresa_pk, prevencionista=request.user)
+    if request.method == 'POST':
+        form = ImportarIPERForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                resultado = importar_iper(
+                    form.cleaned_data['archivo'],
+                    empresa,
+                    omitir_errores=form.cleaned_data['omitir_errores'],
+                    codigo_documento=form.cleaned_data['codigo_documento'] or "IPER-001",
+                    proyecto=form.cleaned_data['proyecto'] or None,
+                )
+            except ErrorImportacion as e:
+                return render(request, 'import_error.html', {
+                    'empresa': empresa,
+                    'error': str(e),
+                    'errores': e.errores[:200],
+                    'total_errores': len(e.errores),
+                }, status=400)
+            return render(request, 'import_success.html', {
+                'empresa': empresa,
+                'matriz': resultado['matriz'],
+                'filas_importadas': resultado['filas_importadas'],
+                'errores': resultado['errores'][:200],
+                'total_errores': len(resultado['errores']),
+                'ignoradas': resultado['ignoradas'],
+            })
+    else:
+        form = ImportarIPERForm()
+
+    return render(request, 'gestion/generic_form.html', {
+        'form': form,
+        'titulo': f"Importar Matriz IPER para {empresa.razon_social}",
+        'boton_texto': "Importar Planilla",
+    })
 class MatrizDetailView(LoginRequiredMixin, DetailView):
     model = Matriz
     template_name = 'matriz_detail.html' # Esta plantilla la vamos a reemplazar
     context_object_name = 'matriz'
 
     def get_queryset(self):
-        return Matriz.objects.filter(empresa__prevencionista=self.request.user)
+        return Matriz.objects.filter(empresa__prevencionista=self.request.user).select_related('empresa')
 
     def get_context_data(self, **kwargs):
         """
-        Prepara la vista de tabla plana.
+        Prepara la vista de tabla plana con el árbol de la matriz ya cargado
+        (consultas constantes, sin importar la cantidad de riesgos).
         """
         context = super().get_context_data(**kwargs)
-        matriz = self.get_object()
-        
-        # Obtenemos todos los riesgos de esta matriz, ordenados por Proceso y Tarea
-        # Usamos select_related y prefetch_related para optimizar la consulta
-        context['riesgos'] = Riesgo.objects.filter(
-            tarea__proceso__matriz=matriz
-        ).select_related(
-            'tarea__proceso', 
-            'peligro'
-        ).prefetch_related(
-            'medidas_control'
-        ).order_by('tarea__proceso__nombre', 'tarea__descripcion', 'peligro__codigo')
-        
-        # Dejamos los procesos para los botones de "Añadir"
-        context['procesos'] = matriz.procesos.all().prefetch_related('tareas')
-        
+        arbol = construir_arbol(self.object)
+        context['arbol'] = arbol
+        # Riesgos ordenados por Proceso, Tarea y código de peligro
+        context['riesgos'] = arbol.riesgos
+        # Procesos (con sus tareas) para los botones de "Añadir"
+        context['procesos'] = arbol.procesos
         return context
+
+@login_required
+def matriz_arbol_data(request, pk):
+    """Árbol completo de una matriz por procesos (procesos, tareas, riesgos con VEP y medidas) en JSON."""
+    matriz = get_object_or_404(Matriz, pk=pk, empresa__prevencionista=request.user)
+    return JsonResponse(construir_arbol(matriz).como_dict())
+
 class MatrizDeleteView(LoginRequiredMixin, DeleteView):
     model = Matriz
     template_name = 'gestion/confirm_delete.html'
@@ -411,6 +783,7 @@ class PeligroListView(LoginRequiredMixin, ListView):
     template_name = 'peligro_list.html'
     context_object_name = 'peligros'
     ordering = ['familia_riesgo', 'codigo']
+    paginate_by = 50
 
 class PeligroCreateView(LoginRequiredMixin, CreateView):
     model = Peligro
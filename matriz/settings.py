@@ -90,6 +90,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'matriz.wsgi.application'
+# En producción se sirve por ASGI (uvicorn) para el canal en vivo de la matriz IPER
+ASGI_APPLICATION = 'matriz.asgi.application'
 
 # 5. Base de Datos (Conexión Universal)
 DATABASE_URL_VALUE = config('DATABASE_URL', default=None)
@@ -97,7 +99,8 @@ DATABASE_URL_VALUE = config('DATABASE_URL', default=None)
 if DATABASE_URL_VALUE:
     _db_config = dj_database_url.parse(
         DATABASE_URL_VALUE,
-        conn_max_age=600,
+        # Bajo ASGI Django recomienda no reutilizar conexiones entre peticiones
+        conn_max_age=config('DB_CONN_MAX_AGE', default=0, cast=int),
         # TRUCO: Permitimos SSL siempre si estamos conectando a Railway, 
         # incluso en local, para evitar rechazos de conexión.
         ssl_require=True 
@@ -137,11 +140,23 @@ STATICFILES_DIRS = [
 
 # WhiteNoise para servir archivos estáticos
 # En desarrollo (DEBUG=True), usar el storage por defecto de Django
-# En producción (DEBUG=False), usar WhiteNoise con compresión
-if DEBUG:
-    STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
-else:
-    STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# En producción (DEBUG=False), usar WhiteNoise con compresión: collectstatic
+# deja cada archivo con el hash de su contenido en el nombre (WhiteNoise lo
+# sirve con caché de un año, immutable) y sus versiones .gz y .br (con Brotli
+# instalado), que se entregan según el Accept-Encoding del navegador.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+# Modelos 3D (reporte flash): sin esto se servirían como application/octet-stream
+WHITENOISE_MIMETYPES = {'.glb': 'model/gltf-binary'}
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -149,4 +164,33 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_REDIRECT_URL = '/dashboard/'
-LOGOUT_REDIRECT_URL = '/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/'
+
+# Caché (dashboard por usuario, mapas de calor). Por defecto en la memoria de
+# cada proceso; con CACHE_LOCATION (un directorio) se usa el backend de archivos,
+# compartido por todos los workers del servidor, así una invalidación llega a todos.
+CACHE_LOCATION = config('CACHE_LOCATION', default='')
+CACHES = {
+    'default': {
+        'BACKEND': (
+            'django.core.cache.backends.filebased.FileBasedCache' if CACHE_LOCATION
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': CACHE_LOCATION or 'matriz-default',
+        'TIMEOUT': config('CACHE_TIMEOUT', default=900, cast=int),
+    }
+}
+
+# Broker de la difusión en vivo de la matriz IPER (ver gestion_riesgos/difusion.py).
+# El local entrega los cambios dentro del mismo proceso del servidor; lo guardado
+# en otros workers llega por el polling espaciado que la grilla mantiene igual.
+IPER_BROKER = config('IPER_BROKER', default='gestion_riesgos.difusion.BrokerLocal')
+
+# Fotos de evidencia de accidentes (ver accidentes/evidencias.py): se procesan en
+# un hilo de fondo del servidor. Si se apaga, las procesa un worker aparte con
+# `python manage.py procesar_evidencias --continuo`.
+EVIDENCIAS_EN_SEGUNDO_PLANO = config('EVIDENCIAS_EN_SEGUNDO_PLANO', default=True, cast=bool)
+
+# Adjuntos de accidentes a medio subir (ver accidentes/adjuntos.py). Fuera de
+# MEDIA_ROOT: un archivo incompleto o sin verificar no se sirve nunca.
+ADJUNTOS_PARCIALES_DIR = config('ADJUNTOS_PARCIALES_DIR', default=str(BASE_DIR / 'subidas_parciales'))